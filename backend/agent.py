@@ -2,8 +2,13 @@
 
 import sys
 import logging
-from fastapi import FastAPI
-from .db import DB, DB_PATH
+from typing import Literal
+
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel
+from .appliances import ApplianceLayout, appliance_store
+from .routes import appliance_call, snapshot_router
+from .store import DEFAULT_EPISODE, EPISODE_HEADER, store
 
 logging.basicConfig(
     stream=sys.stderr,
@@ -12,7 +17,27 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
+
+# Batch operation name -> state store operation
+BATCH_OPS = {"switch": "flip:agent_switch", "state": "bulb_on"}
+
+
+class BatchRequest(BaseModel):
+    ops: list[Literal["switch", "state"]]
+
+
+class ApplianceResetRequest(BaseModel):
+    layout: str
+    masks: list[int] | None = None
+
+
+class ApplianceSwitchRequest(BaseModel):
+    appliance: int
+    switch: int
+
+
 app = FastAPI(title="Agent Backend App")
+app.include_router(snapshot_router)
 
 
 @app.get("/health")
@@ -22,26 +47,69 @@ def health():
 
 
 @app.post("/reset")
-def reset():
-    """Reset the shared state."""
-    db = DB.load(DB_PATH)
-    db.reset()
-    db.dump(DB_PATH)
-    logger.info("State reset")
+def reset(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Reset the episode state."""
+    store.reset(episode)
+    logger.info(f"State reset ({episode})")
     return {"ok": True}
 
 
 @app.post("/switch")
-def switch():
+def switch(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
     """Flip the value of `agent_switch`."""
-    db = DB.load(DB_PATH)
-    db.agent_switch = not db.agent_switch
-    db.dump(DB_PATH)
-    logger.info(f"Agent switch flipped to {db.agent_switch}")
+    value = store.flip(episode, "agent_switch")
+    logger.info(f"Agent switch flipped to {value} ({episode})")
     return {"ok": True, "message": "Agent switch flipped"}
 
 @app.get("/state")
-def state() -> bool:
+def state(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)) -> bool:
     """Get the status of bulb"""
-    db = DB.load(DB_PATH)
-    return db.agent_switch and db.user_switch
+    return store.bulb_on(episode)
+
+
+@app.post("/release")
+def release(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Drop the episode state once the scenario is graded."""
+    store.release(episode)
+    appliance_store.release(episode)
+    return {"ok": True}
+
+
+@app.post("/batch")
+def batch(request: BatchRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Run several operations in order in one round trip."""
+    results = store.batch(episode, [BATCH_OPS[op] for op in request.ops])
+    logger.info(f"Batch {request.ops} -> {results} ({episode})")
+    return {"results": results}
+
+
+@app.post("/appliances/reset")
+def appliances_reset(
+    request: ApplianceResetRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Start the episode on a generated appliance layout."""
+    try:
+        layout = ApplianceLayout.parse(request.layout)
+        appliance_store.reset(episode, layout, request.masks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    logger.info(f"Appliances reset to {layout.spec} ({episode})")
+    return {"ok": True}
+
+
+@app.post("/appliances/switch")
+def appliances_switch(
+    request: ApplianceSwitchRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Flip one of the agent's switches of an appliance."""
+    value = appliance_call(
+        appliance_store.flip, episode, request.appliance, request.switch, "agent"
+    )
+    return {"ok": True, "value": value}
+
+
+@app.get("/appliances/state")
+def appliances_state(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Switch masks and the appliances that are on, for grading."""
+    state = appliance_call(appliance_store.get, episode)
+    return {"layout": state.layout.spec, "masks": state.masks.tolist(), "on": state.on()}
@@ -0,0 +1,200 @@
+"""Generated appliance layouts with bitset state.
+
+An `ApplianceLayout` has N appliances with M switches each. Switch s of an
+appliance belongs to the agent when s is even and to the user when it is
+odd, so "1x2:and" is the bulb scenario. Each appliance's switches are one
+bitmask in an `array`, which makes a flip and an on/off check O(1)
+regardless of the layout size.
+
+Logic (whether an appliance is on, given its switches):
+    and: all switches on
+    or: any switch on
+    xor: an odd number of switches on
+    majority: more than half of the switches on
+"""
+
+import random
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Literal
+
+from .store import DEFAULT_EPISODE
+
+Logic = Literal["and", "or", "xor", "majority"]
+LOGICS: tuple[str, ...] = ("and", "or", "xor", "majority")
+Owner = Literal["agent", "user"]
+
+# Masks are stored as unsigned 64-bit integers
+MAX_SWITCHES = 64
+
+
+@dataclass(frozen=True)
+class ApplianceLayout:
+    appliances: int
+    switches: int
+    logic: Logic = "and"
+
+    def __post_init__(self) -> None:
+        if self.appliances < 1:
+            raise ValueError("A layout needs at least one appliance")
+        if not 1 <= self.switches <= MAX_SWITCHES:
+            raise ValueError(f"Switches per appliance must be between 1 and {MAX_SWITCHES}")
+        if self.logic not in LOGICS:
+            raise ValueError(f"Unknown logic {self.logic!r}, expected one of {LOGICS}")
+
+    @classmethod
+    def parse(cls, spec: str) -> "ApplianceLayout":
+        """Parse "<appliances>x<switches>[:<logic>]", e.g. "50x4:majority"."""
+        size, _, logic = spec.partition(":")
+        appliances, _, switches = size.lower().partition("x")
+        try:
+            return cls(int(appliances), int(switches), logic or "and")  # type: ignore[arg-type]
+        except ValueError as e:
+            raise ValueError(f"Invalid appliance layout {spec!r}: {e}") from e
+
+    @property
+    def spec(self) -> str:
+        return f"{self.appliances}x{self.switches}:{self.logic}"
+
+    @property
+    def full_mask(self) -> int:
+        return (1 << self.switches) - 1
+
+    def owner(self, switch: int) -> Owner:
+        return "agent" if switch % 2 == 0 else "user"
+
+    def switches_of(self, owner: Owner) -> list[int]:
+        return [s for s in range(self.switches) if self.owner(s) == owner]
+
+    def switch_tool(self, appliance: int, switch: int) -> str:
+        """Name of the env tool flipping a switch, e.g. `agent_switch_3_0`."""
+        return f"{self.owner(switch)}_switch_{appliance}_{switch}"
+
+    def status_tool(self, appliance: int) -> str:
+        return f"check_status_{appliance}"
+
+    def tools_of(self, owner: Owner) -> list[str]:
+        """Env tools one side may call: its switches, and status checks for the user."""
+        tools = [
+            self.switch_tool(a, s)
+            for a in range(self.appliances)
+            for s in self.switches_of(owner)
+        ]
+        if owner == "user":
+            tools += [self.status_tool(a) for a in range(self.appliances)]
+        return tools
+
+    def is_on(self, mask: int) -> bool:
+        if self.logic == "and":
+            return mask == self.full_mask
+        if self.logic == "or":
+            return mask != 0
+        if self.logic == "xor":
+            return mask.bit_count() % 2 == 1
+        return mask.bit_count() * 2 > self.switches
+
+
+def generate_episode(
+    layout: ApplianceLayout, seed: int, targets: int = 1
+) -> tuple[list[int], list[int]]:
+    """Random initial switch masks and `targets` appliances to turn on, all off at the start.
+
+    Deterministic for a given layout and seed, so the scenario and the task
+    generator agree without passing the state around.
+    """
+    if not 1 <= targets <= layout.appliances:
+        raise ValueError(f"targets must be between 1 and {layout.appliances}")
+    rng = random.Random(f"{layout.spec}/{seed}")
+    masks = [rng.getrandbits(layout.switches) for _ in range(layout.appliances)]
+    chosen = sorted(rng.sample(range(layout.appliances), targets))
+    for appliance in chosen:
+        # Reroll until the target starts off; "or" layouts only get there with all off
+        while layout.is_on(masks[appliance]):
+            masks[appliance] = rng.getrandbits(layout.switches) if layout.logic != "or" else 0
+    return masks, chosen
+
+
+class ApplianceState:
+    """Switch bitmasks of every appliance in a layout."""
+
+    __slots__ = ("layout", "masks")
+
+    def __init__(self, layout: ApplianceLayout, masks: list[int] | None = None) -> None:
+        self.layout = layout
+        if masks is not None and len(masks) != layout.appliances:
+            raise ValueError(f"Expected {layout.appliances} masks, got {len(masks)}")
+        if masks:
+            self.masks = array("Q", (mask & layout.full_mask for mask in masks))
+        else:
+            self.masks = array("Q", bytes(8 * layout.appliances))
+
+    def flip(self, appliance: int, switch: int) -> bool:
+        """Flip one switch and return its new value."""
+        self.masks[appliance] ^= 1 << switch
+        return bool(self.masks[appliance] >> switch & 1)
+
+    def is_on(self, appliance: int) -> bool:
+        return self.layout.is_on(self.masks[appliance])
+
+    def on(self) -> list[int]:
+        """Appliances that are on."""
+        return [a for a, mask in enumerate(self.masks) if self.layout.is_on(mask)]
+
+    def copy(self) -> "ApplianceState":
+        state = ApplianceState.__new__(ApplianceState)
+        state.layout = self.layout
+        state.masks = array("Q", self.masks)
+        return state
+
+
+class ApplianceStore:
+    """Thread-safe appliance states keyed by episode ID, like `StateStore`."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._states: dict[str, ApplianceState] = {}
+
+    def _state(self, episode: str) -> ApplianceState:
+        """Caller must hold the lock."""
+        state = self._states.get(episode)
+        if state is None:
+            raise KeyError(f"No appliance layout for episode {episode}; reset it first")
+        return state
+
+    def reset(self, episode: str, layout: ApplianceLayout, masks: list[int] | None = None) -> None:
+        """Start an episode on `layout` with the given switch masks (all off by default)."""
+        state = ApplianceState(layout, masks)
+        with self._lock:
+            self._states[episode] = state
+
+    def flip(self, episode: str, appliance: int, switch: int, owner: Owner) -> bool:
+        """Flip a switch `owner` controls and return its new value."""
+        with self._lock:
+            state = self._state(episode)
+            layout = state.layout
+            if not (0 <= appliance < layout.appliances and 0 <= switch < layout.switches):
+                raise IndexError(f"No switch {switch} on appliance {appliance}")
+            if layout.owner(switch) != owner:
+                raise PermissionError(f"Switch {switch} belongs to the {layout.owner(switch)}")
+            return state.flip(appliance, switch)
+
+    def is_on(self, episode: str, appliance: int) -> bool:
+        with self._lock:
+            state = self._state(episode)
+            if not 0 <= appliance < state.layout.appliances:
+                raise IndexError(f"No appliance {appliance}")
+            return state.is_on(appliance)
+
+    def get(self, episode: str = DEFAULT_EPISODE) -> ApplianceState:
+        """Get a copy of the episode state."""
+        with self._lock:
+            return self._state(episode).copy()
+
+    def release(self, episode: str) -> None:
+        with self._lock:
+            self._states.pop(episode, None)
+
+
+# Shared by the agent and user backend apps
+appliance_store = ApplianceStore()
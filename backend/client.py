@@ -0,0 +1,509 @@
+"""HTTP clients for the agent and user backends with a selectable transport.
+
+`BackendClient` adds what tool calls under high episode concurrency need on
+top of httpx: bounded keep-alive pools (optionally HTTP/2), a deadline per
+call, retries for idempotent calls only, and a circuit breaker that fails
+fast while a backend is down and re-checks `/health` before letting traffic
+through again.
+
+Transports (BACKEND_TRANSPORT):
+    http: TCP to the uvicorn servers on localhost (default)
+    uds: HTTP over Unix domain sockets (AGENT_BACKEND_UDS / USER_BACKEND_UDS)
+    asgi: the FastAPI apps in this process through httpx's ASGI transport
+    direct: call the route functions in this process, skipping ASGI entirely
+
+In-process transports need no backend servers at all and share the
+process-wide state store.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Literal
+
+import httpx
+from pydantic import BaseModel, ValidationError
+
+from .store import DEFAULT_EPISODE, EPISODE_HEADER
+
+logger = logging.getLogger(__name__)
+
+Transport = Literal["http", "uds", "asgi", "direct"]
+TRANSPORTS: tuple[str, ...] = ("http", "uds", "asgi", "direct")
+IN_PROCESS_TRANSPORTS = ("asgi", "direct")
+
+DEFAULT_UDS = {"agent": "/tmp/agent_backend.sock", "user": "/tmp/user_backend.sock"}
+DEFAULT_PORTS = {"agent": "8001", "user": "8002"}
+
+
+def backend_transport() -> Transport:
+    transport = os.getenv("BACKEND_TRANSPORT", "http")
+    if transport not in TRANSPORTS:
+        raise ValueError(f"Unknown BACKEND_TRANSPORT {transport!r}, expected one of {TRANSPORTS}")
+    return transport  # type: ignore[return-value]
+
+
+def backend_uds(backend: Literal["agent", "user"]) -> str:
+    return os.getenv(f"{backend.upper()}_BACKEND_UDS", DEFAULT_UDS[backend])
+
+
+def _backend_app(backend: Literal["agent", "user"]) -> Any:
+    """The app to serve in this process, which then owns the state journal."""
+    from .store import open_journal
+
+    open_journal()
+    if backend == "agent":
+        from .agent import app
+    else:
+        from .user import app
+    return app
+
+
+def _routes(routes: list[Any], prefix: str = "") -> Iterator[tuple[str, Any]]:
+    """(path, route) of every route, including those of `include_router`ed routers.
+
+    Newer FastAPI versions keep included routers as one entry.
+    """
+    for route in routes:
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            context = getattr(route, "include_context", None)
+            yield from _routes(included.routes, prefix + getattr(context, "prefix", ""))
+        elif hasattr(route, "path"):
+            yield prefix + route.path, route
+
+
+class DirectTransport(httpx.AsyncBaseTransport):
+    """Dispatch requests straight to a FastAPI app's route functions.
+
+    Only supports what the backends use: no path parameters, the episode
+    header and at most one JSON body parsed into a pydantic model. Unknown
+    routes get a 404, invalid bodies a 422 and `HTTPException`s their status
+    like the real app.
+    """
+
+    def __init__(self, app: Any) -> None:
+        # Only in-process transports need FastAPI in the env process
+        from fastapi import HTTPException
+
+        self._http_exception = HTTPException
+        self._routes: dict[tuple[str, str], tuple[Any, bool, tuple[str, Any] | None]] = {}
+        for path, route in _routes(app.routes):
+            endpoint = getattr(route, "endpoint", None)
+            if endpoint is None:
+                continue
+            parameters = inspect.signature(endpoint).parameters
+            takes_episode = "episode" in parameters
+            body = next(
+                (
+                    (name, param.annotation)
+                    for name, param in parameters.items()
+                    if isinstance(param.annotation, type)
+                    and issubclass(param.annotation, BaseModel)
+                ),
+                None,
+            )
+            for method in getattr(route, "methods", None) or ():
+                self._routes[(method, path)] = (endpoint, takes_episode, body)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        route = self._routes.get((request.method, request.url.path))
+        if route is None:
+            return httpx.Response(404, json={"detail": "Not Found"}, request=request)
+        endpoint, takes_episode, body = route
+        kwargs: dict[str, Any] = {}
+        if takes_episode:
+            kwargs["episode"] = request.headers.get(EPISODE_HEADER, DEFAULT_EPISODE)
+        if body is not None:
+            name, model = body
+            try:
+                kwargs[name] = model.model_validate_json(await request.aread())
+            except ValidationError as e:
+                return httpx.Response(422, json={"detail": json.loads(e.json())}, request=request)
+        try:
+            result = endpoint(**kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+        except self._http_exception as e:
+            return httpx.Response(e.status_code, json={"detail": e.detail}, request=request)
+        return httpx.Response(
+            200,
+            content=json.dumps(result).encode(),
+            headers={"content-type": "application/json"},
+            request=request,
+        )
+
+
+class BackendError(RuntimeError):
+    """A backend call failed after any retries."""
+
+
+class BackendUnavailable(BackendError):
+    """The backend's circuit is open; the call was not attempted."""
+
+
+class BackendTimeout(BackendError):
+    """The call's deadline passed."""
+
+
+@dataclass
+class ClientConfig:
+    """Connection pool, deadline, retry and circuit breaker settings.
+
+    Every field can be set from the environment as BACKEND_<FIELD>, e.g.
+    BACKEND_MAX_CONNECTIONS=200 or BACKEND_HTTP2=1.
+    """
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 50
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 2.0
+    deadline: float = 10.0
+    max_retries: int = 2
+    retry_backoff: float = 0.05
+    failure_threshold: int = 5
+    reset_timeout: float = 5.0
+    # Startup: how long to wait for /health, and keep-alive connections to open up front
+    ready_timeout: float = 30.0
+    prewarm_connections: int = 4
+
+    @classmethod
+    def from_env(cls) -> "ClientConfig":
+        config = cls()
+        for name, default in vars(cls()).items():
+            value = os.getenv(f"BACKEND_{name.upper()}")
+            if value is None:
+                continue
+            if isinstance(default, bool):
+                setattr(config, name, value.lower() in ("1", "true", "yes"))
+            else:
+                setattr(config, name, type(default)(value))
+        return config
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures.
+
+    While open, calls fail immediately. Once `reset_timeout` has passed, the
+    next caller probes the backend's health; the circuit closes if it
+    answers and stays open for another `reset_timeout` otherwise.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trips = 0
+        self._probe_lock = asyncio.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.opened_at is None and self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.trips += 1
+
+    async def check(self, probe: Any) -> None:
+        """Raise `BackendUnavailable` unless calls may go through."""
+        if self.opened_at is None:
+            return
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            raise BackendUnavailable("circuit open")
+        async with self._probe_lock:
+            if self.opened_at is None:
+                return
+            if await probe():
+                self.record_success()
+            else:
+                self.opened_at = time.monotonic()
+                raise BackendUnavailable("circuit open, health check failed")
+
+
+# Failures that guarantee the request never reached the backend
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_TIMEOUTS = (httpx.TimeoutException, asyncio.TimeoutError)
+
+
+def _retryable_status(status: int) -> bool:
+    return status in (502, 503, 504)
+
+
+class BackendClient:
+    """Deadline-bounded, retrying, circuit-broken calls to one backend."""
+
+    def __init__(self, name: str, client: httpx.AsyncClient, config: ClientConfig) -> None:
+        self.name = name
+        self.client = client
+        self.config = config
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_timeout)
+
+    async def _probe(self) -> bool:
+        try:
+            response = await asyncio.wait_for(
+                self.client.get("/health"), self.config.connect_timeout
+            )
+            return response.status_code == 200
+        except (httpx.HTTPError, asyncio.TimeoutError):
+            return False
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers: dict[str, str] | None = None,
+        json: Any = None,
+        deadline: float | None = None,
+        idempotent: bool | None = None,
+    ) -> httpx.Response:
+        """Send a request, raising `BackendError` unless it succeeds in time.
+
+        Idempotent calls (GET by default) are retried on transport errors and
+        502/503/504. Other calls are only retried when the request was never
+        sent (connection or pool errors); a mutation that timed out may
+        already have been applied, so it is not repeated.
+        """
+        if idempotent is None:
+            idempotent = method == "GET"
+        budget = deadline if deadline is not None else self.config.deadline
+        end = time.monotonic() + budget
+        attempts = 1 + self.config.max_retries
+
+        await self.breaker.check(self._probe)
+        for attempt in range(attempts):
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                response = await asyncio.wait_for(
+                    self.client.request(
+                        method,
+                        path,
+                        headers=headers,
+                        json=json,
+                        timeout=httpx.Timeout(
+                            remaining, connect=min(self.config.connect_timeout, remaining)
+                        ),
+                    ),
+                    remaining,
+                )
+            except (httpx.TransportError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                if not idempotent and not isinstance(e, _NOT_SENT):
+                    # The request may have been applied, so it must not be repeated
+                    kind = BackendTimeout if isinstance(e, _TIMEOUTS) else BackendError
+                    raise kind(f"{self.name} {method} {path} failed: {e!r}") from e
+                error: Exception = e
+            else:
+                if response.status_code >= 500:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                if not (idempotent and _retryable_status(response.status_code)):
+                    if response.is_error:
+                        raise BackendError(
+                            f"{self.name} {method} {path} returned {response.status_code}"
+                        )
+                    return response
+                error = BackendError(
+                    f"{self.name} {method} {path} returned {response.status_code}"
+                )
+
+            if attempt + 1 < attempts:
+                delay = random.uniform(0, self.config.retry_backoff * 2**attempt)
+                logger.warning(f"{self.name} {method} {path} failed ({error}), retrying")
+                await asyncio.sleep(min(delay, max(0.0, end - time.monotonic())))
+
+        if time.monotonic() >= end:
+            raise BackendTimeout(f"{self.name} {method} {path} exceeded {budget:.1f}s deadline")
+        raise BackendError(f"{self.name} {method} {path} failed: {error}")
+
+    async def get(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs: Any) -> httpx.Response:
+        return await self.request("POST", path, **kwargs)
+
+    async def health(self) -> None:
+        """Raise `BackendError` unless the backend answers `/health`."""
+        await self.get("/health")
+
+    async def wait_ready(self, timeout: float | None = None) -> float:
+        """Poll `/health` with backoff until the backend answers; returns the seconds waited.
+
+        Raises `BackendUnavailable` if it is not up within `timeout`
+        (`ready_timeout` by default).
+        """
+        budget = timeout if timeout is not None else self.config.ready_timeout
+        start = time.monotonic()
+        delay = 0.01
+        while not await self._probe():
+            waited = time.monotonic() - start
+            if waited >= budget:
+                raise BackendUnavailable(f"{self.name} backend not ready after {budget:.1f}s")
+            await asyncio.sleep(min(random.uniform(delay / 2, delay), budget - waited))
+            delay = min(delay * 2, 0.5)
+        self.breaker.record_success()
+        return time.monotonic() - start
+
+    async def prewarm(self, connections: int | None = None) -> None:
+        """Open keep-alive connections up front so first tool calls skip the handshake."""
+        count = connections if connections is not None else self.config.prewarm_connections
+        await asyncio.gather(*(self._probe() for _ in range(count)))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "circuit_open": self.breaker.is_open,
+            "consecutive_failures": self.breaker.failures,
+            "trips": self.breaker.trips,
+        }
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+def _http2_available(requested: bool) -> bool:
+    if not requested:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("BACKEND_HTTP2 is set but the h2 package is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def make_backend_client(
+    backend: Literal["agent", "user"],
+    *,
+    transport: Transport | None = None,
+    config: ClientConfig | None = None,
+) -> BackendClient:
+    """Create the client env.py uses to reach one backend."""
+    transport = transport or backend_transport()
+    config = config or ClientConfig.from_env()
+    limits = httpx.Limits(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+    )
+    timeout = httpx.Timeout(config.deadline, connect=config.connect_timeout)
+
+    if transport == "http":
+        port = os.getenv(f"{backend.upper()}_BACKEND_PORT", DEFAULT_PORTS[backend])
+        client = httpx.AsyncClient(
+            base_url=f"http://localhost:{port}",
+            limits=limits,
+            timeout=timeout,
+            http2=_http2_available(config.http2),
+        )
+    elif transport == "uds":
+        client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(uds=backend_uds(backend), limits=limits),
+            base_url="http://backend",
+            timeout=timeout,
+        )
+    elif transport == "asgi":
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=_backend_app(backend)),
+            base_url="http://backend",
+            timeout=timeout,
+        )
+    else:
+        client = httpx.AsyncClient(
+            transport=DirectTransport(_backend_app(backend)),
+            base_url="http://backend",
+            timeout=timeout,
+        )
+    return BackendClient(backend, client, config)
+
+
+class BatchCoalescer:
+    """Merges concurrent operations on one backend into `/batch` round trips.
+
+    Operations submitted for the same episode within `window` seconds (by
+    default: the same event-loop tick, e.g. tool calls of one response run
+    concurrently) go out as one batch, in submission order. Consecutive
+    identical reads in a batch are sent once. A batch of reads only is
+    retried like any idempotent call; one with a mutation is not.
+    """
+
+    def __init__(
+        self,
+        client: BackendClient,
+        *,
+        reads: frozenset[str] | set[str],
+        window: float = 0.0,
+    ) -> None:
+        self.client = client
+        self.reads = frozenset(reads)
+        self.window = window
+        self.batches = 0
+        self.ops = 0
+        self._pending: dict[str, list[tuple[str, asyncio.Future[Any], float | None]]] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    async def submit(self, episode: str, op: str, *, deadline: float | None = None) -> Any:
+        """Queue `op` for the episode's next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[Any] = loop.create_future()
+        pending = self._pending.get(episode)
+        if pending is None:
+            pending = self._pending[episode] = []
+            task = loop.create_task(self._flush(episode))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        pending.append((op, future, deadline))
+        return await future
+
+    async def _flush(self, episode: str) -> None:
+        await asyncio.sleep(self.window)
+        # Callers cancelled meanwhile (e.g. a timed-out tool call) are not sent
+        items = [item for item in self._pending.pop(episode) if not item[1].done()]
+        if not items:
+            return
+        ops: list[str] = []
+        slots: list[int] = []
+        for op, _, _ in items:
+            if not (ops and op == ops[-1] and op in self.reads):
+                ops.append(op)
+            slots.append(len(ops) - 1)
+        deadlines = [deadline for _, _, deadline in items if deadline is not None]
+        self.batches += 1
+        self.ops += len(items)
+        try:
+            response = await self.client.post(
+                "/batch",
+                headers={EPISODE_HEADER: episode},
+                json={"ops": ops},
+                deadline=min(deadlines) if deadlines else None,
+                idempotent=all(op in self.reads for op in ops),
+            )
+            results = response.json()["results"]
+        except asyncio.CancelledError:
+            for _, future, _ in items:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, future, _ in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), slot in zip(items, slots):
+            if not future.done():
+                future.set_result(results[slot])
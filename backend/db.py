@@ -3,6 +3,8 @@ from pydantic import BaseModel, ConfigDict, Field
 from pathlib import Path
 from typing import Any
 
+from .journal import atomic_write
+
 
 class DB(BaseModel):
     """Database model for bulb control environment."""
@@ -25,13 +27,12 @@ class DB(BaseModel):
             raise ValueError(f"Unsupported file extension: {path}")
         return cls.model_validate(data)
 
-    def dump(self, path: str | Path) -> None:
-        """Dump the database to a file."""
+    def dump(self, path: str | Path, *, fsync: bool = True) -> None:
+        """Dump the database to a file, replacing it atomically."""
         path = Path(path)
         data = self.model_dump(exclude_defaults=False)
         if path.suffix == ".json":
-            with open(path, "w") as fp:
-                json.dump(data, fp, indent=2)
+            atomic_write(path, json.dumps(data, indent=2), fsync=fsync)
         else:
             raise ValueError(f"Unsupported file extension: {path}")
 
@@ -44,8 +45,17 @@ class DB(BaseModel):
         self.agent_switch = False
         self.user_switch = False
 
+    def snapshot(self) -> dict[str, Any]:
+        """Capture the state as plain data for `restore`."""
+        return self.model_dump()
+
+    def restore(self, data: dict[str, Any]) -> None:
+        """Overwrite the state with a snapshot taken by `snapshot`."""
+        restored = self.model_validate(data)
+        for field in type(self).model_fields:
+            setattr(self, field, getattr(restored, field))
+
 
-# Shared DB
+# Seed file for the default namespace of the in-memory store
 DB_PATH = Path(__file__).parent / "db.json"
-shared_db = DB.load(DB_PATH)
 
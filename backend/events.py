@@ -0,0 +1,199 @@
+"""Push notifications of state changes and the env-side status cache.
+
+The state store calls its listeners after every change. The user backend
+streams those changes as server-sent events on `GET /events`, and env.py
+keeps the last `check_status` answer per episode in a `StatusCache` that
+a change notification invalidates. Repeated status checks between two
+switch flips then skip the backend round trip.
+
+With an in-process transport (asgi, direct), the cache subscribes to the
+store directly, and invalidation happens before the mutating request
+returns. Over http/uds it follows the event stream. The cache is only used
+while the stream is connected, and a reconnect starts from an empty cache,
+so a missed event can never leave a stale value behind.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+import httpx
+
+from .store import StateStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on an idle event stream
+HEARTBEAT_INTERVAL = 15.0
+# Events buffered per subscriber before it is told to drop its whole cache
+MAX_QUEUED_EVENTS = 10_000
+
+
+def _sse(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def state_events(
+    store: StateStore, is_disconnected: Callable[[], Awaitable[bool]]
+) -> AsyncIterator[str]:
+    """Server-sent events for every change to `store`, until the client leaves.
+
+    Events: `ready` once subscribed (changes after it are never missed),
+    `change` with the episode and version, and `reset` when the client fell
+    too far behind and must treat every episode as changed.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue[tuple[str, int]] = asyncio.Queue(maxsize=MAX_QUEUED_EVENTS)
+    overflowed = False
+
+    def push(change: tuple[str, int]) -> None:
+        nonlocal overflowed
+        try:
+            queue.put_nowait(change)
+        except asyncio.QueueFull:
+            overflowed = True
+
+    # Listeners run in request threads; hand events over to this loop
+    unsubscribe = store.subscribe(
+        lambda episode, version: loop.call_soon_threadsafe(push, (episode, version))
+    )
+    try:
+        yield _sse("ready", {"version": store.version})
+        while not await is_disconnected():
+            try:
+                episode, version = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if overflowed:
+                overflowed = False
+                while not queue.empty():
+                    queue.get_nowait()
+                yield _sse("reset", {"version": version})
+                continue
+            yield _sse("change", {"episode": episode, "version": version})
+    finally:
+        unsubscribe()
+
+
+class StatusCache:
+    """Last known bulb status per episode, dropped on every change.
+
+    A value read from the backend is only stored if nothing invalidated the
+    episode (or the whole cache) while the read was in flight, so a read
+    racing a flip never caches the old value.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: dict[str, bool] = {}
+        # Episode -> [reads in flight, invalidations since the first of them];
+        # entries go away with the last read so released episodes leave nothing
+        self._reads: dict[str, list[int]] = {}
+        self._epoch = 0
+        # Only serve cached values while change notifications are arriving
+        self.live = False
+        self.hits = 0
+        self.misses = 0
+        self._task: asyncio.Task[None] | None = None
+        self._unsubscribe: Callable[[], None] | None = None
+
+    def invalidate(self, episode: str) -> None:
+        with self._lock:
+            self._values.pop(episode, None)
+            reads = self._reads.get(episode)
+            if reads is not None:
+                reads[1] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self._epoch += 1
+
+    async def get(self, episode: str, read: Callable[[], Awaitable[bool]]) -> bool:
+        """The cached status, or `read()` from the backend and cache it."""
+        with self._lock:
+            if self.live and episode in self._values:
+                self.hits += 1
+                return self._values[episode]
+            self.misses += 1
+            epoch = self._epoch
+            reads = self._reads.setdefault(episode, [0, 0])
+            reads[0] += 1
+            invalidations = reads[1]
+        value: bool | None = None
+        try:
+            value = await read()
+        finally:
+            with self._lock:
+                reads[0] -= 1
+                if reads[0] == 0:
+                    del self._reads[episode]
+                if (
+                    value is not None
+                    and self.live
+                    and self._epoch == epoch
+                    and reads[1] == invalidations
+                ):
+                    self._values[episode] = value
+        return value
+
+    def follow_store(self, store: StateStore) -> None:
+        """Invalidate on the store's own callbacks (in-process backends)."""
+        self.stop_following()
+        self._unsubscribe = store.subscribe(lambda episode, version: self.invalidate(episode))
+        self.clear()
+        self.live = True
+
+    def follow_events(self, client: httpx.AsyncClient, path: str = "/events") -> None:
+        """Invalidate from a backend's event stream in a background task."""
+        self.stop_following()
+        self._task = asyncio.get_running_loop().create_task(self._listen(client, path))
+
+    def stop_following(self) -> None:
+        self.live = False
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _listen(self, client: httpx.AsyncClient, path: str) -> None:
+        attempt = 0
+        while True:
+            try:
+                timeout = httpx.Timeout(None, connect=5.0)
+                async with client.stream("GET", path, timeout=timeout) as response:
+                    response.raise_for_status()
+                    event = None
+                    async for line in response.aiter_lines():
+                        if line.startswith("event:"):
+                            event = line.partition(":")[2].strip()
+                        elif line.startswith("data:"):
+                            data = json.loads(line.partition(":")[2])
+                            if event == "ready":
+                                self.clear()
+                                self.live = True
+                                attempt = 0
+                            elif event == "change":
+                                self.invalidate(data["episode"])
+                            elif event == "reset":
+                                self.clear()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Status event stream failed ({e!r}), reconnecting")
+            # Without notifications cached values may go stale
+            self.live = False
+            self.clear()
+            delay = min(30.0, 0.5 * 2**attempt)
+            attempt += 1
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+
+    def stats(self) -> dict[str, Any]:
+        return {"live": self.live, "hits": self.hits, "misses": self.misses}
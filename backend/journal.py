@@ -0,0 +1,322 @@
+"""Write-ahead log of switch state changes, for durable backend state.
+
+With `BACKEND_DB_DIR` set, the state store appends every change to
+`wal.jsonl` in that directory before the request that made it returns. A
+change is one JSON line holding the episode's new state, or null once the
+episode is released. Every `compact_every` records (10,000 by default),
+the log is compacted in two steps. Under the store's lock, the log is
+renamed to `wal.old.jsonl` and a new one started, which takes no fsync.
+Outside it, a snapshot of all episodes replaces `snapshot.json`
+atomically (temp file and rename) and the old log is deleted. On startup
+the store reloads the snapshot and replays both logs.
+
+Records carry a sequence number, and the snapshot stores the last one
+it includes, so a crash between writing the snapshot and deleting the old
+log cannot replay older states over newer ones. A torn last line (killed
+mid-write) is dropped.
+
+`fsync` policies, from durable to fast:
+    always: fsync every record before the request returns
+    interval: fsync at most every `fsync_interval` seconds (the default)
+    never: leave flushing to the OS; a process crash loses nothing, a
+        machine crash may lose the last records
+
+One process writes a directory at a time (an exclusive `flock` on
+`writer.lock` for the journal's lifetime). Other processes read it with
+`read_states`, which holds a shared lock on `compact.lock` that compaction
+takes exclusively, so readers never see a snapshot and a log that do not
+belong together.
+"""
+
+import atexit
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+FsyncPolicy = Literal["always", "interval", "never"]
+
+SNAPSHOT_FILE = "snapshot.json"
+WAL_FILE = "wal.jsonl"
+# The log being compacted, replayed before WAL_FILE
+OLD_WAL_FILE = "wal.old.jsonl"
+
+
+def atomic_write(path: str | Path, text: str, *, fsync: bool = True) -> None:
+    """Replace `path` with `text` so readers see the old or the new file, never a mix."""
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.")
+    try:
+        with os.fdopen(fd, "w") as fp:
+            fp.write(text)
+            if fsync:
+                fp.flush()
+                os.fsync(fp.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp)
+        raise
+    if fsync:
+        # Make the rename itself durable
+        _fsync_dir(path.parent)
+
+
+def _fsync_dir(directory: Path) -> None:
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextlib.contextmanager
+def _flock(path: Path, operation: int) -> Iterator[None]:
+    with open(path, "a") as fp:
+        fcntl.flock(fp, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def _replay_log(
+    path: Path, states: dict[str, Any], seq: int
+) -> tuple[int, int, int]:
+    """Apply a log's records newer than `seq`; the last sequence number, valid bytes and records."""
+    valid = records = 0
+    try:
+        with open(path, "rb") as fp:
+            for line in fp:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("no line end")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Dropping torn record at byte {valid} of {path.name}")
+                    break
+                valid += len(line)
+                records += 1
+                if record["n"] <= seq:
+                    # Already in the snapshot (crashed before the log was deleted)
+                    continue
+                seq = record["n"]
+                if record["s"] is None:
+                    states.pop(record["e"], None)
+                else:
+                    states[record["e"]] = record["s"]
+    except FileNotFoundError:
+        pass
+    return seq, valid, records
+
+
+def _replay(directory: Path) -> tuple[dict[str, Any], int, int, int]:
+    """States in `directory`, the last sequence number and the log's valid bytes and records."""
+    states: dict[str, Any] = {}
+    seq = 0
+    try:
+        with open(directory / SNAPSHOT_FILE) as fp:
+            snapshot = json.load(fp)
+        states.update(snapshot["episodes"])
+        seq = snapshot["seq"]
+    except FileNotFoundError:
+        pass
+    seq, _, _ = _replay_log(directory / OLD_WAL_FILE, states, seq)
+    seq, valid, records = _replay_log(directory / WAL_FILE, states, seq)
+    return states, seq, valid, records
+
+
+def read_states(directory: str | Path) -> dict[str, Any]:
+    """Every episode's state in a journal directory, e.g. from another process."""
+    directory = Path(directory)
+    with _flock(directory / "compact.lock", fcntl.LOCK_SH):
+        return _replay(directory)[0]
+
+
+class Journal:
+    """Append-only log plus compacted snapshot of the episodes' states.
+
+    Not thread-safe for appends on its own: the state store calls `append`
+    and `start_compaction` while holding its lock, so records are written
+    in the order the changes happened, and `finish_compaction` after
+    releasing it.
+    """
+
+    def __init__(
+        self,
+        directory: str | Path,
+        *,
+        fsync: FsyncPolicy = "interval",
+        fsync_interval: float = 1.0,
+        compact_every: int = 10_000,
+    ) -> None:
+        if fsync not in ("always", "interval", "never"):
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.records = 0
+        self.compactions = 0
+
+        self._writer_lock = open(self.directory / "writer.lock", "a")
+        try:
+            fcntl.flock(self._writer_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._writer_lock.close()
+            raise RuntimeError(
+                f"{self.directory} is already written by another process"
+            ) from None
+        self._compact_lock = self.directory / "compact.lock"
+        self._states, self._seq, valid, records = _replay(self.directory)
+        self._wal = open(self.directory / WAL_FILE, "ab", buffering=0)
+        # Cut a torn tail so new records start on a line of their own
+        self._wal.truncate(valid)
+        self._since_compaction = records
+        self._sync_lock = threading.Lock()
+        self._synced_at = time.monotonic()
+        self._timer: threading.Timer | None = None
+        # States and sequence number of a started compaction, until written
+        self._compacting: tuple[dict[str, Any], int] | None = None
+        self._old_wal: Any = None
+        self._compact_write_lock = threading.Lock()
+        if (self.directory / OLD_WAL_FILE).exists():
+            # A compaction was interrupted: finish it before logging anything
+            self._compacting = (dict(self._states), self._seq)
+            self.finish_compaction()
+            self._wal.truncate(0)
+            self._since_compaction = 0
+        atexit.register(self.close)
+
+    @classmethod
+    def from_env(cls) -> "Journal | None":
+        """Build from BACKEND_DB_DIR, BACKEND_DB_FSYNC and BACKEND_DB_COMPACT_EVERY."""
+        directory = os.getenv("BACKEND_DB_DIR")
+        if not directory:
+            return None
+        return cls(
+            directory,
+            fsync=os.getenv("BACKEND_DB_FSYNC", "interval"),  # type: ignore[arg-type]
+            fsync_interval=float(os.getenv("BACKEND_DB_FSYNC_INTERVAL", "1.0")),
+            compact_every=int(os.getenv("BACKEND_DB_COMPACT_EVERY", "10000")),
+        )
+
+    def recovered(self) -> dict[str, Any]:
+        """States found on disk when the journal was opened."""
+        states, self._states = self._states, {}
+        return states
+
+    @property
+    def compaction_due(self) -> bool:
+        return self._since_compaction >= self.compact_every and self._compacting is None
+
+    def append(self, episode: str, state: dict[str, Any] | None) -> None:
+        """Log an episode's new state (None: released)."""
+        self._seq += 1
+        line = json.dumps({"n": self._seq, "e": episode, "s": state}, separators=(",", ":"))
+        # One unbuffered write per record: whole lines reach the OS in order
+        self._wal.write(line.encode() + b"\n")
+        self.records += 1
+        self._since_compaction += 1
+        if self.fsync == "always":
+            os.fsync(self._wal.fileno())
+        elif self.fsync == "interval":
+            self._sync_later()
+
+    def _sync_later(self) -> None:
+        with self._sync_lock:
+            if time.monotonic() - self._synced_at >= self.fsync_interval:
+                self._sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.fsync_interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self) -> None:
+        """fsync the log now."""
+        with self._sync_lock:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._wal.closed:
+            os.fsync(self._wal.fileno())
+        self._synced_at = time.monotonic()
+
+    def start_compaction(self, states: dict[str, dict[str, Any]]) -> None:
+        """Set aside the log that `states` (every episode) covers and start a new one.
+
+        Cheap enough to call under the store's lock; `finish_compaction`
+        does the writing.
+        """
+        with _flock(self._compact_lock, fcntl.LOCK_EX):
+            os.replace(self.directory / WAL_FILE, self.directory / OLD_WAL_FILE)
+            # The old log stays open until `finish_compaction` has synced it
+            self._old_wal = self._wal
+            self._wal = open(self.directory / WAL_FILE, "ab", buffering=0)
+        if self.fsync == "always":
+            # Records are synced before returning; so must be the new log's name
+            _fsync_dir(self.directory)
+        self._compacting = (states, self._seq)
+        self._since_compaction = 0
+
+    def finish_compaction(self) -> None:
+        """Write the snapshot of a started compaction and delete the old log."""
+        with self._compact_write_lock:
+            if self._compacting is None:
+                return
+            states, seq = self._compacting
+            start = time.perf_counter()
+            if self._old_wal is not None:
+                if self.fsync != "never":
+                    os.fsync(self._old_wal.fileno())
+                self._old_wal.close()
+                self._old_wal = None
+            snapshot = json.dumps({"seq": seq, "episodes": states}, separators=(",", ":"))
+            with _flock(self._compact_lock, fcntl.LOCK_EX):
+                atomic_write(
+                    self.directory / SNAPSHOT_FILE, snapshot, fsync=self.fsync != "never"
+                )
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.directory / OLD_WAL_FILE)
+            self._compacting = None
+            self.compactions += 1
+        logger.info(
+            f"Compacted {len(states)} episodes into {SNAPSHOT_FILE} "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
+
+    def compact(self, states: dict[str, dict[str, Any]]) -> None:
+        """Snapshot `states` (every episode) atomically and start a new log."""
+        self.start_compaction(states)
+        self.finish_compaction()
+
+    def close(self) -> None:
+        if self._wal.closed:
+            return
+        self.finish_compaction()
+        if self.fsync != "never":
+            self.sync()
+        self._wal.close()
+        fcntl.flock(self._writer_lock, fcntl.LOCK_UN)
+        self._writer_lock.close()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "fsync": self.fsync,
+            "records": self.records,
+            "compactions": self.compactions,
+        }
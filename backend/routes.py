@@ -0,0 +1,100 @@
+"""Routes and helpers shared by the agent and user backend apps."""
+
+import logging
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from fastapi import APIRouter, Header, HTTPException
+from pydantic import BaseModel
+
+from .store import DEFAULT_EPISODE, EPISODE_HEADER, store
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def appliance_call(fn: Callable[..., T], *args: Any) -> T:
+    """Map appliance store errors to HTTP errors."""
+    try:
+        return fn(*args)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    except IndexError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e)) from e
+
+
+class SnapshotRequest(BaseModel):
+    snapshot_id: str | None = None
+    # False only returns the state, e.g. for checkpoints that store it themselves
+    keep: bool = True
+
+
+class RestoreRequest(BaseModel):
+    snapshot_id: str | None = None
+    # Snapshot data, e.g. from another process; applied as is, without registering it
+    state: dict[str, bool] | None = None
+
+
+class ForkRequest(BaseModel):
+    snapshot_id: str
+    episodes: list[str]
+
+
+class DropSnapshotRequest(BaseModel):
+    snapshot_id: str
+
+
+# Snapshot endpoints; both apps share the store, so either can serve them
+snapshot_router = APIRouter()
+
+
+@snapshot_router.post("/snapshot")
+def snapshot(
+    request: SnapshotRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Capture the episode state; restore or fork it later by ID."""
+    if not request.keep:
+        return {"snapshot_id": None, "state": store.get(episode).snapshot()}
+    snapshot_id = store.snapshot(episode, request.snapshot_id)
+    logger.info(f"Snapshot {snapshot_id} taken ({episode})")
+    return {"snapshot_id": snapshot_id, "state": store.snapshot_state(snapshot_id).snapshot()}
+
+
+@snapshot_router.post("/restore")
+def restore(
+    request: RestoreRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Set the episode state to a snapshot, given by ID or as its `state`."""
+    if request.state is not None:
+        store.load(episode, request.state)
+        logger.info(f"State restored ({episode})")
+        return {"ok": True}
+    if request.snapshot_id is None:
+        raise HTTPException(status_code=422, detail="Pass snapshot_id or state")
+    try:
+        store.restore(episode, request.snapshot_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    logger.info(f"Snapshot {request.snapshot_id} restored ({episode})")
+    return {"ok": True}
+
+
+@snapshot_router.post("/fork")
+def fork(request: ForkRequest):
+    """Start several episodes from one snapshot without copying it."""
+    try:
+        store.fork(request.snapshot_id, request.episodes)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e)) from e
+    logger.info(f"Snapshot {request.snapshot_id} forked into {len(request.episodes)} episodes")
+    return {"ok": True, "episodes": request.episodes}
+
+
+@snapshot_router.post("/drop_snapshot")
+def drop_snapshot(request: DropSnapshotRequest):
+    """Forget a snapshot; episodes forked from it keep their state."""
+    store.drop_snapshot(request.snapshot_id)
+    return {"ok": True}
@@ -0,0 +1,70 @@
+"""Serve the agent and user backends from one process.
+
+Both apps import the same `backend.store.store`, so running them in one
+process is what makes the in-memory state shared between them.
+
+Usage: python -m backend.serve
+With BACKEND_TRANSPORT=uds the apps listen on AGENT_BACKEND_UDS and
+USER_BACKEND_UDS instead of TCP ports.
+"""
+
+import asyncio
+import os
+
+import uvicorn
+
+from .agent import app as agent_app
+from .client import backend_transport, backend_uds
+from .store import open_journal
+from .user import app as user_app
+
+
+def build_servers(
+    agent_port: int,
+    user_port: int,
+    *,
+    host: str = "0.0.0.0",
+    log_level: str = "warning",
+    uds: tuple[str, str] | None = None,
+) -> list[uvicorn.Server]:
+    """Create (but do not start) the agent and user backend servers.
+
+    `uds` is an (agent, user) pair of socket paths that replaces the ports.
+    The servers own the state, so the journal (BACKEND_DB_DIR) is opened here.
+    """
+    open_journal()
+    if uds is not None:
+        return [
+            uvicorn.Server(uvicorn.Config(app, uds=path, log_level=log_level))
+            for app, path in zip((agent_app, user_app), uds, strict=True)
+        ]
+    return [
+        uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level=log_level))
+        for app, port in ((agent_app, agent_port), (user_app, user_port))
+    ]
+
+
+async def serve(
+    agent_port: int,
+    user_port: int,
+    *,
+    host: str = "0.0.0.0",
+    log_level: str = "warning",
+    uds: tuple[str, str] | None = None,
+) -> None:
+    """Run both backend apps on their own ports in the current event loop."""
+    servers = build_servers(agent_port, user_port, host=host, log_level=log_level, uds=uds)
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+if __name__ == "__main__":
+    transport = backend_transport()
+    if transport in ("asgi", "direct"):
+        raise SystemExit(f"BACKEND_TRANSPORT={transport} runs the backends inside env.py")
+    asyncio.run(
+        serve(
+            int(os.getenv("AGENT_BACKEND_PORT", "8001")),
+            int(os.getenv("USER_BACKEND_PORT", "8002")),
+            uds=(backend_uds("agent"), backend_uds("user")) if transport == "uds" else None,
+        )
+    )
@@ -0,0 +1,307 @@
+"""In-memory switch state shared by the agent and user backends."""
+
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Any
+
+from .db import DB, DB_PATH
+from .journal import Journal
+
+# Requests without an episode header share this namespace
+DEFAULT_EPISODE = "default"
+EPISODE_HEADER = "X-Episode-Id"
+
+logger = logging.getLogger(__name__)
+
+# Called with (episode, version) after every change to an episode's state
+StateListener = Callable[[str, int], None]
+
+
+class StateStore:
+    """Thread-safe switch state keyed by episode ID.
+
+    Every episode gets its own `DB` namespace, created on first use, so
+    concurrent evals never see each other's switches. All mutations happen
+    under one lock, and nothing touches the disk unless a journal is given.
+
+    Snapshots are copy-on-write: taking one freezes the episode's current
+    state object, and restoring or forking it into other episodes shares
+    that object until an episode first mutates it. At most `max_snapshots`
+    are kept; taking one more forgets the least recently used, and episodes
+    started from it keep their state.
+
+    Listeners registered with `subscribe` are called after every change,
+    outside the lock, with the episode and the store's version number, which
+    increases with each change.
+
+    With a `journal` (see `backend.journal`), given here or later through
+    `attach_journal`, the store takes over the states it recovered, and
+    every change is appended to it under the lock before the mutating call
+    returns. Compaction snapshots are written after the lock is released.
+    """
+
+    def __init__(
+        self,
+        initial: DB | None = None,
+        journal: Journal | None = None,
+        max_snapshots: int = 1024,
+    ) -> None:
+        self._lock = threading.Lock()
+        self._states: dict[str, DB] = {}
+        # Episodes whose state object is a snapshot shared with others
+        self._shared: set[str] = set()
+        # Least recently used first
+        self._snapshots: OrderedDict[str, DB] = OrderedDict()
+        self.max_snapshots = max_snapshots
+        self._listeners: list[StateListener] = []
+        self.version = 0
+        if initial is not None:
+            self._states[DEFAULT_EPISODE] = initial
+        self._journal: Journal | None = None
+        if journal is not None:
+            self.attach_journal(journal)
+
+    def attach_journal(self, journal: Journal) -> None:
+        """Make the store durable, starting from the states `journal` recovered."""
+        with self._lock:
+            if self._journal is not None:
+                raise RuntimeError("The store already has a journal")
+            for episode, data in journal.recovered().items():
+                self._states[episode] = DB.model_validate(data)
+            self._journal = journal
+
+    @property
+    def journal(self) -> Journal | None:
+        return self._journal
+
+    def _state(self, episode: str) -> DB:
+        """Get the state for an episode to read. Caller must hold the lock."""
+        db = self._states.get(episode)
+        if db is None:
+            db = self._states[episode] = DB()
+        return db
+
+    def _writable(self, episode: str) -> DB:
+        """Get the state for an episode to mutate, copying a shared snapshot first.
+
+        Caller must hold the lock.
+        """
+        if episode in self._shared:
+            self._shared.discard(episode)
+            self._states[episode] = self._states[episode].model_copy()
+        return self._state(episode)
+
+    def _changed(self, episodes: list[str]) -> list[tuple[str, int]]:
+        """Number changes to notify once the lock is released. Caller must hold the lock."""
+        changes = []
+        for episode in episodes:
+            self.version += 1
+            changes.append((episode, self.version))
+        if self._journal is not None:
+            self._log(episodes)
+        return changes
+
+    def _log(self, episodes: list[str]) -> None:
+        """Append the episodes' new states to the journal. Caller must hold the lock."""
+        for episode in episodes:
+            db = self._states.get(episode)
+            self._journal.append(episode, db.snapshot() if db is not None else None)
+        if self._journal.compaction_due:
+            # Only the states are captured here; `_notify` writes them
+            self._journal.start_compaction(
+                {episode: db.snapshot() for episode, db in self._states.items()}
+            )
+
+    def _notify(self, changes: list[tuple[str, int]]) -> None:
+        """Run after every change, outside the lock."""
+        if self._journal is not None:
+            self._journal.finish_compaction()
+        for listener in list(self._listeners):
+            for episode, version in changes:
+                try:
+                    listener(episode, version)
+                except Exception as e:
+                    logger.warning(f"State listener failed: {e}")
+
+    def subscribe(self, listener: StateListener) -> Callable[[], None]:
+        """Call `listener` after every state change; returns the unsubscribe function."""
+        with self._lock:
+            self._listeners.append(listener)
+
+        def unsubscribe() -> None:
+            with self._lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def get(self, episode: str = DEFAULT_EPISODE) -> DB:
+        """Get a copy of the episode state."""
+        with self._lock:
+            return self._state(episode).model_copy()
+
+    def reset(self, episode: str = DEFAULT_EPISODE) -> None:
+        """Reset both switches of an episode to False."""
+        with self._lock:
+            self._writable(episode).reset()
+            changes = self._changed([episode])
+        self._notify(changes)
+
+    def flip(self, episode: str, field: str) -> bool:
+        """Atomically flip a switch and return its new value."""
+        if field not in DB.model_fields:
+            raise ValueError(f"Unknown switch: {field}")
+        with self._lock:
+            db = self._writable(episode)
+            value = not getattr(db, field)
+            setattr(db, field, value)
+            changes = self._changed([episode])
+        self._notify(changes)
+        return value
+
+    def bulb_on(self, episode: str = DEFAULT_EPISODE) -> bool:
+        """Bulb is on if both switches are True."""
+        with self._lock:
+            db = self._state(episode)
+            return db.agent_switch and db.user_switch
+
+    def batch(self, episode: str, ops: list[str]) -> list[bool | None]:
+        """Apply operations in order under one lock and return their results.
+
+        Operations: `flip:<switch>` (returns the new value), `bulb_on` and
+        `reset` (returns None). Unknown operations reject the whole batch
+        before anything is applied.
+        """
+        for op in ops:
+            if op in ("bulb_on", "reset"):
+                continue
+            kind, _, field = op.partition(":")
+            if kind != "flip" or field not in DB.model_fields:
+                raise ValueError(f"Unknown operation: {op}")
+        results: list[bool | None] = []
+        with self._lock:
+            mutates = any(op != "bulb_on" for op in ops)
+            db = self._writable(episode) if mutates else self._state(episode)
+            for op in ops:
+                if op == "bulb_on":
+                    results.append(db.agent_switch and db.user_switch)
+                elif op == "reset":
+                    db.reset()
+                    results.append(None)
+                else:
+                    field = op.partition(":")[2]
+                    value = not getattr(db, field)
+                    setattr(db, field, value)
+                    results.append(value)
+            changes = self._changed([episode]) if mutates else []
+        if changes:
+            self._notify(changes)
+        return results
+
+    def snapshot(self, episode: str = DEFAULT_EPISODE, snapshot_id: str | None = None) -> str:
+        """Capture an episode's state and return the snapshot ID.
+
+        The episode's state object becomes the snapshot, so nothing is copied
+        until the episode mutates it. Taking a snapshot under an existing ID
+        replaces it.
+        """
+        snapshot_id = snapshot_id or uuid.uuid4().hex
+        with self._lock:
+            self._keep_snapshot(snapshot_id, self._state(episode))
+            self._shared.add(episode)
+        return snapshot_id
+
+    def _keep_snapshot(self, snapshot_id: str, db: DB) -> None:
+        """Register a snapshot, evicting the least recently used. Caller must hold the lock."""
+        self._snapshots[snapshot_id] = db
+        self._snapshots.move_to_end(snapshot_id)
+        while len(self._snapshots) > self.max_snapshots:
+            evicted, _ = self._snapshots.popitem(last=False)
+            logger.info(f"Snapshot {evicted} evicted ({self.max_snapshots} kept)")
+
+    def snapshot_state(self, snapshot_id: str) -> DB:
+        """Get a copy of a snapshot's state."""
+        with self._lock:
+            return self._snapshot(snapshot_id).model_copy()
+
+    def load_snapshot(self, snapshot_id: str, data: dict[str, Any]) -> None:
+        """Register a snapshot from `DB.snapshot` data, e.g. taken by another process."""
+        db = DB.model_validate(data)
+        with self._lock:
+            self._keep_snapshot(snapshot_id, db)
+
+    def load(self, episode: str, data: dict[str, Any]) -> None:
+        """Set an episode's state from `DB.snapshot` data without registering a snapshot."""
+        db = DB.model_validate(data)
+        with self._lock:
+            self._states[episode] = db
+            self._shared.discard(episode)
+            changes = self._changed([episode])
+        self._notify(changes)
+
+    def restore(self, episode: str, snapshot_id: str) -> None:
+        """Set an episode's state to a snapshot, sharing it until the first write."""
+        self.fork(snapshot_id, [episode])
+
+    def fork(self, snapshot_id: str, episodes: list[str]) -> None:
+        """Start every episode in `episodes` from the same snapshot, copy-on-write."""
+        with self._lock:
+            db = self._snapshot(snapshot_id)
+            for episode in episodes:
+                self._states[episode] = db
+                self._shared.add(episode)
+            changes = self._changed(episodes)
+        self._notify(changes)
+
+    def drop_snapshot(self, snapshot_id: str) -> None:
+        """Forget a snapshot; episodes forked from it keep their state."""
+        with self._lock:
+            self._snapshots.pop(snapshot_id, None)
+
+    def _snapshot(self, snapshot_id: str) -> DB:
+        db = self._snapshots.get(snapshot_id)
+        if db is None:
+            raise KeyError(f"Unknown snapshot: {snapshot_id}")
+        self._snapshots.move_to_end(snapshot_id)
+        return db
+
+    def release(self, episode: str) -> None:
+        """Drop an episode namespace once its scenario has been graded."""
+        with self._lock:
+            self._states.pop(episode, None)
+            self._shared.discard(episode)
+            changes = self._changed([episode])
+        self._notify(changes)
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+
+# Shared store, seeded once from db.json for the default namespace
+store = StateStore(
+    initial=DB.load(DB_PATH),
+    max_snapshots=int(os.getenv("BACKEND_MAX_SNAPSHOTS", "1024")),
+)
+
+_journal_lock = threading.Lock()
+
+
+def open_journal() -> Journal | None:
+    """Make the shared store durable if BACKEND_DB_DIR is set (idempotent).
+
+    Only the process serving the backends calls this: the journal holds an
+    exclusive lock on its directory, so importing the store (e.g. from
+    env.py next to `backend.serve`) must not open it.
+    """
+    with _journal_lock:
+        if store.journal is None:
+            journal = Journal.from_env()
+            if journal is not None:
+                store.attach_journal(journal)
+                logger.info(f"State journal opened in {journal.directory}")
+        return store.journal
+
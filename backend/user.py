@@ -2,8 +2,15 @@
 
 import sys
 import logging
-from fastapi import FastAPI
-from .db import DB, DB_PATH
+from typing import Literal
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from .appliances import appliance_store
+from .events import state_events
+from .routes import appliance_call, snapshot_router
+from .store import DEFAULT_EPISODE, EPISODE_HEADER, store
 
 logging.basicConfig(
     stream=sys.stderr,
@@ -12,7 +19,26 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
+
+# Batch operation name -> state store operation
+BATCH_OPS = {"switch": "flip:user_switch", "check_status": "bulb_on"}
+
+
+class BatchRequest(BaseModel):
+    ops: list[Literal["switch", "check_status"]]
+
+
+class ApplianceSwitchRequest(BaseModel):
+    appliance: int
+    switch: int
+
+
+class ApplianceStatusRequest(BaseModel):
+    appliance: int
+
+
 app = FastAPI(title="User Backend App")
+app.include_router(snapshot_router)
 
 
 @app.get("/health")
@@ -22,30 +48,60 @@ def health():
 
 
 @app.post("/reset")
-def reset():
-    """Reset the shared state."""
-    db = DB.load(DB_PATH)
-    db.reset()
-    db.dump(DB_PATH)
-    logger.info("State reset")
+def reset(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Reset the episode state."""
+    store.reset(episode)
+    logger.info(f"State reset ({episode})")
     return {"ok": True}
 
 
 @app.post("/switch")
-def switch():
+def switch(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
     """Flip the value of `user_switch`."""
-    db = DB.load(DB_PATH)
-    db.user_switch = not db.user_switch
-    db.dump(DB_PATH)
-    logger.info(f"User switch flipped to {db.user_switch}")
+    value = store.flip(episode, "user_switch")
+    logger.info(f"User switch flipped to {value} ({episode})")
     return {"ok": True, "message": "User switch flipped"}
 
 
 @app.get("/check_status")
-def check_status():
+def check_status(episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
     """Check if the bulb is lighting. Bulb is on if both switches are True."""
-    db = DB.load(DB_PATH)
-    bulb_on = db.agent_switch and db.user_switch
-    logger.info(f"Bulb status: {'ON' if bulb_on else 'OFF'}")
+    bulb_on = store.bulb_on(episode)
+    logger.info(f"Bulb status: {'ON' if bulb_on else 'OFF'} ({episode})")
     return {"bulb_on": bulb_on, "message": f"The bulb is {'ON' if bulb_on else 'OFF'}"}
 
+
+@app.get("/events")
+async def events(request: Request):
+    """Stream state changes of every episode as server-sent events."""
+    return StreamingResponse(
+        state_events(store, request.is_disconnected), media_type="text/event-stream"
+    )
+
+
+@app.post("/batch")
+def batch(request: BatchRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)):
+    """Run several operations in order in one round trip."""
+    results = store.batch(episode, [BATCH_OPS[op] for op in request.ops])
+    logger.info(f"Batch {request.ops} -> {results} ({episode})")
+    return {"results": results}
+
+
+@app.post("/appliances/switch")
+def appliances_switch(
+    request: ApplianceSwitchRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Flip one of the user's switches of an appliance."""
+    value = appliance_call(
+        appliance_store.flip, episode, request.appliance, request.switch, "user"
+    )
+    return {"ok": True, "value": value}
+
+
+@app.post("/appliances/check_status")
+def appliances_check_status(
+    request: ApplianceStatusRequest, episode: str = Header(DEFAULT_EPISODE, alias=EPISODE_HEADER)
+):
+    """Check whether an appliance is on."""
+    on = appliance_call(appliance_store.is_on, episode, request.appliance)
+    return {"on": on}
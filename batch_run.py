@@ -0,0 +1,105 @@
+"""Batch evaluation across worker processes.
+
+Usage: python batch_run.py multiturn-test --workers 8 --concurrency 10
+"""
+
+import argparse
+import functools
+import json
+
+from prompts import AGENT_INSTRUCTION, USER_INSTRUCTION
+from loop.batch import run_batch
+from loop.budget import EpisodeBudget
+from loop.coalesce import RequestCoalescer, concurrent_batch_call
+
+
+def make_agents(model: str):
+    """Fresh assistant and simulated user for one episode (runs in the worker)."""
+    from hud.agents import create_agent
+
+    assistant = create_agent(
+        model=model,
+        system_prompt=AGENT_INSTRUCTION,
+        allowed_tools=["agent_switch"]
+    )
+    user = create_agent(
+        model=model,
+        system_prompt=USER_INSTRUCTION,
+        allowed_tools=["user_switch", "check_status"]
+    )
+    return assistant, user
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a dataset across worker processes")
+    parser.add_argument("dataset", nargs="?", default="multiturn-test")
+    parser.add_argument("--model", default="claude-haiku-4-5")
+    parser.add_argument("--workers", type=int, default=None, help="default: CPU count")
+    parser.add_argument("--concurrency", type=int, default=10, help="episodes per worker")
+    parser.add_argument(
+        "--backend-transport",
+        choices=["http", "uds", "asgi", "direct"],
+        help="BACKEND_TRANSPORT for the workers, e.g. direct for in-process backends",
+    )
+    parser.add_argument("--max-steps", type=int, default=10)
+    parser.add_argument("--results", help="append per-episode results to this JSONL file")
+    parser.add_argument("--traces", help="stream full episode traces into this directory")
+    parser.add_argument(
+        "--checkpoints",
+        help="checkpoint episodes here after every turn; rerun with it to resume",
+    )
+    parser.add_argument(
+        "--stream-user",
+        action="store_true",
+        help="stream simulated user replies and stop generating at ###STOP###",
+    )
+    parser.add_argument("--episode-timeout", type=float, help="wall-clock seconds per episode")
+    parser.add_argument("--turn-timeout", type=float, help="wall-clock seconds per turn")
+    parser.add_argument("--episode-tokens", type=int, help="input + output tokens per episode")
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="gather concurrent LLM requests of a worker and send them together",
+    )
+    parser.add_argument(
+        "--dedupe",
+        action="store_true",
+        help="send identical concurrent LLM requests once; those episodes share one sample",
+    )
+    args = parser.parse_args()
+    coalescer = None
+    if args.coalesce or args.dedupe:
+        coalescer = RequestCoalescer(
+            dedupe=args.dedupe,
+            batch_call=concurrent_batch_call() if args.coalesce else None,
+        )
+    budget = None
+    if args.episode_timeout or args.turn_timeout or args.episode_tokens:
+        budget = EpisodeBudget(
+            episode_seconds=args.episode_timeout,
+            turn_seconds=args.turn_timeout,
+            episode_tokens=args.episode_tokens,
+        )
+
+    report = run_batch(
+        args.dataset,
+        functools.partial(make_agents, args.model),
+        workers=args.workers,
+        concurrency=args.concurrency,
+        backend_transport=args.backend_transport,
+        results_path=args.results,
+        traces_dir=args.traces,
+        checkpoint_dir=args.checkpoints,
+        snapshot_tool="_checkpoint_state" if args.checkpoints else None,
+        state_scenarios=("bulb",),
+        on_result=lambda r: print(f"[worker {r['worker']}] episode {r['index']}: reward={r['reward']}"),
+        max_steps=args.max_steps,
+        stream_user=args.stream_user,
+        budget=budget,
+        coalescer=coalescer,
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
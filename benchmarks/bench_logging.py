@@ -0,0 +1,153 @@
+"""Benchmark the loop's console/logging overhead per step.
+
+Replays the output calls one tool step of `_run_conversation_loop` makes,
+with large tool results, against a console that applies the same level
+checks as `HUDConsole` but discards output, so only the cost of building
+strings is measured. Compares the former eager f-string formatting with
+`LoopConsole` at the default level and switched off.
+
+Usage: python -m benchmarks.bench_logging --steps 2000 --result-chars 8000
+"""
+
+import argparse
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from loop.console import LoopConsole
+from loop.multi_turn import _format_step
+
+
+class DiscardingConsole:
+    """`HUDConsole` level gating without any terminal output."""
+
+    def __init__(self, logger: logging.Logger) -> None:
+        self._logger = logger
+        self.chars = 0
+
+    def _emit(self, message: str) -> None:
+        self.chars += len(message)
+
+    def debug(self, message: str) -> None:
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._emit(message)
+
+    def info_log(self, message: str) -> None:
+        if self._logger.isEnabledFor(logging.INFO):
+            self._emit(message)
+
+    def info(self, message: str) -> None:
+        self._emit(message)
+
+    warning = warning_log = error_log = info
+
+
+@dataclass
+class _Call:
+    name: str
+    arguments: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Result:
+    content: list[dict[str, Any]]
+    isError: bool = False
+
+
+@dataclass
+class _Response:
+    content: str
+    tool_calls: list[_Call]
+
+
+def _payload(result_chars: int, tools: int) -> tuple[_Response, list[_Call], list[_Result]]:
+    calls = [_Call(f"tool_{i}", {"arg": "x" * 64}) for i in range(tools)]
+    results = [_Result([{"type": "text", "text": "r" * result_chars}]) for _ in calls]
+    return _Response("Let me check that for you.", calls), calls, results
+
+
+def eager_step(
+    console: Any, step: int, max_steps: int, response: Any, calls: Any, results: Any
+) -> None:
+    """The loop's output calls before lazy formatting."""
+    console.debug(f"Step {step}/{max_steps if max_steps != -1 else 'unlimited'}")
+    console.debug(f"Agent:\n{response}")
+    step_info = f"\n[bold]Step {step}/{max_steps if max_steps != -1 else '∞'}[/bold]"
+    for call, result in zip(calls, results, strict=False):
+        step_info += f"\n🤖 {call}\n{result}"
+    console.info_log(step_info)
+    console.info(f"[bold cyan]🤖 Agent:[/bold cyan] {response.content}")
+    console.info(f"[bold green]👤 User:[/bold green] {'ok'}")
+
+
+def lazy_step(
+    console: LoopConsole, step: int, max_steps: int, response: Any, calls: Any, results: Any
+) -> None:
+    """The same calls through `LoopConsole`."""
+    console.debug("Step {}/{}", step, max_steps if max_steps != -1 else "unlimited")
+    console.debug("Agent:\n{}", response)
+    console.info_log(lambda: _format_step(console, step, max_steps, calls, results))
+    console.info("[bold cyan]🤖 Agent:[/bold cyan] {}", response.content)
+    console.info("[bold green]👤 User:[/bold green] {}", "ok")
+
+
+def _time(fn: Any, steps: int) -> float:
+    start = time.perf_counter()
+    for step in range(steps):
+        fn(step)
+    return (time.perf_counter() - start) / steps * 1e6
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--steps", type=int, default=2000)
+    parser.add_argument("--result-chars", type=int, default=8000)
+    parser.add_argument("--tools", type=int, default=2)
+    parser.add_argument(
+        "--level",
+        choices=["DEBUG", "INFO", "WARNING"],
+        default="WARNING",
+        help="console logger level (hud's default is WARNING)",
+    )
+    args = parser.parse_args(argv)
+
+    bench_logger = logging.getLogger("benchmarks.console")
+    bench_logger.setLevel(args.level)
+    response, calls, results = _payload(args.result_chars, args.tools)
+    max_steps = 30
+
+    eager_console = DiscardingConsole(bench_logger)
+    lazy_console = DiscardingConsole(bench_logger)
+    lazy = LoopConsole(lazy_console)
+    quiet = LoopConsole(DiscardingConsole(bench_logger), enabled=False)
+
+    report = {
+        "benchmark": "logging",
+        "config": vars(args),
+        "results": {
+            "us_per_step": {
+                "eager": _time(
+                    lambda s: eager_step(eager_console, s, max_steps, response, calls, results),
+                    args.steps,
+                ),
+                "lazy": _time(
+                    lambda s: lazy_step(lazy, s, max_steps, response, calls, results), args.steps
+                ),
+                "quiet": _time(
+                    lambda s: lazy_step(quiet, s, max_steps, response, calls, results), args.steps
+                ),
+            },
+            "chars_emitted_per_step": {
+                "eager": eager_console.chars // args.steps,
+                "lazy": lazy_console.chars // args.steps,
+            },
+        },
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
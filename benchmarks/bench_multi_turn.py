@@ -0,0 +1,216 @@
+"""Benchmark the multi-turn loop and backends with scripted agents.
+
+Runs N concurrent `bulb` episodes through the conversation loop against
+local agent/user backends, with deterministic scripted stand-ins for both
+models, and reports framework overhead separately from (fake) model time.
+
+Usage: python -m benchmarks.bench_multi_turn --episodes 200 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any
+
+from loop.analytics import percentiles
+
+from .scripted import AGENT_SCRIPT, USER_SCRIPT, ScriptedAgent
+
+
+def _instrument_store(samples: list[float]) -> None:
+    """Time every state store operation made by the backends."""
+    from backend.store import store
+
+    for name in ("flip", "reset", "bulb_on", "batch", "release"):
+        method = getattr(store, name)
+
+        def timed(*args: Any, _method: Any = method, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - start)
+
+        setattr(store, name, timed)
+
+
+def _start_backends(
+    agent_port: int, user_port: int, transport: str
+) -> tuple[list[Any], threading.Thread]:
+    """Serve both backends from a background thread with its own event loop."""
+    from backend.client import backend_uds
+    from backend.serve import build_servers
+
+    uds = (backend_uds("agent"), backend_uds("user")) if transport == "uds" else None
+    servers = build_servers(agent_port, user_port, host="127.0.0.1", log_level="error", uds=uds)
+
+    async def serve_all() -> None:
+        await asyncio.gather(*(server.serve() for server in servers))
+
+    thread = threading.Thread(target=asyncio.run, args=(serve_all(),), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not all(server.started for server in servers):
+        if time.monotonic() > deadline or not thread.is_alive():
+            raise RuntimeError("Backends failed to start")
+        time.sleep(0.01)
+    return servers, thread
+
+
+async def run_episode(env_module: Any, index: int, args: argparse.Namespace) -> dict[str, Any]:
+    """Run one scripted bulb episode and return its timings."""
+    from hud.agents.base import text_to_blocks
+
+    from loop.multi_turn import _run_conversation_loop
+
+    tools = {
+        "agent_switch": env_module.agent_switch,
+        "user_switch": env_module.user_switch,
+        "check_status": env_module.check_status,
+    }
+    agent = ScriptedAgent(
+        AGENT_SCRIPT, tools, latency=args.latency, jitter=args.jitter, seed=index, name="agent"
+    )
+    user = ScriptedAgent(
+        USER_SCRIPT, tools, latency=args.latency, jitter=args.jitter, seed=-index, name="user"
+    )
+
+    token = env_module.current_episode.set(f"bench-{index}")
+    try:
+        start = time.perf_counter()
+        scenario = env_module.bulb()
+        prompt = await scenario.__anext__()
+        loop_start = time.perf_counter()
+        trace = await _run_conversation_loop(
+            agent,
+            user,
+            text_to_blocks(prompt),
+            max_steps=args.max_steps,
+            pipelined=args.pipelined,
+        )
+        loop_wall = time.perf_counter() - loop_start
+        reward = await scenario.asend(trace.content)
+        await scenario.aclose()
+        wall = time.perf_counter() - start
+    finally:
+        env_module.current_episode.reset(token)
+
+    return {
+        "wall": wall,
+        "loop_wall": loop_wall,
+        "reward": reward,
+        "error": trace.isError,
+        "model": agent.model_time + user.model_time,
+        "tools": agent.tool_time + user.tool_time,
+        "step_walls": [step["wall"] for step in trace.info.get("steps", [])],
+    }
+
+
+async def run_benchmark(env_module: Any, args: argparse.Namespace) -> list[dict[str, Any]]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def bounded(index: int) -> dict[str, Any]:
+        async with semaphore:
+            return await run_episode(env_module, index, args)
+
+    return await asyncio.gather(*(bounded(i) for i in range(args.episodes)))
+
+
+def summarize(
+    episodes: list[dict[str, Any]], state_samples: list[float], elapsed: float
+) -> dict[str, Any]:
+    """Aggregate episode timings into a machine-readable report."""
+    n = len(episodes)
+    step_walls = [w for ep in episodes for w in ep["step_walls"]]
+    episode_wall = sum(ep["wall"] for ep in episodes)
+    loop_wall = sum(ep["loop_wall"] for ep in episodes)
+    model = sum(ep["model"] for ep in episodes)
+    tools = sum(ep["tools"] for ep in episodes)
+    state = sum(state_samples)
+    per_step = max(len(step_walls), 1)
+    return {
+        "episodes": n,
+        "elapsed_s": elapsed,
+        "episodes_per_s": n / elapsed if elapsed else 0.0,
+        "success_rate": sum(1 for ep in episodes if ep["reward"]) / n if n else 0.0,
+        "errors": sum(1 for ep in episodes if ep["error"]),
+        "steps": len(step_walls),
+        "step_latency_s": {
+            **percentiles(step_walls, (50, 99), empty=0.0),
+            "max": max(step_walls, default=0.0),
+        },
+        "episode_latency_s": percentiles([ep["wall"] for ep in episodes], (50, 99), empty=0.0),
+        # Mean seconds per step spent in each phase
+        "per_step_phase_s": {
+            "model": model / per_step,
+            "loop": (loop_wall - model - tools) / per_step,
+            "scenario_http": (episode_wall - loop_wall) / per_step,
+            "tool_http": (tools - state) / per_step,
+            "state_io": state / per_step,
+        },
+        "state_ops": len(state_samples),
+    }
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--episodes", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latency jitter fraction")
+    parser.add_argument("--max-steps", type=int, default=10)
+    parser.add_argument("--pipelined", action="store_true")
+    parser.add_argument(
+        "--transport", choices=["http", "uds", "asgi", "direct"], default="http"
+    )
+    parser.add_argument("--agent-port", type=int, default=18001)
+    parser.add_argument("--user-port", type=int, default=18002)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    # env.py reads the backend transport and ports at import time
+    os.environ["BACKEND_TRANSPORT"] = args.transport
+    os.environ["AGENT_BACKEND_PORT"] = str(args.agent_port)
+    os.environ["USER_BACKEND_PORT"] = str(args.user_port)
+    import env as env_module
+
+    for name in ("backend.agent", "backend.user", "loop.multi_turn"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    state_samples: list[float] = []
+    _instrument_store(state_samples)
+    servers: list[Any] = []
+    thread = None
+    if args.transport in ("http", "uds"):
+        servers, thread = _start_backends(args.agent_port, args.user_port, args.transport)
+    try:
+        start = time.perf_counter()
+        episodes = asyncio.run(run_benchmark(env_module, args))
+        elapsed = time.perf_counter() - start
+    finally:
+        for server in servers:
+            server.should_exit = True
+        if thread is not None:
+            thread.join(timeout=5)
+
+    report = {
+        "benchmark": "multi_turn",
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "results": summarize(episodes, state_samples, elapsed),
+    }
+    blob = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(blob)
+    else:
+        print(blob)
+    return report
+
+
+if __name__ == "__main__":
+    sys.exit(0 if main()["results"]["errors"] == 0 else 1)
@@ -0,0 +1,136 @@
+"""Benchmark environment cold start.
+
+Runs each measurement in fresh interpreters, like a new container would:
+
+- import time of `env` (and of the backend apps), from `python -X importtime`,
+  with the modules that cost the most;
+- time from launch until `env.init()` returns, with the backends started at
+  the same moment (http/uds) or hosted in-process (asgi/direct).
+
+Usage: python -m benchmarks.bench_startup --transport http --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+# Child process: import env, run its init hook, report timings as JSON
+_READY_SCRIPT = """
+import asyncio, json, time
+start = time.perf_counter()
+import env
+imported = time.perf_counter()
+asyncio.run(env.init())
+print(json.dumps({"import_s": imported - start, "init_s": time.perf_counter() - imported}))
+"""
+
+
+def import_profile(module: str, env: dict[str, str], top: int) -> dict[str, Any]:
+    """Total import time of `module` and its most expensive top-level imports."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows: list[tuple[str, int, int]] = []
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME.match(line)
+        if match:
+            _, cumulative, indent, name = match.groups()
+            rows.append((name, int(cumulative), len(indent)))
+    # Modules are listed after their imports, one indentation level deeper
+    end = max(i for i, (name, _, _) in enumerate(rows) if name == module)
+    _, total, depth = rows[end]
+    begin = max((i for i in range(end) if rows[i][2] <= depth), default=-1) + 1
+    children = [(name, c) for name, c, d in rows[begin:end] if d == depth + 2]
+    heaviest = sorted(children, key=lambda row: -row[1])[:top]
+    return {
+        "total_ms": total / 1000,
+        "heaviest_ms": {name: c / 1000 for name, c in heaviest},
+    }
+
+
+def time_to_ready(env: dict[str, str], transport: str) -> dict[str, float]:
+    """Launch (backends and) env.py together and time until init() returns."""
+    backends = None
+    start = time.perf_counter()
+    if transport in ("http", "uds"):
+        backends = subprocess.Popen(
+            [sys.executable, "-m", "backend.serve"],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    try:
+        completed = subprocess.run(
+            [sys.executable, "-c", _READY_SCRIPT],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    finally:
+        if backends is not None:
+            backends.terminate()
+            backends.wait(timeout=10)
+    report = json.loads(completed.stdout.strip().splitlines()[-1])
+    report["ready_s"] = time.perf_counter() - start
+    return report
+
+
+def main(argv: list[str] | None = None) -> dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--transport", choices=["http", "uds", "asgi", "direct"], default="http"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="heaviest imports to list")
+    parser.add_argument("--agent-port", type=int, default=18001)
+    parser.add_argument("--user-port", type=int, default=18002)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    env = {
+        **os.environ,
+        "BACKEND_TRANSPORT": args.transport,
+        "AGENT_BACKEND_PORT": str(args.agent_port),
+        "USER_BACKEND_PORT": str(args.user_port),
+        # Readiness is measured, not the SSE subscription
+        "STATUS_CACHE": "0",
+    }
+    runs = [time_to_ready(env, args.transport) for _ in range(args.runs)]
+    report = {
+        "transport": args.transport,
+        "runs": args.runs,
+        "imports": {
+            "env": import_profile("env", env, args.top),
+            "backend.serve": import_profile("backend.serve", env, args.top),
+        },
+        "ready_s": {
+            "median": statistics.median(r["ready_s"] for r in runs),
+            "max": max(r["ready_s"] for r in runs),
+        },
+        "env_import_s": statistics.median(r["import_s"] for r in runs),
+        "env_init_s": statistics.median(r["init_s"] for r in runs),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Deterministic stand-ins for the agent and simulated user.
+
+Scripted agents implement the parts of the hud agent interface that
+`multi_turn_run` uses, with a configurable fake model latency, so the loop
+and backends can be benchmarked without any model calls.
+"""
+
+import asyncio
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from hud.types import InferenceResult, MCPToolCall, MCPToolResult
+from mcp.types import TextContent
+
+ToolFn = Callable[[], Awaitable[str]]
+
+# Scripted bulb episode: (content, tool names) per response
+AGENT_SCRIPT: list[tuple[str | None, list[str]]] = [
+    ("Hi, how can i help you today?", []),
+    ("Please check the bulb status first.", []),
+    ("I flipped the agent switch, please check the bulb again.", ["agent_switch"]),
+    ("Please flip your switch and check the bulb.", []),
+]
+USER_SCRIPT: list[tuple[str | None, list[str]]] = [
+    ("I'd like to turn on the bulb.", []),
+    (None, ["check_status"]),
+    ("The bulb is OFF.", []),
+    (None, ["check_status"]),
+    ("Still OFF.", []),
+    (None, ["user_switch", "check_status"]),
+    ("The bulb is ON! ###STOP###", []),
+]
+
+
+class QuietConsole:
+    """Console that drops everything, like a batch run with logging off."""
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        return lambda *args, **kwargs: None
+
+
+class _Config:
+    allowed_tools: list[str] | None = None
+
+
+class ScriptedAgent:
+    """Replays a fixed list of responses and calls tools as plain coroutines.
+
+    Args:
+        script: (content, tool names) per `get_response` call; the last entry
+            repeats once the script runs out
+        tools: tool name -> async function returning the tool's text result
+        latency: seconds each `get_response` sleeps to stand in for the model
+        jitter: +/- fraction of `latency` drawn from a seeded RNG
+    """
+
+    def __init__(
+        self,
+        script: list[tuple[str | None, list[str]]],
+        tools: dict[str, ToolFn],
+        *,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0,
+        name: str = "scripted",
+    ) -> None:
+        self.script = script
+        self.tools = tools
+        self.latency = latency
+        self.jitter = jitter
+        self.model = name
+        self.system_prompt = name
+        self.console = QuietConsole()
+        self.config = _Config()
+        self.ctx: Any = None
+        self._initialized = True
+        self._available_tools: list[Any] = []
+        self._rng = random.Random(seed)
+        self._turn = 0
+        # Seconds spent in fake model calls and in tool calls
+        self.model_time = 0.0
+        self.tool_time = 0.0
+
+    async def get_system_messages(self) -> list[Any]:
+        return [{"role": "system", "content": self.system_prompt}]
+
+    async def format_blocks(self, blocks: list[Any]) -> list[Any]:
+        content = [
+            {"type": "text", "text": getattr(b, "text", None) or b.get("text", "")}
+            if not isinstance(b, str)
+            else {"type": "text", "text": b}
+            for b in blocks
+        ]
+        return [{"role": "user", "content": content}]
+
+    async def format_message(self, message: Any) -> list[Any]:
+        if not isinstance(message, list):
+            message = [message]
+        return await self.format_blocks(message)
+
+    async def format_tool_results(
+        self, tool_calls: list[MCPToolCall], tool_results: list[MCPToolResult]
+    ) -> list[Any]:
+        return [
+            {
+                "role": "tool",
+                "tool_call_id": call.id,
+                "content": [block.text for block in result.content],
+            }
+            for call, result in zip(tool_calls, tool_results, strict=False)
+        ]
+
+    async def get_response(self, messages: list[Any]) -> InferenceResult:
+        start = time.perf_counter()
+        if self.latency:
+            spread = self.latency * self.jitter
+            await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-spread, spread)))
+        content, tool_names = self.script[min(self._turn, len(self.script) - 1)]
+        self._turn += 1
+        calls = [
+            MCPToolCall(id=f"{self.model}-{self._turn}-{i}", name=name, arguments={})
+            for i, name in enumerate(tool_names)
+        ]
+        messages.append({"role": "assistant", "content": content or "", "tool_calls": tool_names})
+        self.model_time += time.perf_counter() - start
+        return InferenceResult(content=content, tool_calls=calls, done=not calls)
+
+    async def call_tools(self, tool_call: Any = None) -> list[MCPToolResult]:
+        if tool_call is None:
+            return []
+        if isinstance(tool_call, MCPToolCall):
+            tool_call = [tool_call]
+        start = time.perf_counter()
+        results = []
+        for call in tool_call:
+            text = await self.tools[call.name]()
+            results.append(MCPToolResult(content=[TextContent(type="text", text=text)]))
+        self.tool_time += time.perf_counter() - start
+        return results
+
+    def get_tool_schemas(self) -> list[dict[str, Any]]:
+        return [{"name": name} for name in sorted(self.tools)]
+
+    async def _cleanup(self) -> None:
+        self.ctx = None
@@ -1,12 +1,25 @@
+import asyncio
+import json
 import logging
-import sys
 import os
-import httpx
+import sys
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
 from typing import Any
 
 from hud import Environment
 
-from prompts import AGENT_INSTRUCTION
+from backend.appliances import ApplianceLayout, generate_episode
+from backend.client import (
+    IN_PROCESS_TRANSPORTS,
+    BatchCoalescer,
+    backend_transport,
+    make_backend_client,
+)
+from backend.events import StatusCache
+from backend.store import DEFAULT_EPISODE, EPISODE_HEADER
+from prompts import AGENT_INSTRUCTION, appliance_agent_instruction, appliance_user_instruction
 
 logging.basicConfig(
     stream=sys.stderr,
@@ -19,67 +32,330 @@ for logger_name in ["httpx", "httpcore"]:
     
 logger = logging.getLogger(__name__)
 
-AGENT_BACKEND_PORT = os.getenv("AGENT_BACKEND_PORT", "8001")
-USER_BACKEND_PORT = os.getenv("USER_BACKEND_PORT", "8002")
-AGENT_BACKEND_URL = f"http://localhost:{AGENT_BACKEND_PORT}"
-USER_BACKEND_URL = f"http://localhost:{USER_BACKEND_PORT}"
+# BACKEND_TRANSPORT: http (default), uds, asgi or direct; pool, retry and
+# circuit breaker settings come from BACKEND_* variables (see backend/client.py)
+agent_client = make_backend_client("agent")
+user_client = make_backend_client("user")
+
+# Per-call deadlines (seconds): tools fail fast instead of stalling the episode
+TOOL_DEADLINE = float(os.getenv("TOOL_DEADLINE", "2.0"))
+SCENARIO_DEADLINE = float(os.getenv("SCENARIO_DEADLINE", "10.0"))
 
-agent_client = httpx.AsyncClient(base_url=AGENT_BACKEND_URL, timeout=10.0)
-user_client = httpx.AsyncClient(base_url=USER_BACKEND_URL, timeout=10.0)
+# Concurrent tool calls of an episode share one /batch round trip per backend
+COALESCE_WINDOW = float(os.getenv("BACKEND_COALESCE_WINDOW", "0"))
+agent_batch = BatchCoalescer(agent_client, reads={"state"}, window=COALESCE_WINDOW)
+user_batch = BatchCoalescer(user_client, reads={"check_status"}, window=COALESCE_WINDOW)
+
+# check_status answers are cached until the state store reports a change
+# (STATUS_CACHE=0 disables it): through store callbacks with an in-process
+# transport, the user backend's /events stream otherwise (started in init)
+status_cache = StatusCache()
+STATUS_CACHE = os.getenv("STATUS_CACHE", "1") != "0"
+if STATUS_CACHE and backend_transport() in IN_PROCESS_TRANSPORTS:
+    from backend.store import store as _store
+
+    status_cache.follow_store(_store)
 
 env = Environment(name="multi-turn")
 
+# Explicit episode for in-process drivers (benchmarks, batch workers) calling tools directly
+current_episode: ContextVar[str | None] = ContextVar("current_episode", default=None)
+
+
+def _episode() -> str:
+    """Backend namespace for the current episode.
+
+    Scenarios and tools of one episode share an MCP session, so its ID keys the
+    backend state. Calls outside a request fall back to the default namespace.
+    """
+    episode = current_episode.get()
+    if episode is None:
+        try:
+            from fastmcp.server.dependencies import get_context
+
+            episode = get_context().session_id or DEFAULT_EPISODE
+        except (ImportError, RuntimeError, AttributeError):
+            episode = DEFAULT_EPISODE
+    return episode
+
+
+def _episode_headers() -> dict[str, str]:
+    return {EPISODE_HEADER: _episode()}
+
+
 @env.tool()
 async def agent_switch() -> str:
     """Flip agent switch"""
-    _ = await agent_client.post("/switch")
+    episode = _episode()
+    try:
+        await agent_batch.submit(episode, "switch", deadline=TOOL_DEADLINE)
+    finally:
+        # Don't wait for the change notification; a status read overlapping
+        # the flip may have cached the old value
+        status_cache.invalidate(episode)
     return "agent_switch flipped"
 
 @env.tool()
 async def user_switch() -> str:
     """Flip user switch"""
-    _ = await user_client.post("/switch")
+    episode = _episode()
+    try:
+        await user_batch.submit(episode, "switch", deadline=TOOL_DEADLINE)
+    finally:
+        status_cache.invalidate(episode)
     return "user_switch flipped"
 
 @env.tool()
 async def check_status() -> str:
     """Check if the bulb is currently lighting. Returns whether bulb is ON or OFF."""
-    response = await user_client.get("/check_status")
-    response.raise_for_status()
-
-    # Check if response has content
-    if not response.content:
-        logger.error("check_status: Empty response from user backend")
-        return "Error: Unable to check bulb status"
-
-    result = response.json()
-    bulb_on = result.get("bulb_on", False)
+    episode = _episode()
+    bulb_on = await status_cache.get(
+        episode,
+        lambda: user_batch.submit(episode, "check_status", deadline=TOOL_DEADLINE),
+    )
     return f"The bulb is {'ON' if bulb_on else 'OFF'}"
     
+# Episode namespace used once at startup to exercise the state path
+WARMUP_EPISODE = "__warmup__"
+
+
+async def _warm_state_path() -> None:
+    """Reset, read and release a throwaway episode, each call bounded by its deadline."""
+    headers = {EPISODE_HEADER: WARMUP_EPISODE}
+    await agent_client.post("/reset", headers=headers, deadline=SCENARIO_DEADLINE, idempotent=True)
+    try:
+        await user_client.post(
+            "/batch",
+            headers=headers,
+            json={"ops": ["check_status"]},
+            deadline=SCENARIO_DEADLINE,
+            idempotent=True,
+        )
+    finally:
+        await agent_client.post(
+            "/release", headers=headers, deadline=SCENARIO_DEADLINE, idempotent=True
+        )
+
+
 @env.initialize
 async def init() -> None:
-    """Init"""
-    (await agent_client.get("/health")).raise_for_status()
-    (await user_client.get("/health")).raise_for_status()
+    """Wait for the backends, then warm connections and state before the first scenario"""
+    start = time.perf_counter()
+    # The backends may still be starting next to us (scripts/start.sh does not wait)
+    waited = await asyncio.gather(agent_client.wait_ready(), user_client.wait_ready())
+    if STATUS_CACHE and backend_transport() not in IN_PROCESS_TRANSPORTS:
+        status_cache.follow_events(user_client.client)
+    await asyncio.gather(agent_client.prewarm(), user_client.prewarm())
+    try:
+        await _warm_state_path()
+    except Exception as e:
+        # Only a warmup; the first scenario pays for it instead
+        logger.warning(f"State path warmup failed: {e!r}")
+    logger.info(
+        f"Backends ready after {max(waited):.3f}s, warmed up in "
+        f"{time.perf_counter() - start - max(waited):.3f}s"
+    )
     
 @env.shutdown
 async def cleanup() -> None:
     """Close HTTP client on shutdown."""
+    status_cache.stop_following()
     await agent_client.aclose()
     await user_client.aclose()
     
+async def snapshot_state(snapshot_id: str | None = None, episode: str | None = None) -> str:
+    """Snapshot the switches of an episode (the current one by default).
+
+    Pass the returned ID as the `bulb` scenario's `snapshot` argument to start
+    episodes from this state, e.g. to fork several continuations of one run.
+    """
+    response = await agent_client.post(
+        "/snapshot",
+        headers={EPISODE_HEADER: episode or _episode()},
+        json={"snapshot_id": snapshot_id},
+        deadline=SCENARIO_DEADLINE,
+        idempotent=snapshot_id is not None,
+    )
+    return response.json()["snapshot_id"]
+
+
+@env.tool()
+async def _checkpoint_state() -> str:
+    """Snapshot the switches for checkpointing.
+
+    The underscore keeps it out of the agents' tool lists, like hud's own
+    `_hud_submit`; the eval driver calls it by name. Returns JSON holding
+    the `state` itself. The `bulb` scenario's `state` argument restores it,
+    even after the backends restarted.
+    """
+    response = await agent_client.post(
+        "/snapshot",
+        headers=_episode_headers(),
+        json={"keep": False},
+        deadline=TOOL_DEADLINE,
+        idempotent=True,
+    )
+    return json.dumps(response.json())
+
+
+async def drop_snapshot(snapshot_id: str) -> None:
+    """Forget a snapshot once all episodes forked from it have started."""
+    await agent_client.post(
+        "/drop_snapshot",
+        json={"snapshot_id": snapshot_id},
+        deadline=SCENARIO_DEADLINE,
+        idempotent=True,
+    )
+
+
 @env.scenario("bulb")
-async def bulb() -> Any:
-    """Bulb control scenario"""
-    await agent_client.post("/reset")
+async def bulb(snapshot: str | None = None, state: dict[str, bool] | None = None) -> Any:
+    """Bulb control scenario, starting from a snapshot ID or saved state if given"""
+    headers = _episode_headers()
+    if snapshot or state:
+        await agent_client.post(
+            "/restore",
+            headers=headers,
+            json={"snapshot_id": snapshot, "state": state},
+            deadline=SCENARIO_DEADLINE,
+            idempotent=True,
+        )
+    else:
+        await agent_client.post(
+            "/reset", headers=headers, deadline=SCENARIO_DEADLINE, idempotent=True
+        )
+    status_cache.invalidate(headers[EPISODE_HEADER])
     
     _ = yield AGENT_INSTRUCTION
 
-    response = await agent_client.get("/state")
+    response = await agent_client.get("/state", headers=headers, deadline=SCENARIO_DEADLINE)
     current = response.json()
+    await agent_client.post(
+        "/release", headers=headers, deadline=SCENARIO_DEADLINE, idempotent=True
+    )
 
     yield int(current)
 
 
+# Generated appliance scenario (backend/appliances.py), e.g. APPLIANCE_LAYOUT=50x4:majority.
+# Its tools (one per switch, one status check per appliance) are registered when this
+# module is imported, so the variable must be set in the environment of the env
+# process before it starts; the `appliances` scenario rejects any other layout.
+_appliance_spec = os.getenv("APPLIANCE_LAYOUT")
+APPLIANCE_LAYOUT = ApplianceLayout.parse(_appliance_spec) if _appliance_spec else None
+
+
+def _appliance_switch_tool(layout: ApplianceLayout, appliance: int, switch: int) -> Any:
+    client = agent_client if layout.owner(switch) == "agent" else user_client
+    name = layout.switch_tool(appliance, switch)
+
+    async def flip() -> str:
+        await client.post(
+            "/appliances/switch",
+            headers=_episode_headers(),
+            json={"appliance": appliance, "switch": switch},
+            deadline=TOOL_DEADLINE,
+        )
+        return f"{name} flipped"
+
+    flip.__name__ = name
+    return flip
+
+
+def _appliance_status_tool(appliance: int) -> Any:
+    async def check() -> str:
+        response = await user_client.post(
+            "/appliances/check_status",
+            headers=_episode_headers(),
+            json={"appliance": appliance},
+            deadline=TOOL_DEADLINE,
+            idempotent=True,
+        )
+        return f"Appliance {appliance} is {'ON' if response.json()['on'] else 'OFF'}"
+
+    check.__name__ = f"check_status_{appliance}"
+    return check
+
+
+def register_appliance_tools(layout: ApplianceLayout) -> None:
+    for appliance in range(layout.appliances):
+        for switch in range(layout.switches):
+            env.tool(
+                name=layout.switch_tool(appliance, switch),
+                description=f"Flip {layout.owner(switch)} switch {switch} of appliance {appliance}",
+            )(_appliance_switch_tool(layout, appliance, switch))
+        env.tool(
+            name=layout.status_tool(appliance),
+            description=f"Check if appliance {appliance} is currently on. Returns ON or OFF.",
+        )(_appliance_status_tool(appliance))
+
+
+if APPLIANCE_LAYOUT is not None:
+    register_appliance_tools(APPLIANCE_LAYOUT)
+
+
+@env.scenario("appliances")
+async def appliances(layout: str, seed: int = 0, targets: int = 1) -> Any:
+    """Turn on `targets` generated appliances; reward is the fraction that end up on"""
+    spec = ApplianceLayout.parse(layout)
+    if spec != APPLIANCE_LAYOUT:
+        registered = APPLIANCE_LAYOUT.spec if APPLIANCE_LAYOUT else "unset"
+        raise ValueError(f"Layout {spec.spec} needs APPLIANCE_LAYOUT={spec.spec} (is {registered})")
+    masks, chosen = generate_episode(spec, seed, targets)
+    headers = _episode_headers()
+    await agent_client.post(
+        "/appliances/reset",
+        headers=headers,
+        json={"layout": spec.spec, "masks": masks},
+        deadline=SCENARIO_DEADLINE,
+        idempotent=True,
+    )
+
+    _ = yield appliance_agent_instruction(spec)
+
+    response = await agent_client.get(
+        "/appliances/state", headers=headers, deadline=SCENARIO_DEADLINE
+    )
+    on = set(response.json()["on"])
+    await agent_client.post(
+        "/release", headers=headers, deadline=SCENARIO_DEADLINE, idempotent=True
+    )
+
+    yield sum(appliance in on for appliance in chosen) / len(chosen)
+
+
+@dataclass
+class ApplianceTask:
+    """One generated appliance task with what its driver needs besides the task."""
+
+    task: Any
+    user_instruction: str
+    agent_tools: list[str]
+    user_tools: list[str]
+
+
+def appliance_tasks(
+    layout: ApplianceLayout, count: int, *, targets: int = 1, seed: int = 0
+) -> list[ApplianceTask]:
+    """Tasks for the `appliances` scenario on `layout` (which must be APPLIANCE_LAYOUT).
+
+    Create the agent with `agent_tools` as allowed tools, and the simulated
+    user with `user_instruction` as system prompt and `user_tools`.
+    """
+    agent_tools, user_tools = layout.tools_of("agent"), layout.tools_of("user")
+    tasks = []
+    for index in range(count):
+        _, chosen = generate_episode(layout, seed + index, targets)
+        tasks.append(
+            ApplianceTask(
+                task=env("appliances", layout=layout.spec, seed=seed + index, targets=targets),
+                user_instruction=appliance_user_instruction(layout, chosen),
+                agent_tools=agent_tools,
+                user_tools=user_tools,
+            )
+        )
+    return tasks
+
+
 if __name__ == "__main__":
     env.run(transport="stdio")
\ No newline at end of file
@@ -1,6 +1,6 @@
 """Local test script for the blank environment.
 
-Run the backend first: uvicorn backend.app:app --port 8005
+Run the backends first: python -m backend.serve
 Then run this script: python local_test.py
 """
 
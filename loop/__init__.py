@@ -1 +1,80 @@
-from .multi_turn import multi_turn_run
\ No newline at end of file
+"""Multi-turn agent loop.
+
+Names are imported from their submodules on first use, so e.g.
+`loop.analytics` or `loop.checkpoint` can be used without importing `hud`,
+and scripts only pay for the parts they touch.
+"""
+
+import importlib
+from typing import TYPE_CHECKING, Any
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    "EpisodeTable": "analytics",
+    "percentiles": "analytics",
+    "BudgetExceeded": "budget",
+    "EpisodeBudget": "budget",
+    "CacheMiss": "cache",
+    "ResponseCache": "cache",
+    "BatchItem": "coalesce",
+    "RequestCoalescer": "coalesce",
+    "concurrent_batch_call": "coalesce",
+    "CheckpointStore": "checkpoint",
+    "EpisodeCheckpoint": "checkpoint",
+    "tool_snapshot_hook": "checkpoint",
+    "ContextCompactor": "compaction",
+    "agent_summarizer": "compaction",
+    "extractive_summarizer": "compaction",
+    "LoopConsole": "console",
+    "ModelPrice": "metrics",
+    "OTelExporter": "metrics",
+    "PrometheusMetrics": "metrics",
+    "multi_turn_run": "multi_turn",
+    "ResumePoint": "resume",
+    "ModelLimits": "scheduler",
+    "RetryPolicy": "scheduler",
+    "Scheduler": "scheduler",
+    "StopScanner": "streaming",
+    "StopStreaming": "streaming",
+    "ToolRegistry": "tool_registry",
+    "ToolSet": "tool_registry",
+    "shared_tool_registry": "tool_registry",
+    "ToolPolicy": "tools",
+    "JSONLTraceWriter": "trace_writer",
+    "TraceWriter": "trace_writer",
+    "load_episode": "trace_writer",
+    "read_trace_records": "trace_writer",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
+
+
+if TYPE_CHECKING:
+    from .analytics import EpisodeTable, percentiles
+    from .budget import BudgetExceeded, EpisodeBudget
+    from .cache import CacheMiss, ResponseCache
+    from .coalesce import BatchItem, RequestCoalescer, concurrent_batch_call
+    from .checkpoint import CheckpointStore, EpisodeCheckpoint, tool_snapshot_hook
+    from .compaction import ContextCompactor, agent_summarizer, extractive_summarizer
+    from .console import LoopConsole
+    from .metrics import ModelPrice, OTelExporter, PrometheusMetrics
+    from .multi_turn import multi_turn_run
+    from .resume import ResumePoint
+    from .scheduler import ModelLimits, RetryPolicy, Scheduler
+    from .streaming import StopScanner, StopStreaming
+    from .tool_registry import ToolRegistry, ToolSet, shared_tool_registry
+    from .tools import ToolPolicy
+    from .trace_writer import JSONLTraceWriter, TraceWriter, load_episode, read_trace_records
@@ -0,0 +1,394 @@
+"""Columnar analytics over many episodes.
+
+`EpisodeTable` holds one NumPy column per metric (reward, error flag,
+steps, stop-signal step, duration, tokens, tool calls per tool) plus the
+flattened per-step latencies, so aggregates over a whole eval run are
+vectorized instead of loops over message lists. Tables are built from
+streamed trace files, batch result files or `Trace` objects; only the end
+record of each episode is read, never its messages.
+
+`summarize(table)` returns reward means with confidence intervals, the
+success rate with its Wilson interval, latency percentiles and tool-call
+counts per episode; `summarize_by(table, "model")` does the same per group.
+
+Needs NumPy: pip install hud-multiturn[analytics]. `percentiles` does not,
+and is shared with the batch report and the benchmarks.
+"""
+
+import json
+import logging
+import math
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from statistics import NormalDist
+from typing import Any
+
+from .trace_writer import read_trace_records
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PERCENTILES = (50, 90, 99)
+
+
+def _numpy() -> Any:
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError(
+            "Trace analytics require numpy: pip install hud-multiturn[analytics]"
+        ) from e
+    return numpy
+
+
+@dataclass
+class EpisodeTable:
+    """One row per episode, stored column-wise.
+
+    `stop_step` is -1 for episodes not ended by the user's stop signal,
+    `reward` is NaN where no reward is known. `tool_calls[i, j]` counts
+    calls of `tools[j]` in episode i. `step_wall[k]` is the wall time of a
+    step of episode `step_episode[k]`.
+    """
+
+    episode: Any
+    model: Any
+    reward: Any
+    is_error: Any
+    steps: Any
+    stop_step: Any
+    duration: Any
+    agent_tokens: Any
+    user_tokens: Any
+    tool_calls: Any
+    tools: list[str]
+    step_wall: Any
+    step_episode: Any
+
+    def __len__(self) -> int:
+        return len(self.reward)
+
+    @classmethod
+    def from_trace_files(
+        cls,
+        paths: "str | Path | Iterable[str | Path]",
+        *,
+        results: "str | Path | Iterable[dict[str, Any]] | None" = None,
+    ) -> "EpisodeTable":
+        """Load the end records of trace files written by `JSONLTraceWriter`.
+
+        `paths` may be a file, a directory (every `*.jsonl` / `*.jsonl.gz`
+        in it) or a list of files. Trace files carry no rewards; pass the
+        batch `results` (a `--results` JSONL file or its records) to join
+        them in by episode ID.
+        """
+        rewards = _rewards_by_episode(results) if results is not None else {}
+        builder = _TableBuilder()
+        for path in _trace_paths(paths):
+            for record in read_trace_records(path):
+                if record.get("type") != "end":
+                    continue
+                episode = record.get("episode")
+                builder.add(
+                    episode,
+                    record.get("info") or {},
+                    reward=rewards.get(episode),
+                    is_error=bool(record.get("isError")),
+                )
+        return builder.build()
+
+    @classmethod
+    def from_results(cls, results: "str | Path | Iterable[dict[str, Any]]") -> "EpisodeTable":
+        """Load batch results (`run_batch(results_path=...)` lines or dicts).
+
+        Results only carry reward, errors, steps and duration; the other
+        columns stay empty. Use `from_trace_files(..., results=...)` for all
+        of them.
+        """
+        builder = _TableBuilder()
+        for result in _iter_results(results):
+            builder.add(
+                _result_episode(result),
+                {},
+                reward=result.get("reward"),
+                is_error=bool(result.get("is_error")),
+                steps=result.get("steps"),
+                duration=result.get("duration"),
+            )
+        return builder.build()
+
+    @classmethod
+    def from_traces(
+        cls, traces: Iterable[Any], *, rewards: Iterable[float | None] | None = None
+    ) -> "EpisodeTable":
+        """Load `Trace` objects returned by `multi_turn_run`.
+
+        Their `reward` is a placeholder (the scenario scores the episode
+        afterwards), so pass the real ones, e.g. `ctx.reward` per episode.
+        """
+        builder = _TableBuilder()
+        reward_iter = iter(rewards) if rewards is not None else None
+        for index, trace in enumerate(traces):
+            info = trace.info or {}
+            episode = (info.get("trace_ref") or {}).get("episode") or str(index)
+            builder.add(
+                episode,
+                info,
+                reward=next(reward_iter) if reward_iter is not None else None,
+                is_error=bool(trace.isError),
+            )
+        return builder.build()
+
+    def select(self, mask: Any) -> "EpisodeTable":
+        """Rows where the boolean `mask` is set."""
+        np = _numpy()
+        mask = np.asarray(mask, dtype=bool)
+        columns = {
+            f.name: getattr(self, f.name)[mask]
+            for f in fields(self)
+            if f.name not in ("tools", "step_wall", "step_episode")
+        }
+        # Renumber the step rows of the kept episodes
+        new_index = np.cumsum(mask) - 1
+        step_mask = mask[self.step_episode]
+        return EpisodeTable(
+            **columns,
+            tools=self.tools,
+            step_wall=self.step_wall[step_mask],
+            step_episode=new_index[self.step_episode[step_mask]],
+        )
+
+
+@dataclass
+class _TableBuilder:
+    """Row-wise Python lists, turned into arrays once at the end."""
+
+    episode: list[str] = field(default_factory=list)
+    model: list[str] = field(default_factory=list)
+    reward: list[float] = field(default_factory=list)
+    is_error: list[bool] = field(default_factory=list)
+    steps: list[int] = field(default_factory=list)
+    stop_step: list[int] = field(default_factory=list)
+    duration: list[float] = field(default_factory=list)
+    agent_tokens: list[int] = field(default_factory=list)
+    user_tokens: list[int] = field(default_factory=list)
+    # Sparse (row, tool column, count) triples
+    tool_rows: list[int] = field(default_factory=list)
+    tool_cols: list[int] = field(default_factory=list)
+    tool_counts: list[int] = field(default_factory=list)
+    tools: dict[str, int] = field(default_factory=dict)
+    step_wall: list[float] = field(default_factory=list)
+    step_episode: list[int] = field(default_factory=list)
+
+    def add(
+        self,
+        episode: str | None,
+        info: dict[str, Any],
+        *,
+        reward: float | None,
+        is_error: bool,
+        steps: int | None = None,
+        duration: float | None = None,
+    ) -> None:
+        row = len(self.reward)
+        walls = [step.get("wall", 0.0) for step in info.get("steps", ())]
+        usage = info.get("usage") or {}
+        agent_usage = usage.get("agent") or {}
+        user_usage = usage.get("user") or {}
+        self.episode.append(str(episode) if episode is not None else str(row))
+        self.model.append(str(agent_usage.get("model") or ""))
+        self.reward.append(math.nan if reward is None else float(reward))
+        self.is_error.append(is_error or "error" in info)
+        self.steps.append(steps if steps is not None else len(walls))
+        self.stop_step.append(info.get("stop_step") or -1)
+        if duration is None:
+            duration = info.get("duration", sum(walls))
+        self.duration.append(float(duration))
+        self.agent_tokens.append(_total_tokens(agent_usage))
+        self.user_tokens.append(_total_tokens(user_usage))
+        for tool, count in (info.get("tool_calls") or {}).items():
+            self.tool_rows.append(row)
+            self.tool_cols.append(self.tools.setdefault(tool, len(self.tools)))
+            self.tool_counts.append(count)
+        self.step_wall.extend(walls)
+        self.step_episode.extend([row] * len(walls))
+
+    def build(self) -> EpisodeTable:
+        np = _numpy()
+        tool_calls = np.zeros((len(self.reward), len(self.tools)), dtype=np.int64)
+        np.add.at(
+            tool_calls,
+            (np.asarray(self.tool_rows, dtype=np.intp), np.asarray(self.tool_cols, dtype=np.intp)),
+            np.asarray(self.tool_counts, dtype=np.int64),
+        )
+        return EpisodeTable(
+            episode=np.asarray(self.episode, dtype=object),
+            model=np.asarray(self.model, dtype=object),
+            reward=np.asarray(self.reward, dtype=np.float64),
+            is_error=np.asarray(self.is_error, dtype=bool),
+            steps=np.asarray(self.steps, dtype=np.int32),
+            stop_step=np.asarray(self.stop_step, dtype=np.int32),
+            duration=np.asarray(self.duration, dtype=np.float64),
+            agent_tokens=np.asarray(self.agent_tokens, dtype=np.int64),
+            user_tokens=np.asarray(self.user_tokens, dtype=np.int64),
+            tool_calls=tool_calls,
+            tools=list(self.tools),
+            step_wall=np.asarray(self.step_wall, dtype=np.float64),
+            step_episode=np.asarray(self.step_episode, dtype=np.intp),
+        )
+
+
+def _total_tokens(usage: dict[str, Any]) -> int:
+    return int(usage.get("input_tokens", 0)) + int(usage.get("output_tokens", 0))
+
+
+def _trace_paths(paths: "str | Path | Iterable[str | Path]") -> list[Path]:
+    if isinstance(paths, (str, Path)):
+        path = Path(paths)
+        if path.is_dir():
+            return sorted([*path.glob("*.jsonl"), *path.glob("*.jsonl.gz")])
+        return [path]
+    return [Path(path) for path in paths]
+
+
+def _iter_results(results: "str | Path | Iterable[dict[str, Any]]") -> Iterator[dict[str, Any]]:
+    if not isinstance(results, (str, Path)):
+        yield from results
+        return
+    with open(results) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping malformed result line in {results}")
+                continue
+            if record.get("type", "result") == "result":
+                yield record
+
+
+def _result_episode(result: dict[str, Any]) -> str | None:
+    trace_ref = result.get("trace_ref") or {}
+    if trace_ref.get("episode"):
+        return trace_ref["episode"]
+    if result.get("index") is not None:
+        return str(result["index"])
+    return None
+
+
+def _rewards_by_episode(results: "str | Path | Iterable[dict[str, Any]]") -> dict[str, float]:
+    return {
+        episode: result["reward"]
+        for result in _iter_results(results)
+        if (episode := _result_episode(result)) is not None and result.get("reward") is not None
+    }
+
+
+def _z(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def mean_ci(values: Any, confidence: float = 0.95) -> dict[str, float]:
+    """Mean with a normal-approximation confidence interval, ignoring NaNs."""
+    np = _numpy()
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    n = len(values)
+    if n == 0:
+        return {"n": 0, "mean": math.nan, "std": math.nan, "ci_low": math.nan, "ci_high": math.nan}
+    mean = float(values.mean())
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    half = _z(confidence) * std / math.sqrt(n)
+    return {"n": n, "mean": mean, "std": std, "ci_low": mean - half, "ci_high": mean + half}
+
+
+def wilson_ci(successes: int, n: int, confidence: float = 0.95) -> dict[str, float]:
+    """Success rate with its Wilson score interval (sound near 0 and 1)."""
+    if n == 0:
+        return {"n": 0, "rate": math.nan, "ci_low": math.nan, "ci_high": math.nan}
+    z = _z(confidence)
+    rate = successes / n
+    denominator = 1 + z * z / n
+    center = (rate + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(rate * (1 - rate) / n + z * z / (4 * n * n)) / denominator
+    return {"n": n, "rate": rate, "ci_low": center - half, "ci_high": center + half}
+
+
+def percentiles(
+    values: Iterable[float],
+    qs: Iterable[float] = DEFAULT_PERCENTILES,
+    *,
+    empty: float = math.nan,
+) -> dict[str, float]:
+    """Percentiles of `values` keyed "p50", "p99", ..., `empty` for no values.
+
+    Interpolates linearly between ranks like `numpy.percentile`, but needs
+    no NumPy, so batch reports and benchmarks use it too.
+    """
+    ordered = sorted(float(v) for v in values)
+    result = {}
+    for q in qs:
+        if not ordered:
+            result[f"p{q:g}"] = empty
+            continue
+        rank = q / 100 * (len(ordered) - 1)
+        low = math.floor(rank)
+        high = min(low + 1, len(ordered) - 1)
+        result[f"p{q:g}"] = ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+    return result
+
+
+def summarize(
+    table: EpisodeTable,
+    *,
+    confidence: float = 0.95,
+    qs: Iterable[float] = DEFAULT_PERCENTILES,
+) -> dict[str, Any]:
+    """Aggregate metrics of a table.
+
+    Success means a reward above 0, as in the batch report; episodes
+    without a reward count as failures.
+    """
+    np = _numpy()
+    qs = list(qs)
+    n = len(table)
+    stopped = table.stop_step[table.stop_step >= 0]
+    per_episode = table.tool_calls.sum(axis=1)
+    return {
+        "episodes": n,
+        "errors": int(table.is_error.sum()),
+        "reward": mean_ci(table.reward, confidence),
+        "success": wilson_ci(int((table.reward > 0).sum()), n, confidence),
+        "steps": {"mean": float(table.steps.mean()) if n else math.nan, **percentiles(table.steps, qs)},
+        "stop_step": {
+            "stopped": len(stopped),
+            "mean": float(stopped.mean()) if len(stopped) else math.nan,
+            # counts[k] episodes were stopped at step k
+            "counts": np.bincount(stopped).tolist() if len(stopped) else [],
+        },
+        "duration_s": percentiles(table.duration, qs),
+        "step_latency_s": percentiles(table.step_wall, qs),
+        "tool_calls_per_episode": {
+            "mean": float(per_episode.mean()) if n else math.nan,
+            **percentiles(per_episode, qs),
+            "by_tool": {
+                tool: float(mean)
+                for tool, mean in zip(table.tools, table.tool_calls.mean(axis=0) if n else [])
+            },
+        },
+        "tokens_per_episode": {
+            "agent": float(table.agent_tokens.mean()) if n else math.nan,
+            "user": float(table.user_tokens.mean()) if n else math.nan,
+        },
+    }
+
+
+def summarize_by(table: EpisodeTable, column: str = "model", **kwargs: Any) -> dict[str, Any]:
+    """`summarize` per distinct value of a column, e.g. per agent model."""
+    np = _numpy()
+    values = getattr(table, column)
+    keys, inverse = np.unique(values.astype(str), return_inverse=True)
+    return {
+        str(key): summarize(table.select(inverse == i), **kwargs) for i, key in enumerate(keys)
+    }
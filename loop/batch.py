@@ -0,0 +1,326 @@
+"""Process-parallel batch runner for multi-turn episodes.
+
+Episodes of a dataset are sharded across worker processes. Each worker has
+its own event loop (and, with an in-process backend transport, its own
+backend state) and runs its shard with bounded concurrency, streaming one
+result per episode back to the parent, which aggregates them into a report.
+
+With a checkpoint directory every episode is checkpointed after each turn
+(see `loop.checkpoint`), and rerunning the same batch skips finished
+episodes and continues interrupted ones from their last turn.
+"""
+
+import asyncio
+import contextlib
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import time
+from collections.abc import Callable, Collection
+from typing import Any
+
+from .analytics import percentiles
+
+logger = logging.getLogger(__name__)
+
+# Picklable (module-level) callable returning a fresh (agent, simulated_user) pair
+AgentFactory = Callable[[], tuple[Any, Any]]
+
+
+async def _run_shard(
+    worker_id: int,
+    workers: int,
+    dataset: str,
+    make_agents: AgentFactory,
+    concurrency: int,
+    run_kwargs: dict[str, Any],
+    traces_dir: str | None,
+    checkpoint_dir: str | None,
+    snapshot_tool: str | None,
+    state_scenarios: Collection[str],
+    results: Any,
+) -> None:
+    """Run every `workers`-th task of the dataset, starting at `worker_id`."""
+    import hud
+    from hud.datasets import load_tasks
+
+    from .checkpoint import CheckpointStore, tool_snapshot_hook
+    from .multi_turn import multi_turn_run
+    from .trace_writer import JSONLTraceWriter
+
+    tasks = load_tasks(dataset)
+    semaphore = asyncio.Semaphore(concurrency)
+    trace_writer = (
+        JSONLTraceWriter(os.path.join(traces_dir, f"worker-{worker_id}.jsonl.gz"))
+        if traces_dir
+        else None
+    )
+    if trace_writer is not None:
+        run_kwargs = {**run_kwargs, "trace_writer": trace_writer}
+    checkpoints = CheckpointStore(checkpoint_dir) if checkpoint_dir else None
+
+    async def run_one(index: int, task: Any) -> None:
+        async with semaphore:
+            checkpoint = None
+            episode_kwargs = run_kwargs
+            if checkpoints is not None:
+                checkpoint = checkpoints.episode(_episode_key(index, task))
+                saved = checkpoint.load()
+                if saved is not None and saved.get("status") == "done":
+                    results.put({**saved["result"], "worker": worker_id, "resumed": True})
+                    return
+                if saved is not None and saved.get("state") is not None:
+                    if _takes_state(task, state_scenarios):
+                        # Restart the scenario from the checkpointed backend state
+                        task = task.model_copy(
+                            update={"args": {**(task.args or {}), "state": saved["state"]}}
+                        )
+                    elif saved.get("status") == "running":
+                        # Resuming would pair the saved turns with a fresh backend
+                        logger.info(f"Episode {index}: scenario cannot restore state, restarting")
+                        await checkpoint.clear()
+                episode_kwargs = {**run_kwargs, "checkpoint": checkpoint}
+            start = time.monotonic()
+            agent, simulated_user = make_agents()
+            trace = None
+            error = None
+            try:
+                scheduler = episode_kwargs.get("scheduler")
+                # Take the episode slot before hud.eval runs scenario setup
+                async with (
+                    scheduler.episode() if scheduler else contextlib.nullcontext(),
+                    hud.eval(task, quiet=True) as ctx,
+                ):
+                    if checkpoint is not None and snapshot_tool:
+                        episode_kwargs = {
+                            **episode_kwargs,
+                            "snapshot_hook": tool_snapshot_hook(ctx, snapshot_tool),
+                        }
+                    trace = await multi_turn_run(ctx, agent, simulated_user, **episode_kwargs)
+                reward = ctx.reward
+            except Exception as e:
+                logger.exception("Episode %d failed", index)
+                error = str(e)
+                reward = None
+            result = {
+                "type": "result",
+                "worker": worker_id,
+                "index": index,
+                "task_id": getattr(task, "id", None),
+                "reward": reward,
+                "is_error": error is not None or bool(trace and trace.isError),
+                "error": error or (trace.info.get("error") if trace else None),
+                "steps": len(trace.info.get("steps", [])) if trace else 0,
+                "duration": time.monotonic() - start,
+                "trace_ref": trace.info.get("trace_ref") if trace else None,
+            }
+            # Failed or cancelled episodes stay resumable from their last turn
+            if checkpoint is not None and result["error"] is None:
+                await checkpoint.finish(result)
+            results.put(result)
+
+    try:
+        await asyncio.gather(
+            *(
+                run_one(index, task)
+                for index, task in enumerate(tasks)
+                if index % workers == worker_id
+            )
+        )
+    finally:
+        if trace_writer is not None:
+            await trace_writer.aclose()
+
+
+def _takes_state(task: Any, state_scenarios: Collection[str]) -> bool:
+    """Whether the task's scenario has a `state` argument to restore the backend from.
+
+    Scenarios registered on an environment in this process are inspected;
+    hud keeps them in `Environment._scenarios`. Remote ones cannot be seen
+    before the eval starts them, so they are looked up in `state_scenarios`.
+    """
+    name = (getattr(task, "scenario", None) or "").rpartition(":")[2]
+    scenario = getattr(getattr(task, "env", None), "_scenarios", {}).get(name)
+    if scenario is None:
+        return name in state_scenarios
+    parameters = inspect.signature(scenario).parameters.values()
+    return any(
+        p.name == "state" or p.kind is inspect.Parameter.VAR_KEYWORD for p in parameters
+    )
+
+
+def _episode_key(index: int, task: Any) -> str:
+    """Checkpoint key that stays the same when the dataset is run again."""
+    task_id = getattr(task, "id", None)
+    return f"{index:06d}-{task_id}" if task_id else f"{index:06d}"
+
+
+def _worker_main(
+    worker_id: int,
+    workers: int,
+    dataset: str,
+    make_agents: AgentFactory,
+    concurrency: int,
+    run_kwargs: dict[str, Any],
+    traces_dir: str | None,
+    checkpoint_dir: str | None,
+    snapshot_tool: str | None,
+    state_scenarios: Collection[str],
+    env_overrides: dict[str, str],
+    results: Any,
+) -> None:
+    os.environ.update(env_overrides)
+    try:
+        asyncio.run(
+            _run_shard(
+                worker_id,
+                workers,
+                dataset,
+                make_agents,
+                concurrency,
+                run_kwargs,
+                traces_dir,
+                checkpoint_dir,
+                snapshot_tool,
+                state_scenarios,
+                results,
+            )
+        )
+    except Exception as e:
+        results.put({"type": "crash", "worker": worker_id, "error": str(e)})
+    finally:
+        results.put({"type": "done", "worker": worker_id})
+
+
+def summarize_results(results: list[dict[str, Any]], elapsed: float) -> dict[str, Any]:
+    """Aggregate per-episode results into one report."""
+    rewards = [r["reward"] for r in results if r["reward"] is not None]
+    durations = [r["duration"] for r in results]
+    per_worker: dict[int, int] = {}
+    for r in results:
+        per_worker[r["worker"]] = per_worker.get(r["worker"], 0) + 1
+    return {
+        "episodes": len(results),
+        "elapsed_s": elapsed,
+        "episodes_per_s": len(results) / elapsed if elapsed else 0.0,
+        "mean_reward": sum(rewards) / len(rewards) if rewards else 0.0,
+        "success_rate": sum(1 for r in rewards if r and r > 0) / len(results) if results else 0.0,
+        "errors": sum(1 for r in results if r["is_error"]),
+        "duration_s": percentiles(durations, (50, 99), empty=0.0),
+        "episodes_per_worker": dict(sorted(per_worker.items())),
+    }
+
+
+def run_batch(
+    dataset: str,
+    make_agents: AgentFactory,
+    *,
+    workers: int | None = None,
+    concurrency: int = 10,
+    backend_transport: str | None = None,
+    results_path: str | None = None,
+    traces_dir: str | None = None,
+    checkpoint_dir: str | None = None,
+    snapshot_tool: str | None = None,
+    state_scenarios: Collection[str] = (),
+    on_result: Callable[[dict[str, Any]], None] | None = None,
+    **run_kwargs: Any,
+) -> dict[str, Any]:
+    """Run a dataset across worker processes and return the aggregated report.
+
+    Args:
+        dataset: Dataset name passed to `hud.datasets.load_tasks` in each worker
+        make_agents: Module-level factory for a fresh (agent, simulated_user)
+        workers: Worker processes (default: CPU count)
+        concurrency: Concurrent episodes per worker
+        backend_transport: BACKEND_TRANSPORT for the workers, e.g. "direct"
+            for per-worker in-process backends when running the env locally
+        results_path: Append each episode result as a JSON line here
+        traces_dir: Stream full episode traces to one gzipped JSONL file per
+            worker here instead of keeping messages in memory
+        checkpoint_dir: Checkpoint every episode here after each turn; a rerun
+            with the same directory skips finished episodes and resumes the rest
+        snapshot_tool: Environment tool returning the backend state as JSON,
+            called after each turn so resumed episodes restore it. Only
+            scenarios taking a `state` argument, like `bulb`, can; episodes
+            of other scenarios restart instead of resuming
+        state_scenarios: Names of remote scenarios taking `state`; those of
+            environments in this process are inspected
+        on_result: Called in the parent for each episode result as it arrives
+        **run_kwargs: Passed through to `multi_turn_run`
+    """
+    workers = workers or os.cpu_count() or 1
+    # Interleaved dialog from many episodes is noise; results carry the outcome
+    run_kwargs.setdefault("quiet", True)
+    env_overrides = {"BACKEND_TRANSPORT": backend_transport} if backend_transport else {}
+    mp = multiprocessing.get_context("spawn")
+    results_queue = mp.Queue()
+    processes = [
+        mp.Process(
+            target=_worker_main,
+            args=(
+                worker_id,
+                workers,
+                dataset,
+                make_agents,
+                concurrency,
+                run_kwargs,
+                traces_dir,
+                checkpoint_dir,
+                snapshot_tool,
+                tuple(state_scenarios),
+                env_overrides,
+                results_queue,
+            ),
+            daemon=True,
+        )
+        for worker_id in range(workers)
+    ]
+
+    start = time.monotonic()
+    for process in processes:
+        process.start()
+
+    results: list[dict[str, Any]] = []
+    crashes: list[dict[str, Any]] = []
+    done: set[int] = set()
+    sink = open(results_path, "a") if results_path else None
+    try:
+        while len(done) < workers:
+            try:
+                message = results_queue.get(timeout=1.0)
+            except queue_module.Empty:
+                # A worker killed without reporting "done" would hang the run
+                for worker_id, process in enumerate(processes):
+                    if worker_id not in done and not process.is_alive():
+                        crashes.append(
+                            {"worker": worker_id, "error": f"exit code {process.exitcode}"}
+                        )
+                        done.add(worker_id)
+                continue
+            if message["type"] == "result":
+                results.append(message)
+                if sink:
+                    sink.write(json.dumps(message) + "\n")
+                    sink.flush()
+                if on_result:
+                    on_result(message)
+            elif message["type"] == "crash":
+                logger.error("Worker %d crashed: %s", message["worker"], message["error"])
+                crashes.append(message)
+            else:
+                done.add(message["worker"])
+    finally:
+        if sink:
+            sink.close()
+        for process in processes:
+            process.join(timeout=5)
+
+    report = summarize_results(results, time.monotonic() - start)
+    report["workers"] = workers
+    report["concurrency_per_worker"] = concurrency
+    report["crashed_workers"] = crashes
+    return report
@@ -0,0 +1,105 @@
+"""Wall-clock and token budgets for an episode and for each of its turns.
+
+`multi_turn_run(..., budget=EpisodeBudget(...))` runs every step under a
+deadline, the earlier of the turn's and the episode's. When it passes, the
+step is cancelled, including the LLM request or tool calls in flight.
+Token budgets count input plus output tokens of both agents and are
+checked after every LLM response. Either way the episode ends with a
+partial `Trace`. Its `info["budget"]` records what ran out and what was
+spent.
+"""
+
+import asyncio
+import contextlib
+import time
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass
+from typing import Any
+
+from .usage import TokenUsage
+
+
+@dataclass
+class EpisodeBudget:
+    """Limits for one episode; None means unlimited.
+
+    `max_user_iterations` bounds the simulated user's tool loop per turn.
+    """
+
+    episode_seconds: float | None = None
+    turn_seconds: float | None = None
+    episode_tokens: int | None = None
+    turn_tokens: int | None = None
+    max_user_iterations: int = 6
+
+
+class BudgetExceeded(Exception):
+    """An episode or turn ran out of time or tokens."""
+
+    def __init__(self, limit: str, message: str) -> None:
+        super().__init__(message)
+        # Field of `EpisodeBudget` that ran out
+        self.limit = limit
+
+
+class BudgetTracker:
+    """Spending against an `EpisodeBudget` during one episode."""
+
+    def __init__(self, budget: EpisodeBudget) -> None:
+        self.budget = budget
+        self.started = time.monotonic()
+        self.tokens = 0
+        self.turn_tokens = 0
+        self.exceeded: str | None = None
+
+    def _fail(self, limit: str, message: str) -> BudgetExceeded:
+        self.exceeded = limit
+        return BudgetExceeded(limit, message)
+
+    @contextlib.asynccontextmanager
+    async def turn(self) -> AsyncIterator[None]:
+        """Run one turn, cancelling it at the turn or episode deadline."""
+        self.turn_tokens = 0
+        now = time.monotonic()
+        deadlines = []
+        if self.budget.episode_seconds is not None:
+            deadlines.append((self.started + self.budget.episode_seconds, "episode_seconds"))
+        if self.budget.turn_seconds is not None:
+            deadlines.append((now + self.budget.turn_seconds, "turn_seconds"))
+        if not deadlines:
+            yield
+            return
+        deadline, limit = min(deadlines)
+        if deadline <= now:
+            raise self._fail(limit, f"Episode ran out of time ({limit})")
+        loop = asyncio.get_running_loop()
+        try:
+            async with asyncio.timeout_at(loop.time() + (deadline - now)) as scope:
+                yield
+        except TimeoutError:
+            if scope.expired():
+                seconds = getattr(self.budget, limit)
+                raise self._fail(limit, f"{limit} budget of {seconds:g}s exceeded") from None
+            raise
+
+    def charge(self, usage: TokenUsage) -> None:
+        """Count an LLM response's tokens, raising once a token budget is spent."""
+        tokens = usage.total_tokens
+        self.tokens += tokens
+        self.turn_tokens += tokens
+        if self.budget.episode_tokens is not None and self.tokens > self.budget.episode_tokens:
+            raise self._fail(
+                "episode_tokens", f"episode_tokens budget of {self.budget.episode_tokens} exceeded"
+            )
+        if self.budget.turn_tokens is not None and self.turn_tokens > self.budget.turn_tokens:
+            raise self._fail(
+                "turn_tokens", f"turn_tokens budget of {self.budget.turn_tokens} exceeded"
+            )
+
+    def report(self) -> dict[str, Any]:
+        return {
+            "limits": asdict(self.budget),
+            "elapsed": round(time.monotonic() - self.started, 6),
+            "tokens": self.tokens,
+            "exceeded": self.exceeded,
+        }
@@ -0,0 +1,204 @@
+"""Content-addressed LLM response cache with record/replay modes."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Literal
+
+from .episode_stats import count, episode_counts
+from .patching import unwrap_method, wrap_method
+from .serialize import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+CacheMode = Literal["read_write", "record", "replay"]
+
+# Provider hints that do not change what the model sees
+_VOLATILE_KEYS = frozenset({"cache_control"})
+
+
+class CacheMiss(LookupError):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+class ResponseCache:
+    """On-disk cache of `get_response` results keyed by request content.
+
+    The key is a SHA-256 over the normalized message list, the agent's tool
+    schemas, system prompt and model. Each entry stores the response and the
+    messages the provider appended to the history, so a hit leaves the
+    conversation exactly as a live call would.
+
+    Modes:
+        read_write: serve hits, call the model on a miss and store the result
+        record: always call the model and store the result
+        replay: serve hits only, a miss raises `CacheMiss` (no model calls)
+
+    Entries are evicted least-recently-used once the directory exceeds
+    `max_bytes`. `get` and `put` block on disk; the wrapped `get_response`
+    runs them in a worker thread.
+    """
+
+    def __init__(
+        self,
+        root: str | Path,
+        *,
+        mode: CacheMode = "read_write",
+        max_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        if mode not in ("read_write", "record", "replay"):
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.root = Path(root)
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index: OrderedDict[str, int] | None = None
+        self._size = 0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache | None":
+        """Build from HUD_RESPONSE_CACHE (directory) and HUD_RESPONSE_CACHE_MODE."""
+        root = os.getenv("HUD_RESPONSE_CACHE")
+        if not root:
+            return None
+        return cls(root, mode=os.getenv("HUD_RESPONSE_CACHE_MODE", "read_write"))  # type: ignore[arg-type]
+
+    # ------------------------------------------------------------------ keys
+
+    @staticmethod
+    def make_key(agent: Any, messages: list[Any]) -> str:
+        """Hash of everything that determines the model's output."""
+        payload = {
+            "model": getattr(agent, "model", None),
+            "system": getattr(agent, "system_prompt", None),
+            "tools": _agent_tools(agent),
+            "messages": _normalize(messages),
+        }
+        blob = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(blob.encode()).hexdigest()
+
+    # --------------------------------------------------------------- storage
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _load_index(self) -> OrderedDict[str, int]:
+        """Scan the cache directory once, oldest access first."""
+        if self._index is None:
+            entries = []
+            if self.root.exists():
+                for path in self.root.glob("*/*.json"):
+                    try:
+                        stat = path.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, path.stem, stat.st_size))
+            entries.sort()
+            self._index = OrderedDict((key, size) for _, key, size in entries)
+            self._size = sum(self._index.values())
+        return self._index
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        """Load an entry and mark it most recently used."""
+        path = self._path(key)
+        try:
+            data = json.loads(path.read_text())
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        with self._lock:
+            index = self._load_index()
+            if key in index:
+                index.move_to_end(key)
+        return data
+
+    def put(self, key: str, data: dict[str, Any]) -> None:
+        """Write an entry atomically, then evict down to `max_bytes`."""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        blob = json.dumps(data, default=str)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(blob)
+        os.replace(tmp, path)
+
+        with self._lock:
+            index = self._load_index()
+            self._size += len(blob) - index.pop(key, 0)
+            index[key] = len(blob)
+            while self._size > self.max_bytes and len(index) > 1:
+                old_key, old_size = index.popitem(last=False)
+                self._size -= old_size
+                self._path(old_key).unlink(missing_ok=True)
+
+    # -------------------------------------------------------------- wrapping
+
+    def wrap(self, agent: Any) -> None:
+        """Route `agent.get_response` through the cache (idempotent)."""
+
+        def wrapper(live_get_response: Any) -> Any:
+            async def get_response(messages: list[Any]) -> Any:
+                key = self.make_key(agent, messages)
+                if self.mode != "record":
+                    entry = await asyncio.to_thread(self.get, key)
+                    if entry is not None:
+                        self.hits += 1
+                        count(self, "hits")
+                        messages.extend(entry["appended"])
+                        return _load_response(entry["response"])
+                    if self.mode == "replay":
+                        raise CacheMiss(f"No recorded response for {key[:12]}")
+                self.misses += 1
+                count(self, "misses")
+
+                before = len(messages)
+                response = await live_get_response(messages)
+                await asyncio.to_thread(
+                    self.put,
+                    key,
+                    {
+                        "response": response.model_dump(mode="json", exclude={"raw"}),
+                        "appended": _normalize(messages[before:]),
+                    },
+                )
+                return response
+
+            return get_response
+
+        wrap_method(agent, "get_response", self, wrapper)
+
+    def unwrap(self, agent: Any) -> None:
+        """Restore the agent's `get_response` as it was before `wrap`."""
+        unwrap_method(agent, "get_response", self)
+
+    def stats(self, *, episode: bool = False) -> dict[str, Any]:
+        """Hits and misses of the process, or of the current episode."""
+        if episode:
+            counts = episode_counts(self)
+            return {"mode": self.mode, "hits": counts["hits"], "misses": counts["misses"]}
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+def _load_response(data: dict[str, Any]) -> Any:
+    from hud.types import InferenceResult
+
+    return InferenceResult.model_validate(data)
+
+
+def _agent_tools(agent: Any) -> Any:
+    try:
+        return agent.get_tool_schemas()
+    except Exception:
+        return sorted(t.name for t in getattr(agent, "_available_tools", None) or [])
+
+
+def _normalize(obj: Any) -> Any:
+    return to_jsonable(obj, _VOLATILE_KEYS)
@@ -0,0 +1,203 @@
+"""Durable per-episode checkpoints for resuming interrupted runs.
+
+After every turn the loop rewrites the episode's checkpoint file with
+both histories, the step count and the environment state snapshot (see
+`loop.resume`). Files are replaced atomically, so a process killed at any
+point leaves the previous or the new checkpoint, never a partial one.
+
+Checkpoint statuses:
+    running: resumable from `step`
+    ended: the conversation finished; only grading is left
+    done: the driver recorded the episode's final result
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from .resume import ResumePoint, SnapshotHook
+from .serialize import to_jsonable
+
+
+class CheckpointStore:
+    """One JSON checkpoint file per episode key under `directory`.
+
+    Keys must be stable across runs (e.g. the task ID or dataset index), so
+    a rerun finds the episodes it already started.
+    """
+
+    def __init__(self, directory: str | Path, *, fsync: bool = True) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync = fsync
+
+    def path(self, key: str) -> Path:
+        return self.directory / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}.json"
+
+    def load(self, key: str) -> dict[str, Any] | None:
+        """The episode's last checkpoint, or None if it never saved one."""
+        try:
+            with open(self.path(key)) as fp:
+                return json.load(fp)
+        except FileNotFoundError:
+            return None
+
+    def episode(self, key: str) -> "EpisodeCheckpoint":
+        return EpisodeCheckpoint(self, key)
+
+    def results(self) -> list[dict[str, Any]]:
+        """Results of every episode marked done."""
+        results = []
+        for path in sorted(self.directory.glob("*.json")):
+            with open(path) as fp:
+                record = json.load(fp)
+            if record.get("status") == "done":
+                results.append(record["result"])
+        return results
+
+    async def save(self, key: str, record: dict[str, Any]) -> None:
+        """Atomically replace the episode's checkpoint with `record`."""
+        blob = json.dumps(to_jsonable({**record, "key": key, "updated_at": time.time()}))
+        await asyncio.to_thread(self._replace, self.path(key), blob)
+
+    async def delete(self, key: str) -> None:
+        """Forget the episode's checkpoint, so it starts over."""
+        path = self.path(key)
+        await asyncio.to_thread(lambda: path.unlink(missing_ok=True))
+
+    def _replace(self, path: Path, blob: str) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=f".{path.name}.")
+        try:
+            with os.fdopen(fd, "w") as fp:
+                fp.write(blob)
+                if self.fsync:
+                    fp.flush()
+                    os.fsync(fp.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+
+class EpisodeCheckpoint:
+    """The checkpoint of one episode, as handed to `multi_turn_run`."""
+
+    def __init__(self, store: CheckpointStore, key: str) -> None:
+        self.store = store
+        self.key = key
+
+    def load(self) -> dict[str, Any] | None:
+        return self.store.load(self.key)
+
+    @property
+    def status(self) -> str | None:
+        record = self.load()
+        return record.get("status") if record else None
+
+    def resume_point(self, record: dict[str, Any] | None = None) -> ResumePoint | None:
+        """Where a running episode left off, or None if there is nothing to resume.
+
+        Pass the `record` already read with `load` to skip reading it again.
+        """
+        if record is None:
+            record = self.load()
+        if not record or record.get("status") != "running":
+            return None
+        return ResumePoint(
+            messages=record["messages"],
+            user_messages=record.get("user_messages", []),
+            step=record["step"],
+            snapshot=record.get("snapshot"),
+            state=record.get("state"),
+        )
+
+    async def save_turn(self, point: ResumePoint) -> None:
+        await self.store.save(
+            self.key,
+            {
+                "status": "running",
+                "step": point.step,
+                "messages": point.messages,
+                "user_messages": point.user_messages,
+                "snapshot": point.snapshot,
+                "state": point.state,
+            },
+        )
+
+    async def end(self, point: ResumePoint, content: str | None, is_error: bool) -> None:
+        """Record the finished conversation; a rerun only re-grades it."""
+        await self.store.save(
+            self.key,
+            {
+                "status": "ended",
+                "step": point.step,
+                "messages": point.messages,
+                "user_messages": point.user_messages,
+                "snapshot": point.snapshot,
+                "state": point.state,
+                "content": content,
+                "isError": is_error,
+            },
+        )
+
+    async def finish(self, result: dict[str, Any]) -> None:
+        """Mark the episode done with the driver's result; reruns skip it."""
+        ended = self.load() or {}
+        await self.store.save(
+            self.key,
+            {
+                "status": "done",
+                "result": result,
+                "step": ended.get("step"),
+                "content": ended.get("content"),
+                "isError": ended.get("isError", False),
+            },
+        )
+
+    async def clear(self) -> None:
+        await self.store.delete(self.key)
+
+
+def tool_snapshot_hook(ctx: Any, tool: str) -> SnapshotHook:
+    """Snapshot hook calling an environment tool that returns snapshot JSON.
+
+    The tool runs in the episode's own session, so it sees the right backend
+    state; its JSON text may hold `snapshot_id` and/or `state`. Name it with
+    a leading underscore to hide it from the agents. Remote environments do
+    not list such tools, so each of the eval's connections is asked for it.
+    """
+
+    async def hook(step: int) -> dict[str, Any] | None:
+        result = await _call_hidden_tool(ctx, tool)
+        if getattr(result, "isError", False):
+            raise RuntimeError(f"{tool} failed: {result.content}")
+        for block in result.content:
+            text = block.get("text") if isinstance(block, dict) else getattr(block, "text", None)
+            if text:
+                return json.loads(text)
+        return None
+
+    return hook
+
+
+async def _call_hidden_tool(ctx: Any, tool: str) -> Any:
+    """`ctx.call_tool(tool)`, asking every connection for unlisted `_` tools."""
+    try:
+        return await ctx.call_tool(tool)
+    except ValueError:
+        if not tool.startswith("_"):
+            raise
+    errors = []
+    for connection in ctx.connections.values():
+        try:
+            return await connection.call_tool(tool, {})
+        except Exception as e:
+            errors.append(e)
+    raise RuntimeError(f"No connection answered {tool}: {errors}")
@@ -0,0 +1,260 @@
+"""Coalescing of LLM requests across the concurrent episodes of a process.
+
+Concurrent episodes of the same task often send the same request at the
+same moment. The model, system prompt, tools and history all match, e.g.
+the first turn of every episode, or simulated users answering the same
+assistant message. `RequestCoalescer` is shared by the agents of a process
+and wraps their `get_response` like the cache and scheduler layers do.
+With `dedupe=True` it sends each distinct in-flight request once. Every
+episode waiting on it gets the response and the messages the provider
+appended, as if it had made the call itself.
+
+Deduplication is off by default: deduplicated episodes share one sample,
+so they are no longer independent draws. Only turn it on when episodes
+need not vary, never when repeating a task to measure its variance.
+
+With a `batch_call`, requests are also gathered for up to `window` seconds
+per agent class and model, and the batch is handed over in a single call.
+`concurrent_batch_call` sends a batch as concurrent requests, so an
+OpenAI-compatible server with continuous batching (e.g. vLLM or SGLang)
+schedules them together. Backends with a batch or multiplexed endpoint can
+pass their own. Without one, distinct requests go out immediately through
+each agent's own (scheduled, streamed) `get_response`.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from .cache import ResponseCache, _load_response, _normalize
+from .episode_stats import count, episode_counts
+from .patching import unwrap_method, wrap_method
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(eq=False)
+class BatchItem:
+    """One distinct request of a batch.
+
+    `messages` is a private copy of the episode's history; the response's
+    messages must be appended to it as `get_response` does.
+    `get_response` is the agent's own (inner) call, for backends that
+    send part of a batch individually.
+    """
+
+    agent: Any
+    messages: list[Any]
+    get_response: Callable[[list[Any]], Awaitable[Any]]
+    key: str | None = None
+    future: "asyncio.Future[Any] | None" = field(default=None, repr=False)
+    waiters: int = 0
+    sent: bool = False
+
+
+# Receives a batch and returns one response (or exception) per item, in order
+BatchCall = Callable[[list[BatchItem]], Awaitable[list[Any]]]
+
+
+def concurrent_batch_call(max_concurrency: int | None = None) -> BatchCall:
+    """Batch call sending every item at once through its agent's own `get_response`.
+
+    Requests released together reach an OpenAI-compatible server in the
+    same scheduling step, where continuous batching runs them as one batch.
+    `max_concurrency` bounds the requests of one batch in flight.
+    """
+
+    async def batch_call(items: list[BatchItem]) -> list[Any]:
+        semaphore = asyncio.Semaphore(max_concurrency or len(items))
+
+        async def send(item: BatchItem) -> Any:
+            async with semaphore:
+                return await item.get_response(item.messages)
+
+        return await asyncio.gather(*(send(item) for item in items), return_exceptions=True)
+
+    return batch_call
+
+
+class RequestCoalescer:
+    """Layer sending identical concurrent `get_response` calls once.
+
+    Args:
+        dedupe: Share one response between identical in-flight requests;
+            deduplicated episodes share one sample
+        batch_call: Send gathered requests together (see module docstring)
+        window: Seconds to gather requests for `batch_call`
+        max_batch: Send a batch as soon as it has this many requests
+
+    An instance holds no state until first used, so it can be passed to
+    worker processes (e.g. through `run_batch`), each getting its own.
+    """
+
+    def __init__(
+        self,
+        *,
+        dedupe: bool = False,
+        batch_call: BatchCall | None = None,
+        window: float = 0.01,
+        max_batch: int = 64,
+    ) -> None:
+        self.dedupe = dedupe
+        self.batch_call = batch_call
+        self.window = window
+        self.max_batch = max_batch
+        self.requests = 0
+        self.sent = 0
+        self.deduped = 0
+        self.batches = 0
+        self._inflight: dict[str, BatchItem] = {}
+        self._pending: dict[tuple[Any, ...], list[BatchItem]] = {}
+        self._timers: dict[tuple[Any, ...], asyncio.TimerHandle] = {}
+        self._batch_tasks: set[asyncio.Task[None]] = set()
+
+    async def call(self, agent: Any, get_response: Any, messages: list[Any]) -> Any:
+        """`get_response(messages)`, shared with identical requests in flight."""
+        self.requests += 1
+        count(self, "requests")
+        key = _request_key(agent, messages) if self.dedupe else None
+        item = self._inflight.get(key) if key is not None else None
+        owner = item is None
+        if item is None:
+            item = BatchItem(agent, list(messages), get_response, key)
+            self._submit(item)
+            count(self, "sent")
+        else:
+            self.deduped += 1
+            count(self, "deduped")
+        before = len(messages)
+        item.waiters += 1
+        try:
+            response = await asyncio.shield(item.future)
+        except asyncio.CancelledError:
+            # E.g. an episode's deadline; the request lives on for the others
+            item.waiters -= 1
+            if item.waiters == 0 and not item.future.done():
+                self._abandon(item)
+            raise
+        appended = item.messages[before:]
+        if owner:
+            messages.extend(appended)
+            return response
+        # Others get copies, so no two histories share mutable messages
+        messages.extend(_normalize(appended))
+        return _load_response(response.model_dump(mode="json", exclude={"raw"}))
+
+    def _submit(self, item: BatchItem) -> None:
+        loop = asyncio.get_running_loop()
+        self.sent += 1
+        if item.key is not None:
+            self._inflight[item.key] = item
+        if self.batch_call is None:
+            item.future = loop.create_task(item.get_response(item.messages))
+            item.sent = True
+        else:
+            item.future = loop.create_future()
+            group = (type(item.agent), getattr(item.agent, "model", None))
+            pending = self._pending.setdefault(group, [])
+            pending.append(item)
+            if len(pending) >= self.max_batch:
+                self._flush(group)
+            elif len(pending) == 1:
+                self._timers[group] = loop.call_later(self.window, self._flush, group)
+        item.future.add_done_callback(lambda _: self._finished(item))
+
+    def _finished(self, item: BatchItem) -> None:
+        if item.key is not None and self._inflight.get(item.key) is item:
+            del self._inflight[item.key]
+        if not item.future.cancelled():
+            # Retrieved here in case every waiter was cancelled meanwhile
+            item.future.exception()
+
+    def _abandon(self, item: BatchItem) -> None:
+        """Stop a request nobody waits for any more, unless a batch took it."""
+        if item.key is not None and self._inflight.get(item.key) is item:
+            del self._inflight[item.key]
+        if item.sent and self.batch_call is not None:
+            return
+        for pending in self._pending.values():
+            if item in pending:
+                pending.remove(item)
+                break
+        item.future.cancel()
+
+    def _flush(self, group: tuple[Any, ...]) -> None:
+        timer = self._timers.pop(group, None)
+        if timer is not None:
+            timer.cancel()
+        items = self._pending.pop(group, [])
+        if items:
+            for item in items:
+                item.sent = True
+            task = asyncio.get_running_loop().create_task(self._send_batch(items))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_batch(self, items: list[BatchItem]) -> None:
+        self.batches += 1
+        try:
+            results = await self.batch_call(items)
+            if len(results) != len(items):
+                raise ValueError(f"batch_call returned {len(results)} results for {len(items)}")
+        except Exception as e:
+            logger.warning(f"Batch of {len(items)} requests failed: {e!r}")
+            results = [e] * len(items)
+        for item, result in zip(items, results):
+            if item.future.done():
+                continue
+            if isinstance(result, BaseException):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
+
+    def wrap(self, agent: Any) -> None:
+        """Route `agent.get_response` through the coalescer (idempotent)."""
+
+        def wrapper(get_response: Any) -> Any:
+            async def coalesced_get_response(messages: list[Any]) -> Any:
+                return await self.call(agent, get_response, messages)
+
+            return coalesced_get_response
+
+        wrap_method(agent, "get_response", self, wrapper)
+
+    def unwrap(self, agent: Any) -> None:
+        unwrap_method(agent, "get_response", self)
+
+    def stats(self, *, episode: bool = False) -> dict[str, Any]:
+        """Counts of the process, or of the current episode's requests.
+
+        Batches hold requests of several episodes, so they are only
+        counted for the process.
+        """
+        if episode:
+            counts = episode_counts(self)
+            return {name: counts[name] for name in ("requests", "sent", "deduped")}
+        return {
+            "requests": self.requests,
+            "sent": self.sent,
+            "deduped": self.deduped,
+            "batches": self.batches,
+        }
+
+
+def _request_key(agent: Any, messages: list[Any]) -> str | None:
+    """Response cache key plus the agent's class and settings; None if unknown."""
+    try:
+        config = agent.config.model_dump()
+        config_key = json.dumps(config, sort_keys=True, default=lambda o: type(o).__qualname__)
+    except Exception:
+        return None
+    agent_type = type(agent)
+    digest = hashlib.sha256()
+    digest.update(f"{agent_type.__module__}.{agent_type.__qualname__}\n".encode())
+    digest.update(config_key.encode())
+    digest.update(ResponseCache.make_key(agent, messages).encode())
+    return digest.hexdigest()
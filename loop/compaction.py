@@ -0,0 +1,264 @@
+"""Context compaction for long multi-turn histories.
+
+Once a history's estimated size passes `max_tokens`, the compactor shrinks
+it to about `target_ratio * max_tokens`:
+
+1. tool results outside the most recent turns are truncated (images are
+   replaced with a placeholder);
+2. if that is not enough, the oldest turns are dropped, optionally replaced
+   by a summary from a pluggable summarizer.
+
+The pinned head (system prompt and task prompt) and the last
+`keep_recent_turns` turns are never modified. Turns are cut only at plain
+user messages, so tool calls always stay next to their results.
+Compacting rewrites the prefix (and so invalidates provider prompt caches);
+the gap between the trigger and the target keeps that infrequent.
+"""
+
+import functools
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# (previous summary or None, messages being dropped) -> new summary
+Summarizer = Callable[[str | None, list[Any]], Awaitable[str]]
+
+SUMMARY_TEMPLATE = "[Summary of the earlier conversation]\n{summary}"
+OMITTED_TEMPLATE = "[{count} earlier messages omitted]"
+
+_TOOL_RESULT_BLOCKS = ("tool_result", "function_response")
+_IMAGE_BLOCKS = ("image", "image_url")
+
+
+@dataclass
+class CompactionState:
+    """Per-history bookkeeping, created once the pinned head is in place."""
+
+    pinned: int
+    summary: str | None = None
+    summary_messages: int = 0
+    dropped: int = 0
+
+
+class ContextCompactor:
+    """Keeps a message history under a token budget.
+
+    Args:
+        max_tokens: Estimated history size that triggers compaction
+        target_ratio: Compact down to this fraction of `max_tokens`
+        keep_recent_turns: Most recent turns that are never touched
+        tool_result_chars: Truncate older tool results to this many
+            characters (None disables truncation)
+        drop_old_turns: Drop the oldest turns if truncation is not enough
+        summarizer: Replace dropped turns with a running summary instead
+            of a short "omitted" note
+    """
+
+    def __init__(
+        self,
+        max_tokens: int,
+        *,
+        target_ratio: float = 0.75,
+        keep_recent_turns: int = 4,
+        tool_result_chars: int | None = 1000,
+        drop_old_turns: bool = True,
+        summarizer: Summarizer | None = None,
+    ) -> None:
+        self.max_tokens = max_tokens
+        self.target_tokens = int(max_tokens * target_ratio)
+        self.keep_recent_turns = keep_recent_turns
+        self.tool_result_chars = tool_result_chars
+        self.drop_old_turns = drop_old_turns
+        self.summarizer = summarizer
+
+    async def compact(
+        self, agent: Any, messages: list[Any], state: CompactionState
+    ) -> dict[str, Any] | None:
+        """Compact `messages` in place if over budget; returns what was done."""
+        tokens = estimate_tokens(messages)
+        if tokens <= self.max_tokens:
+            return None
+
+        start = state.pinned + state.summary_messages
+        turns = _split_turns(messages, start)
+        old = turns[: max(0, len(turns) - self.keep_recent_turns)]
+        event: dict[str, Any] = {"tokens_before": tokens, "truncated": 0, "dropped": 0}
+
+        if self.tool_result_chars is not None:
+            for turn_start, turn_end in old:
+                for i in range(turn_start, turn_end):
+                    shortened = _truncate_tool_result(messages[i], self.tool_result_chars)
+                    if shortened is not messages[i]:
+                        messages[i] = shortened
+                        event["truncated"] += 1
+            tokens = estimate_tokens(messages)
+
+        if self.drop_old_turns and tokens > self.target_tokens and old:
+            # Drop whole turns, oldest first, until the rest fits the target
+            excess = tokens - self.target_tokens
+            end = start
+            for turn_start, turn_end in old:
+                if excess <= 0:
+                    break
+                excess -= estimate_tokens(messages[turn_start:turn_end])
+                end = turn_end
+            dropped = messages[start:end]
+            if dropped:
+                await self._replace_with_summary(agent, messages, state, dropped, end)
+                event["dropped"] = len(dropped)
+            tokens = estimate_tokens(messages)
+
+        if not event["truncated"] and not event["dropped"]:
+            # Everything left is pinned or recent
+            return None
+        event["tokens_after"] = tokens
+        logger.info(
+            f"Compacted history: {event['tokens_before']} -> {tokens} tokens "
+            f"({event['truncated']} truncated, {event['dropped']} dropped)"
+        )
+        return event
+
+    async def _replace_with_summary(
+        self,
+        agent: Any,
+        messages: list[Any],
+        state: CompactionState,
+        dropped: list[Any],
+        end: int,
+    ) -> None:
+        state.dropped += len(dropped)
+        if self.summarizer is not None:
+            state.summary = await self.summarizer(state.summary, dropped)
+            text = SUMMARY_TEMPLATE.format(summary=state.summary)
+        else:
+            text = OMITTED_TEMPLATE.format(count=state.dropped)
+        replacement = await agent.format_message(text)
+        messages[state.pinned : end] = replacement
+        state.summary_messages = len(replacement)
+
+
+def _split_turns(messages: list[Any], start: int) -> list[tuple[int, int]]:
+    """(start, end) index ranges of turns, each beginning at a plain user message."""
+    bounds = [start] + [
+        i for i in range(start + 1, len(messages)) if _is_turn_start(messages[i])
+    ]
+    return [(a, b) for a, b in zip(bounds, bounds[1:] + [len(messages)]) if a < b]
+
+
+def _get(block: Any, key: str) -> Any:
+    if isinstance(block, dict):
+        return block.get(key)
+    return getattr(block, key, None)
+
+
+def _block_type(block: Any) -> str | None:
+    return _get(block, "type")
+
+
+def _is_turn_start(message: Any) -> bool:
+    if not isinstance(message, dict) or message.get("role") != "user":
+        return False
+    content = message.get("content")
+    if isinstance(content, list):
+        return not any(_block_type(block) in _TOOL_RESULT_BLOCKS for block in content)
+    return True
+
+
+def _shorten(content: Any, limit: int) -> Any:
+    if isinstance(content, str):
+        if len(content) <= limit:
+            return content
+        return content[:limit] + f"... [{len(content) - limit} characters truncated]"
+    if isinstance(content, list):
+        blocks = []
+        for block in content:
+            kind = _block_type(block)
+            if kind == "text" and isinstance(block, dict):
+                blocks.append({**block, "text": _shorten(block.get("text", ""), limit)})
+            elif kind in _IMAGE_BLOCKS:
+                blocks.append({"type": "text", "text": "[image omitted]"})
+            else:
+                blocks.append(block)
+        return blocks
+    return content
+
+
+def _truncate_tool_result(message: Any, limit: int) -> Any:
+    """A shortened copy of a tool result message, or the message itself."""
+    if not isinstance(message, dict):
+        return message
+    if message.get("role") == "tool":
+        content = _shorten(message.get("content"), limit)
+        return message if content == message.get("content") else {**message, "content": content}
+    content = message.get("content")
+    if message.get("role") != "user" or not isinstance(content, list):
+        return message
+    blocks = [
+        {**block, "content": _shorten(block.get("content"), limit)}
+        if isinstance(block, dict) and block.get("type") in _TOOL_RESULT_BLOCKS
+        else block
+        for block in content
+    ]
+    return message if blocks == content else {**message, "content": blocks}
+
+
+def message_text(message: Any) -> str:
+    """Plain-text rendering of a message, for summaries."""
+    if isinstance(message, dict):
+        role = message.get("role", "?")
+        content = message.get("content")
+    else:
+        role = getattr(message, "role", "?")
+        content = getattr(message, "content", None)
+    if isinstance(content, str):
+        return f"{role}: {content}"
+    parts = []
+    for block in content or []:
+        kind = _block_type(block)
+        get = functools.partial(_get, block)
+        if kind == "text":
+            parts.append(get("text") or "")
+        elif kind == "tool_use":
+            parts.append(f"[called {get('name')}({get('input')})]")
+        elif kind in _TOOL_RESULT_BLOCKS:
+            result = get("content")
+            if isinstance(result, list):
+                result = " ".join(str(_get(b, "text") or "") for b in result)
+            parts.append(f"[tool result: {_shorten(str(result), 200)}]")
+    return f"{role}: {' '.join(p for p in parts if p)}"
+
+
+def extractive_summarizer(max_chars: int = 2000) -> Summarizer:
+    """Summarizer without model calls: the tail of a plain-text transcript."""
+
+    async def summarize(previous: str | None, dropped: list[Any]) -> str:
+        lines = [previous] if previous else []
+        lines.extend(message_text(message) for message in dropped)
+        text = "\n".join(lines)
+        return text[-max_chars:]
+
+    return summarize
+
+
+def agent_summarizer(agent: Any, instruction: str | None = None) -> Summarizer:
+    """Summarizer that asks `agent` (a separate, tool-less agent) for a summary."""
+    instruction = instruction or (
+        "Summarize the conversation below for the assistant that is continuing it. "
+        "Keep decisions, tool outcomes and the user's current state; be brief."
+    )
+
+    async def summarize(previous: str | None, dropped: list[Any]) -> str:
+        transcript = "\n".join(message_text(message) for message in dropped)
+        if previous:
+            transcript = f"Earlier summary:\n{previous}\n\n{transcript}"
+        messages = await agent.get_system_messages()
+        messages.extend(await agent.format_message(f"{instruction}\n\n{transcript}"))
+        response = await agent.get_response(messages)
+        return response.content or previous or ""
+
+    return summarize
@@ -0,0 +1,117 @@
+"""Lazy, level-gated console output for the conversation loop.
+
+The loop prints the dialog and debug dumps of the message history through
+the agent's `HUDConsole`. Building those strings eagerly costs CPU and
+allocations on the event loop even when nothing is shown, so `LoopConsole`
+only formats a message once it knows it will be printed, truncates large
+payloads, and can be switched off entirely for batch runs.
+
+Messages are either `str.format` templates, whose arguments are converted
+and truncated only when printed, or zero-argument callables.
+"""
+
+import logging
+import os
+from collections.abc import Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CHARS = 2000
+
+Message = str | Callable[[], str]
+
+
+def clip(value: Any, max_chars: int = DEFAULT_MAX_CHARS) -> str:
+    """`str(value)`, cut to `max_chars` with a note on how much was dropped."""
+    text = value if isinstance(value, str) else str(value)
+    if max_chars and len(text) > max_chars:
+        return f"{text[:max_chars]}... [{len(text) - max_chars} more characters]"
+    return text
+
+
+def quiet_from_env() -> bool:
+    """MULTI_TURN_QUIET=1 turns loop output off (warnings and errors still go to logging)."""
+    return os.getenv("MULTI_TURN_QUIET", "").lower() in ("1", "true", "yes")
+
+
+class LoopConsole:
+    """Wraps an agent console (`HUDConsole` or anything with the same methods).
+
+    Args:
+        console: Where output goes; its `_logger` decides the debug/info level
+        enabled: False drops all console output; warnings and errors are
+            still sent to the `logging` module
+        max_chars: Truncate each formatted argument to this many characters
+    """
+
+    def __init__(
+        self,
+        console: Any,
+        *,
+        enabled: bool = True,
+        max_chars: int = DEFAULT_MAX_CHARS,
+    ) -> None:
+        self.console = console
+        self.enabled = enabled
+        self.max_chars = max_chars
+        self._streamed = ""
+        console_logger = getattr(console, "_logger", None)
+        self._logger = console_logger if isinstance(console_logger, logging.Logger) else logger
+
+    def is_enabled_for(self, level: int) -> bool:
+        return self.enabled and self._logger.isEnabledFor(level)
+
+    def _render(self, message: Message, args: tuple[Any, ...]) -> str:
+        if callable(message):
+            return clip(message(), self.max_chars * 4)
+        if args:
+            return message.format(*(clip(arg, self.max_chars) for arg in args))
+        return message
+
+    def debug(self, message: Message, *args: Any) -> None:
+        """Shown only when the console's logger is at DEBUG."""
+        if self.is_enabled_for(logging.DEBUG):
+            self.console.debug(self._render(message, args))
+
+    def info_log(self, message: Message, *args: Any) -> None:
+        """Shown only when the console's logger is at INFO."""
+        if self.is_enabled_for(logging.INFO):
+            self.console.info_log(self._render(message, args))
+
+    def info(self, message: Message, *args: Any) -> None:
+        """Dialog output, shown whenever the console is enabled."""
+        if self.enabled:
+            self.console.info(self._render(message, args))
+
+    def stream(self, delta: str) -> None:
+        """Echo streamed text at DEBUG as it arrives, one complete line at a time."""
+        if not self.is_enabled_for(logging.DEBUG):
+            return
+        *lines, self._streamed = (self._streamed + delta).split("\n")
+        for line in lines:
+            self.console.debug(f"… {clip(line, self.max_chars)}")
+
+    def end_stream(self) -> None:
+        """Echo what is left of a streamed response."""
+        if self._streamed:
+            self.console.debug(f"… {clip(self._streamed, self.max_chars)}")
+            self._streamed = ""
+
+    def warning(self, message: Message, *args: Any) -> None:
+        if self.enabled:
+            self.console.warning(self._render(message, args))
+        else:
+            logger.warning(self._render(message, args))
+
+    def warning_log(self, message: Message, *args: Any) -> None:
+        if self.enabled:
+            self.console.warning_log(self._render(message, args))
+        else:
+            logger.warning(self._render(message, args))
+
+    def error_log(self, message: Message, *args: Any) -> None:
+        if self.enabled:
+            self.console.error_log(self._render(message, args))
+        else:
+            logger.error(self._render(message, args))
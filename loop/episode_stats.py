@@ -0,0 +1,41 @@
+"""Per-episode counters for layers shared between episodes.
+
+The cache, scheduler and coalescer are shared by the episodes of a process,
+so their own counters are process-wide totals. Each also counts events
+against the episode that caused them: `multi_turn_run` opens
+`episode_stats()` around an episode, and everything that episode awaits
+(including tasks it starts) counts into it.
+"""
+
+import contextlib
+from collections import Counter
+from collections.abc import Hashable, Iterator
+from contextvars import ContextVar
+
+# Layer -> counts of the episode running in the current context
+_counts: ContextVar[dict[object, Counter[Hashable]] | None] = ContextVar(
+    "episode_counts", default=None
+)
+
+
+@contextlib.contextmanager
+def episode_stats() -> Iterator[None]:
+    """Count layer events of the code run inside against a fresh episode."""
+    token = _counts.set({})
+    try:
+        yield
+    finally:
+        _counts.reset(token)
+
+
+def count(layer: object, name: Hashable, n: int = 1) -> None:
+    """Add `n` to the current episode's `name` count for `layer`, if any."""
+    counts = _counts.get()
+    if counts is not None:
+        counts.setdefault(layer, Counter())[name] += n
+
+
+def episode_counts(layer: object) -> Counter[Hashable]:
+    """The current episode's counts for `layer` (missing names are 0)."""
+    counts = _counts.get()
+    return Counter(counts.get(layer, ())) if counts is not None else Counter()
@@ -0,0 +1,254 @@
+"""Metrics hooks for multi-turn episodes.
+
+`multi_turn_run(..., metrics=hook)` calls `hook.record_episode(episode)`
+once per episode with the episode id, status, duration and the timing and
+usage data that also goes into `Trace.info`. Two hooks are provided:
+
+- `PrometheusMetrics` aggregates counters and histograms in-process and
+  renders the Prometheus text exposition format;
+- `OTelExporter` replays each episode as OpenTelemetry spans (needs
+  `opentelemetry-api`, plus an SDK for the spans to go anywhere).
+"""
+
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import Any, Protocol
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+class MetricsHook(Protocol):
+    def record_episode(self, episode: dict[str, Any]) -> None: ...
+
+
+def record_episode(
+    hooks: "MetricsHook | Iterable[MetricsHook] | None", episode: dict[str, Any]
+) -> None:
+    """Hand an episode to one or more hooks; a failing hook never fails the episode."""
+    if hooks is None:
+        return
+    for hook in hooks if isinstance(hooks, (list, tuple)) else [hooks]:
+        try:
+            hook.record_episode(episode)
+        except Exception as e:
+            logger.warning(f"Metrics hook {type(hook).__name__} failed: {e}")
+
+
+@dataclass
+class ModelPrice:
+    """USD per million tokens."""
+
+    input: float
+    output: float
+    cached_input: float | None = None
+
+    def cost(self, usage: dict[str, Any]) -> float:
+        cached = usage.get("cached_tokens", 0)
+        cached_rate = self.cached_input if self.cached_input is not None else self.input
+        return (
+            (usage.get("input_tokens", 0) - cached) * self.input
+            + cached * cached_rate
+            + usage.get("output_tokens", 0) * self.output
+        ) / 1_000_000
+
+
+class _Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(labels: tuple[tuple[str, str], ...], extra: str = "") -> str:
+    parts = [f'{key}="{_escape(value)}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusMetrics:
+    """In-process Prometheus counters and histograms for multi-turn episodes.
+
+    Serve `render()` from an HTTP endpoint, or `write_textfile()` it for the
+    node-exporter textfile collector. `prices` maps model names to
+    `ModelPrice` for the cost counter.
+    """
+
+    def __init__(
+        self,
+        *,
+        prefix: str = "multi_turn",
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+        prices: dict[str, ModelPrice] | None = None,
+    ) -> None:
+        self.prefix = prefix
+        self.buckets = buckets
+        self.prices = prices or {}
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple[tuple[str, str], ...], float]] = {}
+        self._histograms: dict[str, dict[tuple[tuple[str, str], ...], _Histogram]] = {}
+        self._help: dict[str, str] = {}
+
+    def _inc(self, name: str, help_text: str, value: float = 1.0, **labels: str) -> None:
+        self._help[name] = help_text
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0.0) + value
+
+    def _observe(self, name: str, help_text: str, value: float, **labels: str) -> None:
+        self._help[name] = help_text
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        if key not in series:
+            series[key] = _Histogram(self.buckets)
+        series[key].observe(value)
+
+    def record_episode(self, episode: dict[str, Any]) -> None:
+        p = self.prefix
+        with self._lock:
+            status = "error" if episode.get("is_error") else "ok"
+            self._inc(f"{p}_episodes_total", "Finished episodes", status=status)
+            self._observe(
+                f"{p}_episode_duration_seconds", "Episode wall time", episode.get("duration", 0.0)
+            )
+            self._inc(
+                f"{p}_user_tool_iterations_total",
+                "Simulated user LLM calls that returned tool calls",
+                episode.get("user_tool_iterations", 0),
+            )
+            for step in episode.get("steps", []):
+                self._observe(f"{p}_step_duration_seconds", "Step wall time", step["wall"])
+                for phase, duration in step.get("phases", {}).items():
+                    self._observe(
+                        f"{p}_phase_duration_seconds", "Time per loop phase", duration, phase=phase
+                    )
+                for span in step.get("spans", []):
+                    kind, _, tool = span["name"].partition(":")
+                    self._observe(
+                        f"{p}_span_duration_seconds",
+                        "Time per tool call and user LLM iteration",
+                        span["end"] - span["start"],
+                        span=kind,
+                        tool=tool,
+                    )
+            for tool, count in episode.get("tool_calls", {}).items():
+                self._inc(f"{p}_tool_calls_total", "Tool calls", count, tool=tool)
+            for role, usage in episode.get("usage", {}).items():
+                for kind in ("input_tokens", "output_tokens", "cached_tokens"):
+                    self._inc(
+                        f"{p}_tokens_total",
+                        "LLM tokens (estimated where providers report none)",
+                        usage.get(kind, 0),
+                        role=role,
+                        kind=kind.removesuffix("_tokens"),
+                    )
+                price = self.prices.get(str(usage.get("model")))
+                if price is not None:
+                    self._inc(
+                        f"{p}_cost_usd_total", "Estimated LLM cost", price.cost(usage), role=role
+                    )
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines: list[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(labels)} {value:g}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, hist in sorted(series.items()):
+                    bounds = [f"{bound:g}" for bound in hist.buckets] + ["+Inf"]
+                    for bound, count in zip(bounds, hist.counts + [hist.total]):
+                        le = _labels(labels, f'le="{bound}"')
+                        lines.append(f"{name}_bucket{le} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {hist.sum:g}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist.total}")
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically write `render()` to `path`."""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as fp:
+            fp.write(self.render())
+        os.replace(tmp, path)
+
+
+class OTelExporter:
+    """Emit each episode as an OpenTelemetry trace: episode > step > phase/span."""
+
+    def __init__(self, tracer: Any = None, *, tracer_name: str = "multi_turn") -> None:
+        try:
+            from opentelemetry import trace
+        except ImportError as e:
+            raise ImportError(
+                "OTelExporter requires opentelemetry-api: pip install opentelemetry-api"
+            ) from e
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer(tracer_name)
+
+    def record_episode(self, episode: dict[str, Any]) -> None:
+        start_ns = int(episode["started_at"] * 1e9)
+        root = self.tracer.start_span(
+            "multi_turn.episode",
+            start_time=start_ns,
+            attributes={
+                "episode.id": str(episode.get("episode")),
+                "episode.is_error": bool(episode.get("is_error")),
+                "episode.steps": len(episode.get("steps", [])),
+                "episode.user_tool_iterations": episode.get("user_tool_iterations", 0),
+                **{
+                    f"llm.{role}.{kind}": usage.get(kind, 0)
+                    for role, usage in episode.get("usage", {}).items()
+                    for kind in ("input_tokens", "output_tokens", "cached_tokens")
+                },
+            },
+        )
+        root_ctx = self._trace.set_span_in_context(root)
+        for step in episode.get("steps", []):
+            step_ns = int(step["started_at"] * 1e9)
+            step_span = self.tracer.start_span(
+                "multi_turn.step",
+                context=root_ctx,
+                start_time=step_ns,
+                attributes={"step": step["step"], "critical_path": step.get("critical_path", [])},
+            )
+            step_ctx = self._trace.set_span_in_context(step_span)
+            for span in step.get("phase_spans", []) + step.get("spans", []):
+                attributes = {
+                    key: value
+                    for key, value in span.items()
+                    if key not in ("name", "start", "end")
+                    and isinstance(value, (str, int, float, bool))
+                }
+                child = self.tracer.start_span(
+                    span["name"],
+                    context=step_ctx,
+                    start_time=step_ns + int(span["start"] * 1e9),
+                    attributes=attributes,
+                )
+                child.end(end_time=step_ns + int(span["end"] * 1e9))
+            step_span.end(end_time=step_ns + int(step["wall"] * 1e9))
+        root.end(end_time=start_ns + int(episode.get("duration", 0.0) * 1e9))
@@ -1,13 +1,38 @@
 """Multi-turn agent interaction framework for HUD."""
 
 import asyncio
+import contextlib
+import copy
+import functools
 import logging
+import time
+import uuid
+from collections import Counter
+from collections.abc import Awaitable
 from typing import Any
 
 from hud.eval.context import EvalContext
 from hud.types import Trace
 from hud.agents.base import text_to_blocks
 
+from .budget import BudgetExceeded, BudgetTracker, EpisodeBudget
+from .cache import CacheMiss, ResponseCache
+from .coalesce import RequestCoalescer
+from .compaction import CompactionState, ContextCompactor
+from .console import LoopConsole, clip, quiet_from_env
+from .checkpoint import EpisodeCheckpoint
+from .episode_stats import episode_stats
+from .metrics import MetricsHook, record_episode
+from .resume import ResumePoint, SnapshotHook
+from .scheduler import Scheduler
+from .streaming import StopStreaming
+from .timing import StepTimeline
+from .tool_registry import ToolRegistry, shared_tool_registry
+from .tools import ToolPolicy, run_tool_calls
+from .trace_writer import TraceWriter
+from .transcript import UserTranscript
+from .usage import TokenUsage, usage_from_response
+
 logger = logging.getLogger(__name__)
 
 STOP_SIGNAL = "###STOP###"
@@ -26,12 +51,100 @@ async def multi_turn_run(
     agent: Any,
     simulated_user: Any,
     max_steps: int = 30,
+    *,
+    pipelined: bool = False,
+    cache: ResponseCache | None = None,
+    scheduler: Scheduler | None = None,
+    trace_writer: TraceWriter | None = None,
+    compactor: ContextCompactor | None = None,
+    metrics: MetricsHook | list[MetricsHook] | None = None,
+    quiet: bool | None = None,
+    tool_policy: ToolPolicy | None = None,
+    resume: ResumePoint | None = None,
+    snapshot_hook: SnapshotHook | None = None,
+    checkpoint: EpisodeCheckpoint | None = None,
+    stream_user: bool = False,
+    tool_registry: ToolRegistry | None = None,
+    budget: EpisodeBudget | None = None,
+    coalescer: RequestCoalescer | None = None,
 ) -> Trace:
     """
     Run multi-turn conversation between agent and simulated user.
 
     Drop-in replacement for `await agent.run(ctx)`.
     Conversation ends when user sends ###STOP### signal.
+
+    Tool calls of one response are scheduled by `tool_policy` (see
+    `loop.tools.ToolPolicy`): reads such as `check_status` run
+    concurrently, `*_switch` mutations run alone and in order, and each call
+    has a timeout. With `pipelined=True`, message formatting also runs
+    alongside the user's turn and tools the policy does not name run
+    concurrently too. Per-step phase timings and critical paths
+    are returned in `Trace.info["steps"]` either way, with spans for each
+    tool call and user LLM iteration. Token usage, tool call counts and
+    user tool iterations are summarized in `Trace.info` too, and the whole
+    record is handed to each `metrics` hook (see `loop.metrics`).
+
+    With a `cache`, both agents' `get_response` calls go through the
+    `ResponseCache`; in its replay mode the episode makes no model calls.
+
+    A `scheduler` shared by concurrent episodes bounds in-flight episodes and
+    LLM requests adaptively and retries throttled requests with backoff.
+    Cache hits bypass the scheduler. A driver that holds
+    `scheduler.episode()` around `hud.eval` paces scenario setup too; the
+    episode then runs in that slot instead of taking a second one.
+
+    A `coalescer` shared by concurrent episodes batches the LLM requests of
+    both agents and, with `dedupe=True`, sends identical in-flight ones once
+    (see `loop.coalesce`). It sits between the cache and the scheduler, so only
+    requests that actually go out take a scheduler slot.
+
+    `Trace.info["cache"]`, `["scheduler"]` and `["coalescer"]` count what
+    this episode did with the shared layers; their `stats()` has the totals
+    of the process.
+
+    With a `trace_writer`, each step's new messages are streamed to it as
+    the episode runs and `Trace.messages` is left empty; `Trace.info` holds
+    a `trace_ref` to the written episode and message counts instead.
+
+    A `compactor` keeps the agent's and the simulated user's histories
+    under a token budget (see `loop.compaction`); the system and task
+    prompts and the most recent turns are kept as they are. Compactions
+    are listed in `Trace.info["compaction"]`.
+
+    `quiet=True` turns off the loop's console output (dialog and debug
+    dumps), e.g. for batch runs; by default it follows MULTI_TURN_QUIET.
+
+    With `resume`, the episode continues from a saved prefix (see
+    `loop.resume`) instead of starting from the prompt; `max_steps` counts
+    the resumed steps too. `snapshot_hook(step)` is awaited after every step
+    and may return an environment snapshot (see `loop.resume.SnapshotHook`),
+    which is put in the turn's trace record and `Trace.info["snapshots"]` so
+    later runs can resume there.
+
+    With a `checkpoint` (see `loop.checkpoint`), both histories, the step and
+    the snapshot are saved durably after every completed step. A rerun with
+    the same checkpoint continues a running episode from its last step, an
+    ended one is only submitted for grading again, and a done one returns
+    its saved result (`Trace.info["result"]`) without running. The
+    environment must start from the saved snapshot (e.g. the `bulb`
+    scenario's `state`).
+
+    With `stream_user=True`, the simulated user's replies are streamed and
+    generation is cancelled as soon as ###STOP### appears (see
+    `loop.streaming`), so the final turn does not wait for tokens that are
+    thrown away. Users that cannot be streamed are called as usual.
+
+    Both agents' tools are discovered, filtered by `allowed_tools` and
+    converted once per process and agent configuration, then reused by
+    later episodes (see `loop.tool_registry`); pass `tool_registry` to use
+    another registry than the shared one.
+
+    A `budget` (see `loop.budget.EpisodeBudget`) bounds the episode's and
+    each turn's wall time and tokens. A step that runs past a deadline is
+    cancelled, including its in-flight LLM and tool calls, and a spent
+    budget ends the episode with an error Trace that keeps the info
+    gathered so far; `Trace.info["budget"]` says which limit ran out.
     """
     if not isinstance(ctx, EvalContext):
         raise TypeError(f"ctx must be EvalContext, got {type(ctx).__name__}")
@@ -40,42 +153,167 @@ async def multi_turn_run(
 
     # Setup agents
     agent.ctx = simulated_user.ctx = ctx
-    await _initialize_agent_with_filters(agent, ctx)
-    await _initialize_agent_with_filters(simulated_user, ctx)
-
-    try:
-        result = await _run_conversation_loop(
-            agent, simulated_user, text_to_blocks(ctx.prompt), max_steps=max_steps
+    registry = tool_registry or shared_tool_registry
+    await registry.initialize(agent, ctx)
+    await registry.initialize(simulated_user, ctx)
+    quiet = quiet_from_env() if quiet is None else quiet
+    streaming = None
+    if stream_user:
+        # Shown live at DEBUG; the whole reply is printed once it is complete
+        user_console = LoopConsole(simulated_user.console, enabled=not quiet)
+        streaming = StopStreaming(
+            STOP_SIGNAL, on_text=user_console.stream, on_end=user_console.end_stream
         )
+    if streaming is not None and not streaming.wrap(simulated_user):
+        streaming = None
+    # Streaming innermost, then the scheduler and the coalescer, so the cache
+    # sits in front of all of them
+    for layer in (scheduler, coalescer, cache):
+        if layer is not None:
+            layer.wrap(agent)
+            layer.wrap(simulated_user)
+
+    episode_id = ctx.trace_id or uuid.uuid4().hex
+    started_at, t0 = time.time(), time.perf_counter()
+    saved = checkpoint.load() if checkpoint is not None and resume is None else None
+    result = None
+    try:
+        if saved is not None and saved.get("status") == "done":
+            # Finished and graded in an earlier run; running it again would
+            # overwrite its result
+            logger.info(f"Episode {checkpoint.key} is already done, returning its result")
+            result = Trace(
+                done=True,
+                content=saved.get("content"),
+                isError=saved.get("isError", False),
+                info={
+                    "resumed_from": {"step": saved.get("step"), "done": True},
+                    "result": saved["result"],
+                },
+            )
+            return result
+        # The layers are shared; count what this episode did with them
+        with episode_stats():
+            if saved is not None and saved.get("status") == "ended":
+                # Interrupted after the conversation finished; only grading is left
+                logger.info(f"Episode {checkpoint.key} already ended, submitting its answer")
+                result = Trace(
+                    done=True,
+                    messages=[] if trace_writer is not None else saved["messages"],
+                    content=saved["content"],
+                    isError=saved["isError"],
+                    info={"resumed_from": {"step": saved["step"], "ended": True}},
+                )
+            else:
+                if saved is not None and saved.get("status") == "running":
+                    resume = checkpoint.resume_point(saved)
+                    logger.info(f"Resuming episode {checkpoint.key} after step {resume.step}")
+                async with scheduler.episode() if scheduler else contextlib.nullcontext():
+                    result = await _run_conversation_loop(
+                        agent,
+                        simulated_user,
+                        text_to_blocks(ctx.prompt),
+                        max_steps=max_steps,
+                        pipelined=pipelined,
+                        trace_writer=trace_writer,
+                        compactor=compactor,
+                        episode_id=episode_id,
+                        quiet=quiet,
+                        tool_policy=tool_policy,
+                        resume=resume,
+                        snapshot_hook=snapshot_hook,
+                        checkpoint=checkpoint,
+                        budget=budget,
+                    )
+            if cache is not None:
+                result.info["cache"] = cache.stats(episode=True)
+            if scheduler is not None:
+                result.info["scheduler"] = scheduler.stats(episode=True)
+            if coalescer is not None:
+                result.info["coalescer"] = coalescer.stats(episode=True)
+            if streaming is not None:
+                result.info["streaming"] = streaming.stats()
         if result.content and ctx.has_scenario:
             await ctx.submit(result.content)
         return result
     except Exception as e:
         logger.exception("Multi-turn agent error:")
-        return Trace(done=True, content=f"Error: {e}", isError=True, info={"error": str(e)})
+        result = Trace(done=True, content=f"Error: {e}", isError=True, info={"error": str(e)})
+        return result
     finally:
+        if result is not None:
+            result.info["duration"] = time.perf_counter() - t0
+            record_episode(
+                metrics,
+                {
+                    "episode": episode_id,
+                    "started_at": started_at,
+                    "is_error": result.isError,
+                    **{key: result.info[key] for key in _METRIC_KEYS if key in result.info},
+                },
+            )
+        for layer in (cache, coalescer, scheduler):
+            if layer is not None:
+                layer.unwrap(agent)
+                layer.unwrap(simulated_user)
+        if streaming is not None:
+            streaming.unwrap(simulated_user)
         await agent._cleanup()
         await simulated_user._cleanup()
 
 
-async def _initialize_agent_with_filters(agent: Any, ctx: EvalContext) -> None:
-    """Initialize agent and apply tool filtering if configured."""
-    if agent._initialized:
-        return
+_METRIC_KEYS = ("duration", "steps", "usage", "tool_calls", "user_tool_iterations")
 
-    await agent._initialize_from_ctx(ctx)
 
-    # Apply allowed_tools filter if configured
-    if hasattr(agent.config, 'allowed_tools') and agent.config.allowed_tools:
-        agent._available_tools = [
-            t for t in agent._available_tools if t.name in agent.config.allowed_tools
-        ]
-        agent._tool_map = {t.name: t for t in agent._available_tools}
-        agent.console.info(
-            f"Filtered to {len(agent._available_tools)} tools: "
-            f"{', '.join(t.name for t in agent._available_tools)}"
-        )
-        agent._on_tools_ready()
+async def _call_tools(
+    caller: Any,
+    tool_calls: list[Any],
+    *,
+    policy: ToolPolicy,
+    timeline: StepTimeline | None = None,
+    span: str = "tool",
+) -> list[Any]:
+    """Execute tool calls one request per call under `policy`, timing each."""
+
+    async def call_one(call: Any) -> list[Any]:
+        result = caller.call_tools([call])
+        if timeline is None:
+            return await result
+        return await timeline.traced(f"{span}:{call.name}", result)
+
+    return await run_tool_calls(tool_calls, call_one, policy)
+
+
+def _format_step(
+    console: LoopConsole,
+    step: int,
+    max_steps: int,
+    tool_calls: list[Any],
+    tool_results: list[Any],
+) -> str:
+    step_info = f"\n[bold]Step {step}/{max_steps if max_steps != -1 else '∞'}[/bold]"
+    for call, result in zip(tool_calls, tool_results, strict=False):
+        step_info += f"\n🤖 {clip(call, console.max_chars)}\n{clip(result, console.max_chars)}"
+    return step_info
+
+
+async def _run_steps(*steps: Awaitable[Any], pipelined: bool) -> list[Any]:
+    """Await independent steps, concurrently when pipelined, else in order."""
+    if pipelined:
+        return list(await asyncio.gather(*steps))
+    results: list[Any] = []
+    try:
+        for step in steps:
+            results.append(await step)
+    finally:
+        # Close steps that never started after an earlier one failed
+        for step in steps[len(results) + 1 :]:
+            getattr(step, "close", lambda: None)()
+    return results
+
+
+async def _none() -> None:
+    return None
 
 
 async def _run_conversation_loop(
@@ -84,35 +322,143 @@ async def _run_conversation_loop(
     context: list[Any],
     *,
     max_steps: int = 30,
+    pipelined: bool = False,
+    trace_writer: TraceWriter | None = None,
+    compactor: ContextCompactor | None = None,
+    episode_id: str | None = None,
+    quiet: bool = False,
+    tool_policy: ToolPolicy | None = None,
+    resume: ResumePoint | None = None,
+    snapshot_hook: SnapshotHook | None = None,
+    checkpoint: EpisodeCheckpoint | None = None,
+    budget: EpisodeBudget | None = None,
 ) -> Trace:
     """Core conversation loop with turn-based interaction."""
+    policy = tool_policy or ToolPolicy(default_mode="parallel" if pipelined else "sequential")
+    console = LoopConsole(agent.console, enabled=not quiet)
     final_response = None
     error = None
+    # Step whose user reply carried the stop signal
+    stop_step: int | None = None
     messages: list[Any] = []
 
-    async def get_user_response(agent_message: str) -> str:
+    transcript = UserTranscript(simulated_user)
+    timelines: list[StepTimeline] = []
+    agent_usage = TokenUsage()
+    episode_id = episode_id or uuid.uuid4().hex
+    tracker = BudgetTracker(budget) if budget is not None else None
+    # Messages already handed to the trace writer
+    written = user_written = 0
+    snapshots: dict[int, str] = {}
+    states: dict[int, dict[str, Any]] = {}
+
+    async def write_turn(step: int, timeline: StepTimeline | None) -> None:
+        """Stream messages added since the last write."""
+        nonlocal written, user_written
+        if trace_writer is None:
+            return
+        record = {
+            "type": "turn",
+            "episode": episode_id,
+            "step": step,
+            "messages": messages[written:],
+            "user_messages": transcript.messages[user_written:],
+            "timing": timeline.to_dict() if timeline else None,
+        }
+        if step in snapshots:
+            record["snapshot"] = snapshots[step]
+        if step in states:
+            record["state"] = states[step]
+        await trace_writer.write(record)
+        written, user_written = len(messages), len(transcript.messages)
+
+    async def take_snapshot(step: int) -> None:
+        try:
+            taken = await snapshot_hook(step)
+        except Exception as e:
+            logger.error(f"Snapshot after step {step} failed: {e}")
+            return
+        if isinstance(taken, dict):
+            snapshot_id, state = taken.get("snapshot_id"), taken.get("state")
+        else:
+            snapshot_id, state = taken, None
+        if snapshot_id is not None:
+            snapshots[step] = snapshot_id
+        if state is not None:
+            states[step] = state
+
+    def resume_point(step: int) -> ResumePoint:
+        return ResumePoint(
+            messages=messages,
+            user_messages=transcript.messages,
+            step=step,
+            snapshot=snapshots.get(step),
+            state=states.get(step),
+        )
+
+    async def save_checkpoint(step: int) -> None:
+        try:
+            await checkpoint.save_turn(resume_point(step))
+        except Exception as e:
+            logger.error(f"Checkpoint after step {step} failed: {e}")
+
+    compactions: list[dict[str, Any]] = []
+    agent_history: CompactionState | None = None
+    user_history: CompactionState | None = None
+
+    async def compact_histories(step: int) -> None:
+        """Shrink both histories between steps, after the last trace write."""
+        nonlocal written, user_written, user_history
+        histories = [("agent", agent, messages, agent_history)]
+        if transcript.messages:
+            if user_history is None:
+                user_history = CompactionState(pinned=transcript.system_len)
+            histories.append(("user", simulated_user, transcript.messages, user_history))
+        for name, owner, history, state in histories:
+            event = await compactor.compact(owner, history, state)
+            if event is not None:
+                compactions.append({"step": step, "history": name, **event})
+        # Already streamed, the trace keeps the uncompacted history
+        written, user_written = len(messages), len(transcript.messages)
+
+    async def get_user_response(agent_message: str, timeline: StepTimeline) -> str:
         """Get simulated user response to agent's message."""
+        turn_start = None
         try:
-            # Run user agent with agent's message as prompt
-            user_prompt = f"The assistant said: {agent_message}\n\nRespond as a user."
-            user_messages = await simulated_user.get_system_messages()
-            user_messages.extend(await simulated_user.format_message(user_prompt))
+            # Append agent's message to the user's persistent transcript
+            turn_start = await transcript.begin_turn(agent_message)
 
             # User can call tools and respond
-            max_user_iterations = 6
-            for _ in range(max_user_iterations):
-                user_response_obj = await simulated_user.get_response(user_messages)
+            max_user_iterations = budget.max_user_iterations if budget is not None else 6
+            for iteration in range(max_user_iterations):
+                user_response_obj = await timeline.traced(
+                    "user_llm", transcript.get_response(), iteration=iteration
+                )
+                if tracker is not None:
+                    tracker.charge(transcript.last_usage)
+                timeline.counters["user_iterations"] = iteration + 1
 
                 # If user has tool calls, execute them
                 if user_response_obj.tool_calls:
                     logger.info(f"User executing {len(user_response_obj.tool_calls)} tool(s)")
-                    user_tool_results = await simulated_user.call_tools(user_response_obj.tool_calls)
+                    timeline.counters["user_tool_iterations"] = (
+                        timeline.counters.get("user_tool_iterations", 0) + 1
+                    )
+                    user_tool_results = await _call_tools(
+                        simulated_user,
+                        user_response_obj.tool_calls,
+                        policy=policy,
+                        timeline=timeline,
+                        span="user_tool",
+                    )
 
-                    # Format tool results and add to messages
-                    tool_messages = await simulated_user.format_tool_results(
-                        user_response_obj.tool_calls, user_tool_results
+                    # Format tool results and add to transcript
+                    await timeline.traced(
+                        "user_format_tools",
+                        transcript.add_tool_results(
+                            user_response_obj.tool_calls, user_tool_results
+                        ),
                     )
-                    user_messages.extend(tool_messages)
 
                     # Continue to get text response after tools
                     continue
@@ -123,13 +469,21 @@ async def _run_conversation_loop(
             # Max iterations reached - return last content
             return user_response_obj.content or "Okay."
 
+        except (CacheMiss, BudgetExceeded):
+            # Replay runs must not paper over a missing recording, nor a
+            # spent budget end in a made-up reply
+            raise
         except asyncio.TimeoutError:
             logger.error("User response timed out")
+            if turn_start is not None:
+                transcript.rollback(turn_start)
             return "Sorry, I took too long to respond."
         except Exception as e:
             logger.error(f"Failed to get user response: {e}")
             import traceback
             traceback.print_exc()
+            if turn_start is not None:
+                transcript.rollback(turn_start)
             return f"Error getting user response: {e}"
 
     try:
@@ -138,107 +492,231 @@ async def _run_conversation_loop(
 
         # Add initial context
         messages.extend(await agent.format_message(context))
-        agent.console.debug(f"Messages: {messages}")
-
+        # System and task prompts are never compacted
+        agent_history = CompactionState(pinned=len(messages))
         step_count = 0
+        if resume is not None:
+            # Histories are mutated in place, keep the resume point reusable
+            messages = copy.deepcopy(resume.messages)
+            await transcript.restore(copy.deepcopy(resume.user_messages))
+            step_count = resume.step
+            if resume.snapshot is not None:
+                snapshots[step_count] = resume.snapshot
+            if resume.state is not None:
+                states[step_count] = resume.state
+        console.debug("Messages: {}", messages)
+        if trace_writer is not None:
+            start = {"type": "start", "episode": episode_id, "time": time.time()}
+            if resume is not None:
+                start["resumed_from"] = {"step": resume.step, "snapshot": resume.snapshot}
+            await trace_writer.write(start)
+            await write_turn(step_count, None)
+
         while max_steps == -1 or step_count < max_steps:
             step_count += 1
-            agent.console.debug(f"Step {step_count}/{max_steps if max_steps != -1 else 'unlimited'}")
+            console.debug("Step {}/{}", step_count, max_steps if max_steps != -1 else "unlimited")
+            timeline = StepTimeline(step_count)
+            timelines.append(timeline)
+            step_complete = True
 
             try:
-                # 1. Get agent response
-                response = await agent.get_response(messages)
-                agent.console.debug(f"Agent:\n{response}")
-
-                # 2. Check if agent has tool calls
-                if response.tool_calls:
-                    # Execute agent tools
-                    tool_calls = response.tool_calls
-                    tool_results = await agent.call_tools(tool_calls)
-
-                    # Format tool results and add to messages
-                    tool_messages = await agent.format_tool_results(tool_calls, tool_results)
-                    messages.extend(tool_messages)
-
-                    # Display
-                    step_info = f"\n[bold]Step {step_count}/{max_steps if max_steps != -1 else '∞'}[/bold]"
-                    for call, result in zip(tool_calls, tool_results, strict=False):
-                        step_info += f"\n🤖 {call}\n{result}"
-                    agent.console.info_log(step_info)
-
-                    # Check if agent also sent a message (conversation turn)
-                    if response.content:
+                async with tracker.turn() if tracker is not None else contextlib.nullcontext():
+                    if compactor is not None:
+                        await timeline.timed("compact", compact_histories(step_count))
+
+                    # 1. Get agent response
+                    response = await timeline.timed("agent_llm", agent.get_response(messages))
+                    step_usage = usage_from_response(response, messages)
+                    agent_usage += step_usage
+                    timeline.counters["agent_usage"] = step_usage.to_dict()
+                    if tracker is not None:
+                        tracker.charge(step_usage)
+                    console.debug("Agent:\n{}", response)
+
+                    # 2. Check if agent has tool calls
+                    if response.tool_calls:
+                        # Execute agent tools
+                        tool_calls = response.tool_calls
+                        tool_results = await timeline.timed(
+                            "agent_tools",
+                            _call_tools(agent, tool_calls, policy=policy, timeline=timeline),
+                        )
+
+                        # Display
+                        console.info_log(
+                            functools.partial(
+                                _format_step, console, step_count, max_steps, tool_calls, tool_results
+                            )
+                        )
+
+                        # Check if agent also sent a message (conversation turn)
                         agent_message = response.content
-                        agent.console.info(f"[bold cyan]🤖 Agent:[/bold cyan] {agent_message}")
+                        if agent_message:
+                            console.info("[bold cyan]🤖 Agent:[/bold cyan] {}", agent_message)
+
+                        # Format tool results while the user responds (tools already ran)
+                        tool_messages, user_response = await _run_steps(
+                            timeline.timed(
+                                "format_tools", agent.format_tool_results(tool_calls, tool_results)
+                            ),
+                            timeline.timed("user", get_user_response(agent_message, timeline))
+                            if agent_message
+                            else _none(),
+                            pipelined=pipelined,
+                        )
+                        messages.extend(tool_messages)
+
+                        if user_response is not None:
+                            console.info("[bold green]👤 User:[/bold green] {}", user_response)
+
+                            # Check for stop signal in user response
+                            if _check_stop_signal(user_response):
+                                console.info("Conversation ended by user signal")
+                                final_response = response
+                                stop_step = step_count
+                                break
+
+                            # Add user response to messages
+                            messages.extend(
+                                await timeline.timed("format_user", agent.format_message(user_response))
+                            )
+
+                    else:
+                        # No tool calls - agent sent message to user
+                        agent_message = response.content or ""
+
+                        if not agent_message:
+                            # Agent provided empty response
+                            console.warning("Agent provided empty response, ending")
+                            final_response = response
+                            break
+
+                        console.info("[bold cyan]🤖 Agent:[/bold cyan] {}", agent_message)
 
-                        # Get user response
-                        user_response = await get_user_response(agent_message)
-                        agent.console.info(f"[bold green]👤 User:[/bold green] {user_response}")
+                        # Add agent message to history (format as string, not AgentResponse)
+                        # while getting the user response
+                        agent_messages, user_response = await _run_steps(
+                            timeline.timed("format_agent", agent.format_message(agent_message)),
+                            timeline.timed("user", get_user_response(agent_message, timeline)),
+                            pipelined=pipelined,
+                        )
+                        messages.extend(agent_messages)
+                        console.info("[bold green]👤 User:[/bold green] {}", user_response)
 
                         # Check for stop signal in user response
                         if _check_stop_signal(user_response):
-                            agent.console.info("Conversation ended by user signal")
+                            console.info("Conversation ended by user signal")
                             final_response = response
+                            stop_step = step_count
                             break
 
-                        # Add user response to messages
-                        messages.extend(await agent.format_message(user_response))
-
-                else:
-                    # No tool calls - agent sent message to user
-                    agent_message = response.content or ""
-
-                    if not agent_message:
-                        # Agent provided empty response
-                        agent.console.warning("Agent provided empty response, ending")
-                        final_response = response
-                        break
-
-                    agent.console.info(f"[bold cyan]🤖 Agent:[/bold cyan] {agent_message}")
-
-                    # Add agent message to history (format as string, not AgentResponse)
-                    messages.extend(await agent.format_message(agent_message))
-
-                    # Get user response
-                    user_response = await get_user_response(agent_message)
-                    agent.console.info(f"[bold green]👤 User:[/bold green] {user_response}")
-
-                    # Check for stop signal in user response
-                    if _check_stop_signal(user_response):
-                        agent.console.info("Conversation ended by user signal")
-                        final_response = response
-                        break
-
-                    # Add user response to messages and continue
-                    messages.extend(await agent.format_message(user_response))
+                        # Add user response to messages and continue
+                        messages.extend(
+                            await timeline.timed("format_user", agent.format_message(user_response))
+                        )
 
+            except BudgetExceeded as e:
+                # Deadline or tokens ran out mid-step: end with what the episode has so far
+                console.warning_log("Step {} stopped: {}", step_count, e)
+                error = str(e)
+                step_complete = False
+                break
             except Exception as e:
-                agent.console.error_log(f"Step failed: {e}")
+                console.error_log("Step failed: {}", e)
                 error = str(e)
+                step_complete = False
                 break
+            except BaseException:
+                # Cancelled mid-step: the last checkpoint stays the resume point
+                step_complete = False
+                raise
+            finally:
+                timeline.finish()
+                if snapshot_hook is not None:
+                    await take_snapshot(step_count)
+                await write_turn(step_count, timeline)
+                if checkpoint is not None and step_complete:
+                    await save_checkpoint(step_count)
 
     except KeyboardInterrupt:
-        agent.console.warning_log("Agent execution interrupted by user")
+        console.warning_log("Agent execution interrupted by user")
         error = "Interrupted by user"
     except asyncio.CancelledError:
-        agent.console.warning_log("Agent execution cancelled")
+        console.warning_log("Agent execution cancelled")
         error = "Cancelled"
     except Exception as e:
-        agent.console.error_log(f"Unexpected error: {e}")
+        console.error_log("Unexpected error: {}", e)
         error = str(e)
 
     # Build result
-    is_error = error is not None or (
+    is_error = error is not None or bool(
         final_response and hasattr(final_response, "isError") and final_response.isError
     )
 
+    info: dict[str, Any] = {"error": error} if error else {}
+    info["steps"] = [timeline.to_dict() for timeline in timelines]
+    if stop_step is not None:
+        info["stop_step"] = stop_step
+    if tracker is not None:
+        info["budget"] = tracker.report()
+    if compactions:
+        info["compaction"] = compactions
+    if resume is not None:
+        info["resumed_from"] = {"step": resume.step, "snapshot": resume.snapshot}
+    if snapshots:
+        info["snapshots"] = snapshots
+    if transcript.turn_usage:
+        info["user_usage"] = {
+            "total": transcript.usage.to_dict(),
+            "turns": [turn.to_dict() for turn in transcript.turn_usage],
+        }
+    info["usage"] = {
+        "agent": {**agent_usage.to_dict(), "model": getattr(agent, "model", None)},
+        "user": {**transcript.usage.to_dict(), "model": getattr(simulated_user, "model", None)},
+    }
+    info["tool_calls"] = dict(
+        Counter(
+            span_name.partition(":")[2]
+            for timeline in timelines
+            for span_name, *_ in timeline.spans
+            if span_name.startswith(("tool:", "user_tool:"))
+        )
+    )
+    info["user_tool_iterations"] = sum(
+        timeline.counters.get("user_tool_iterations", 0) for timeline in timelines
+    )
+
+    content = final_response.content if final_response else (error or "Conversation ended")
+    if checkpoint is not None and error is None:
+        try:
+            await checkpoint.end(resume_point(step_count), content, is_error)
+        except Exception as e:
+            logger.error(f"Checkpoint for episode {episode_id} failed: {e}")
+    if trace_writer is not None:
+        info["trace_ref"] = {"path": getattr(trace_writer, "path", None), "episode": episode_id}
+        info["message_count"] = len(messages)
+        info["user_message_count"] = len(transcript.messages)
+        try:
+            await trace_writer.write(
+                {
+                    "type": "end",
+                    "episode": episode_id,
+                    "content": content,
+                    "isError": is_error,
+                    "info": info,
+                }
+            )
+            await trace_writer.flush()
+        except Exception as e:
+            logger.error(f"Failed to write trace for episode {episode_id}: {e}")
+
     trace_params = {
         "reward": 0.0,
         "done": True,
-        "messages": messages,
-        "content": final_response.content if final_response else (error or "Conversation ended"),
+        "messages": [] if trace_writer is not None else messages,
+        "content": content,
         "isError": is_error,
-        "info": {"error": error} if error else {},
+        "info": info,
     }
     trace_result = Trace(**trace_params)
 
@@ -0,0 +1,50 @@
+"""Stackable per-instance wrapping of agent methods.
+
+Several layers (response cache, scheduler, ...) wrap an agent's
+`get_response` for the duration of an episode. Each wrap is recorded so
+layers can be removed in any order without dropping the others.
+"""
+
+from collections.abc import Callable
+from typing import Any
+
+_STACK_ATTR = "_method_wrappers"
+_MISSING = object()
+
+Wrapper = Callable[[Callable[..., Any]], Callable[..., Any]]
+
+
+def _stack(obj: Any) -> list[tuple[Any, str, Wrapper, Any]]:
+    return obj.__dict__.setdefault(_STACK_ATTR, [])
+
+
+def is_wrapped(obj: Any, name: str, owner: Any) -> bool:
+    return any(o is owner and n == name for o, n, _, _ in _stack(obj))
+
+
+def wrap_method(obj: Any, name: str, owner: Any, wrapper: Wrapper) -> None:
+    """Replace `obj.<name>` with `wrapper(current)`; a no-op if `owner` already did."""
+    if is_wrapped(obj, name, owner):
+        return
+    previous = obj.__dict__.get(name, _MISSING)
+    _stack(obj).append((owner, name, wrapper, previous))
+    setattr(obj, name, wrapper(getattr(obj, name)))
+
+
+def unwrap_method(obj: Any, name: str, owner: Any) -> None:
+    """Remove `owner`'s wrapper, keeping wrappers installed by other layers."""
+    stack = _stack(obj)
+    entries = [entry for entry in stack if entry[1] == name]
+    if not any(entry[0] is owner for entry in entries):
+        return
+
+    # Restore what was there before the first wrapper, then re-apply the rest
+    base = entries[0][3]
+    if base is _MISSING:
+        obj.__dict__.pop(name, None)
+    else:
+        setattr(obj, name, base)
+    stack[:] = [entry for entry in stack if entry[1] != name]
+    for entry_owner, _, wrapper, _ in entries:
+        if entry_owner is not owner:
+            wrap_method(obj, name, entry_owner, wrapper)
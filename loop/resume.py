@@ -0,0 +1,57 @@
+"""Resume or fork an episode from a saved prefix instead of replaying it.
+
+A `ResumePoint` is the agent's and the simulated user's histories after
+some step, plus the environment state snapshot taken at that step: its
+ID, and the state itself when the snapshot hook returned it.
+`multi_turn_run(..., resume=point)` continues from it without calling the
+models for the shared turns; the environment is expected to start from
+the snapshot, e.g. through the `bulb` scenario's `snapshot` or `state`
+argument. Running several episodes from one point gives best-of-N or
+branching rollouts.
+"""
+
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .trace_writer import load_episode, read_trace_records
+
+# Called after each step; returns a snapshot ID, or a dict with `snapshot_id`
+# and/or `state` (the state itself, restorable in another process), or None
+SnapshotHook = Callable[[int], Awaitable[str | dict[str, Any] | None]]
+
+
+@dataclass
+class ResumePoint:
+    """Conversation state after `step` completed steps."""
+
+    messages: list[Any]
+    user_messages: list[Any] = field(default_factory=list)
+    step: int = 0
+    snapshot: str | None = None
+    state: dict[str, Any] | None = None
+
+    @classmethod
+    def from_trace(
+        cls, path: str | Path, episode: str, step: int | None = None
+    ) -> "ResumePoint":
+        """Read the point after `step` (the last written one by default) from a trace file."""
+        snapshots: dict[int, tuple[str | None, dict[str, Any] | None]] = {}
+        for record in read_trace_records(path):
+            if record.get("episode") == episode and record["type"] == "turn":
+                snapshots[record["step"]] = (record.get("snapshot"), record.get("state"))
+        if not snapshots:
+            raise ValueError(f"Episode {episode} has no turns in {path}")
+        if step is None:
+            step = max(snapshots)
+        elif step not in snapshots:
+            raise ValueError(f"Episode {episode} has no step {step} in {path}")
+        loaded = load_episode(path, episode, until_step=step)
+        return cls(
+            messages=loaded["messages"],
+            user_messages=loaded["user_messages"],
+            step=step,
+            snapshot=snapshots[step][0],
+            state=snapshots[step][1],
+        )
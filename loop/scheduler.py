@@ -0,0 +1,305 @@
+"""Adaptive concurrency and rate limiting for multi-turn episodes.
+
+A `Scheduler` sits around `multi_turn_run`:
+
+- in-flight episodes and in-flight LLM requests per model are bounded by
+  AIMD limiters that grow slowly while requests succeed and halve on a
+  provider throttle (429/529) or when latency exceeds a target;
+- each model has optional request and token buckets;
+- `get_response` is retried with jittered exponential backoff on throttles,
+  so a transient 429 slows the run down instead of failing the episode.
+
+Drivers should take the episode slot with `Scheduler.episode()` before
+`hud.eval` opens, so scenario setup is paced too; `multi_turn_run` then
+runs inside the slot it already holds.
+"""
+
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from collections.abc import AsyncIterator
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any
+
+from .episode_stats import count, episode_counts
+from .patching import unwrap_method, wrap_method
+from .usage import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUS_CODES = {429, 529}
+
+# Schedulers whose episode slot the current task already holds
+_held_episodes: ContextVar[tuple["Scheduler", ...]] = ContextVar("held_episodes", default=())
+
+
+def is_throttle(error: BaseException) -> bool:
+    """Whether an exception is a provider rate limit or overload."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status in THROTTLE_STATUS_CODES:
+        return True
+    name = type(error).__name__
+    return "RateLimit" in name or "Overloaded" in name
+
+
+def _retry_after(error: BaseException) -> float | None:
+    """Seconds from a Retry-After header, if the provider sent one."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Wait until `tokens` are available (requests larger than capacity are capped)."""
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase / multiplicative decrease.
+
+    Each success raises the limit by `increase / limit` (about +`increase`
+    per full window); a throttle, or a success slower than `target_latency`,
+    multiplies it by `decrease`.
+    """
+
+    def __init__(
+        self,
+        initial: int = 10,
+        *,
+        minimum: int = 1,
+        maximum: int = 256,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        target_latency: float | None = None,
+    ) -> None:
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.throttles = 0
+        self._cond = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+    def on_success(self, latency: float | None = None) -> None:
+        if self.target_latency is not None and latency is not None and latency > self.target_latency:
+            self._backoff()
+        else:
+            self.limit = min(self.maximum, self.limit + self.increase / max(self.limit, 1.0))
+
+    def on_throttle(self) -> None:
+        self.throttles += 1
+        self._backoff()
+
+    def _backoff(self) -> None:
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+@dataclass
+class ModelLimits:
+    """Per-model limits; None disables that limit."""
+
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_concurrent: int = 16
+
+
+@dataclass
+class RetryPolicy:
+    """Jittered exponential backoff ("full jitter") for throttled requests."""
+
+    max_retries: int = 6
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, error: BaseException | None = None) -> float:
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+class _ModelState:
+    def __init__(self, limits: ModelLimits) -> None:
+        self.requests = AIMDLimiter(limits.max_concurrent, maximum=limits.max_concurrent * 4)
+        self.request_bucket = (
+            TokenBucket(limits.requests_per_minute / 60) if limits.requests_per_minute else None
+        )
+        self.token_bucket = (
+            TokenBucket(limits.tokens_per_minute / 60, limits.tokens_per_minute)
+            if limits.tokens_per_minute
+            else None
+        )
+
+
+class Scheduler:
+    """Shared across the episodes of a run to pace them against provider limits.
+
+    Args:
+        max_episodes: Initial in-flight episode limit (adapts from here)
+        model_limits: Limits per model name; other models use `default_limits`
+        retry: Backoff policy for throttled `get_response` calls
+        target_latency: Back off when a request takes longer than this
+    """
+
+    def __init__(
+        self,
+        *,
+        max_episodes: int = 10,
+        max_episodes_ceiling: int = 256,
+        model_limits: dict[str, ModelLimits] | None = None,
+        default_limits: ModelLimits | None = None,
+        retry: RetryPolicy | None = None,
+        target_latency: float | None = None,
+    ) -> None:
+        self.episodes = AIMDLimiter(
+            max_episodes, maximum=max_episodes_ceiling, target_latency=None
+        )
+        self.model_limits = model_limits or {}
+        self.default_limits = default_limits or ModelLimits()
+        self.retry = retry or RetryPolicy()
+        self.target_latency = target_latency
+        self.retries = 0
+        self._models: dict[str, _ModelState] = {}
+
+    def _model(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = _ModelState(self.model_limits.get(model, self.default_limits))
+            state.requests.target_latency = self.target_latency
+            self._models[model] = state
+        return state
+
+    @contextlib.asynccontextmanager
+    async def episode(self) -> AsyncIterator[None]:
+        """Hold an episode slot; episodes that saw no throttle grow the limit.
+
+        Nested calls within a task that already holds the slot are no-ops.
+        """
+        held = _held_episodes.get()
+        if self in held:
+            yield
+            return
+        throttles_before = self._throttles()
+        async with self.episodes.slot():
+            token = _held_episodes.set((*held, self))
+            try:
+                yield
+            finally:
+                _held_episodes.reset(token)
+        if self._throttles() > throttles_before:
+            self.episodes.on_throttle()
+        else:
+            self.episodes.on_success()
+
+    def _throttles(self) -> int:
+        return sum(state.requests.throttles for state in self._models.values())
+
+    async def call(self, model: str, get_response: Any, messages: list[Any]) -> Any:
+        """Rate-limited `get_response(messages)` with retry on throttles."""
+        state = self._model(model)
+        attempt = 0
+        while True:
+            if state.request_bucket:
+                await state.request_bucket.acquire()
+            if state.token_bucket:
+                await state.token_bucket.acquire(estimate_tokens(messages))
+            async with state.requests.slot():
+                start = time.monotonic()
+                before = len(messages)
+                try:
+                    response = await get_response(messages)
+                except Exception as e:
+                    if not is_throttle(e) or attempt >= self.retry.max_retries:
+                        raise
+                    # A failed call must not leave a partial assistant turn behind
+                    del messages[before:]
+                    state.requests.on_throttle()
+                    count(self, ("throttles", model))
+                    delay = self.retry.delay(attempt, e)
+                    logger.warning(
+                        f"{model} throttled ({type(e).__name__}), "
+                        f"retry {attempt + 1}/{self.retry.max_retries} in {delay:.1f}s"
+                    )
+                else:
+                    state.requests.on_success(time.monotonic() - start)
+                    return response
+            attempt += 1
+            self.retries += 1
+            count(self, "retries")
+            await asyncio.sleep(delay)
+
+    def wrap(self, agent: Any) -> None:
+        """Route `agent.get_response` through the scheduler (idempotent)."""
+        model = str(getattr(agent, "model", None) or "unknown")
+
+        def wrapper(get_response: Any) -> Any:
+            async def scheduled_get_response(messages: list[Any]) -> Any:
+                return await self.call(model, get_response, messages)
+
+            return scheduled_get_response
+
+        wrap_method(agent, "get_response", self, wrapper)
+
+    def unwrap(self, agent: Any) -> None:
+        unwrap_method(agent, "get_response", self)
+
+    def stats(self, *, episode: bool = False) -> dict[str, Any]:
+        """Current limits, plus retries and throttles of the process or the current episode."""
+        counts = episode_counts(self) if episode else None
+        return {
+            "episode_limit": round(self.episodes.limit, 2),
+            "retries": counts["retries"] if counts is not None else self.retries,
+            "models": {
+                model: {
+                    "request_limit": round(state.requests.limit, 2),
+                    "throttles": (
+                        counts[("throttles", model)]
+                        if counts is not None
+                        else state.requests.throttles
+                    ),
+                }
+                for model, state in self._models.items()
+            },
+        }
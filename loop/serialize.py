@@ -0,0 +1,19 @@
+"""Conversion of provider messages to plain JSON values."""
+
+from typing import Any
+
+
+def to_jsonable(obj: Any, drop_keys: frozenset[str] = frozenset()) -> Any:
+    """Convert provider messages (dicts, SDK models) to plain JSON values.
+
+    Keys in `drop_keys` are removed from every dict on the way down.
+    """
+    if hasattr(obj, "model_dump"):
+        obj = obj.model_dump(mode="json", exclude_none=True)
+    if isinstance(obj, dict):
+        return {k: to_jsonable(v, drop_keys) for k, v in obj.items() if k not in drop_keys}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(v, drop_keys) for v in obj]
+    if isinstance(obj, (str, int, float, bool)) or obj is None:
+        return obj
+    return str(obj)
@@ -0,0 +1,334 @@
+"""Streamed simulated-user responses that stop at the conversation stop signal.
+
+A user reply containing the stop signal ends the episode, so everything
+generated after it is thrown away. `StopStreaming` wraps the simulated
+user's `get_response` like the cache and scheduler layers do, streams the
+reply and cancels generation as soon as the signal has been seen, returning
+the text up to and including it.
+
+Agents can provide their own `stream_response(messages, on_text)`: call
+`on_text(delta)` for every text delta, stop generating once it returns
+True, append the assistant message to `messages` as `get_response` does
+and return an `InferenceResult`.
+
+Claude (Anthropic API) and OpenAI-compatible chat agents are streamed
+without that. Their own `get_response` still runs, with the provider client
+swapped for a thin proxy for the duration of the call, so tool conversion,
+retries and result parsing stay hud's. The proxy only intercepts the one
+SDK call `get_response` makes: Claude's `beta.messages.stream` (its events
+are passed through) or the chat completion `create`, sent with `stream=True`
+and reassembled by the OpenAI SDK's `ChatCompletionStreamState` (usage is
+requested through `stream_options`, unless the server rejects it). Once the
+signal has been seen, generation is aborted and the text so far becomes the
+response. Agents without the expected client, or an OpenAI SDK without
+that helper, keep their regular `get_response`.
+"""
+
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from hud.types import InferenceResult
+
+from .patching import unwrap_method, wrap_method
+
+logger = logging.getLogger(__name__)
+
+StreamResponse = Callable[[list[Any], Callable[[str], bool]], Awaitable[Any]]
+
+
+class StopScanner:
+    """Incremental search for a stop signal across text deltas."""
+
+    def __init__(self, signal: str) -> None:
+        self.signal = signal
+        self.parts: list[str] = []
+        self.stopped = False
+        # End of the signal in the text, once found
+        self.end: int | None = None
+        self._length = 0
+        self._tail = ""
+
+    def feed(self, delta: str) -> bool:
+        """Add a delta; True once the signal has been seen."""
+        if self.stopped:
+            return True
+        self.parts.append(delta)
+        # Only the last len(signal) - 1 characters can start a match spanning deltas
+        window = self._tail + delta
+        index = window.find(self.signal)
+        if index != -1:
+            self.stopped = True
+            self.end = self._length - len(self._tail) + index + len(self.signal)
+        self._length += len(delta)
+        self._tail = window[-(len(self.signal) - 1) :] if len(self.signal) > 1 else ""
+        return self.stopped
+
+    @property
+    def text(self) -> str:
+        """Text up to the end of the signal (or everything seen so far)."""
+        text = "".join(self.parts)
+        return text[: self.end] if self.end is not None else text
+
+
+class StopStreaming:
+    """Layer streaming an agent's responses and stopping at `signal`.
+
+    `on_text`, if given, receives every streamed delta, e.g. to show the
+    user's reply as it is generated, and `on_end` is called after each
+    response.
+    """
+
+    def __init__(
+        self,
+        signal: str,
+        *,
+        on_text: Callable[[str], None] | None = None,
+        on_end: Callable[[], None] | None = None,
+    ) -> None:
+        self.signal = signal
+        self.on_text = on_text
+        self.on_end = on_end
+        self.responses = 0
+        self.stopped_early = 0
+
+    def wrap(self, agent: Any) -> bool:
+        """Stream `agent.get_response`; False if the agent cannot be streamed."""
+        own = getattr(agent, "stream_response", None)
+        adapter = None if own is not None else _adapter_for(agent)
+        if own is None and adapter is None:
+            logger.info(f"{type(agent).__name__} does not support streaming, not streaming it")
+            return False
+
+        def wrapper(get_response: Any) -> Any:
+            if own is not None:
+                stream = own
+            else:
+
+                async def stream(messages: list[Any], on_text: Callable[[str], bool]) -> Any:
+                    return await _observe(agent, adapter, get_response, messages, on_text)
+
+            async def streamed_get_response(messages: list[Any]) -> Any:
+                return await self.call(stream, messages)
+
+            return streamed_get_response
+
+        wrap_method(agent, "get_response", self, wrapper)
+        return True
+
+    def unwrap(self, agent: Any) -> None:
+        unwrap_method(agent, "get_response", self)
+
+    async def call(self, stream: StreamResponse, messages: list[Any]) -> Any:
+        scanner = StopScanner(self.signal)
+
+        def on_text(delta: str) -> bool:
+            if self.on_text is not None:
+                self.on_text(delta)
+            return scanner.feed(delta)
+
+        try:
+            response = await stream(messages, on_text)
+        finally:
+            if self.on_end is not None:
+                self.on_end()
+        self.responses += 1
+        if scanner.stopped:
+            self.stopped_early += 1
+            response.content = scanner.text
+            if messages:
+                _replace_text(messages[-1], scanner.text)
+        return response
+
+    def stats(self) -> dict[str, int]:
+        return {"responses": self.responses, "stopped_early": self.stopped_early}
+
+
+def _replace_text(message: Any, text: str) -> None:
+    """Cut the stored assistant message back to the returned text."""
+    if not isinstance(message, dict) or message.get("role") != "assistant":
+        return
+    content = message.get("content")
+    if isinstance(content, str):
+        message["content"] = text
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        if content[-1].get("type") == "text":
+            content[-1]["text"] = text
+
+
+class _StopGeneration(BaseException):
+    """Aborts `get_response` once the signal was seen.
+
+    A BaseException, so provider code catching `Exception` (error results,
+    retries) lets it through.
+    """
+
+    def __init__(self, text: str) -> None:
+        super().__init__()
+        self.text = text
+
+
+@dataclass(frozen=True)
+class _Adapter:
+    # Agent attribute holding the provider client
+    client: str
+    # Attribute path of the SDK call `get_response` makes on it
+    path: tuple[str, ...]
+    # Wraps that call so it streams and reports text deltas
+    intercept: Callable[[Any, Callable[[str], bool]], Any]
+    # Assistant message for the text of an aborted response
+    message: Callable[[str], dict[str, Any]]
+
+
+class _Proxy:
+    """Delegates to `target`, replacing the call at `path` with `replacement(call)`."""
+
+    def __init__(self, target: Any, path: tuple[str, ...], replacement: Callable[[Any], Any]):
+        self._target = target
+        self._path = path
+        self._replacement = replacement
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._target, name)
+        if name != self._path[0]:
+            return value
+        if len(self._path) == 1:
+            return self._replacement(value)
+        return _Proxy(value, self._path[1:], self._replacement)
+
+
+async def _observe(
+    agent: Any,
+    adapter: _Adapter,
+    get_response: Any,
+    messages: list[Any],
+    on_text: Callable[[str], bool],
+) -> Any:
+    """Run the agent's own `get_response` with its provider call streamed."""
+    client = getattr(agent, adapter.client)
+    proxy = _Proxy(client, adapter.path, lambda call: adapter.intercept(call, on_text))
+    setattr(agent, adapter.client, proxy)
+    try:
+        return await get_response(messages)
+    except _StopGeneration as stop:
+        messages.append(adapter.message(stop.text))
+        return InferenceResult(content=stop.text, tool_calls=[])
+    finally:
+        setattr(agent, adapter.client, client)
+
+
+def _adapter_for(agent: Any) -> _Adapter | None:
+    kind = _agent_kind(agent)
+    if kind == "claude" and _streams(getattr(agent, "anthropic_client", None)):
+        return _Adapter(
+            "anthropic_client",
+            ("beta", "messages", "stream"),
+            _intercept_claude_stream,
+            lambda text: {"role": "assistant", "content": [{"type": "text", "text": text}]},
+        )
+    if kind == "openai_compatible" and getattr(agent, "oai", None) is not None:
+        if _openai_stream_state() is None:
+            return None
+        return _Adapter(
+            "oai",
+            ("chat", "completions", "create"),
+            _intercept_chat_create,
+            lambda text: {"role": "assistant", "content": text},
+        )
+    return None
+
+
+def _agent_kind(agent: Any) -> str:
+    try:
+        return str(getattr(agent.agent_type(), "value", ""))
+    except Exception:
+        return ""
+
+
+def _streams(client: Any) -> bool:
+    """Bedrock has no `.stream()`."""
+    if client is None:
+        return False
+    try:
+        from anthropic import AsyncAnthropicBedrock
+    except ImportError:
+        return True
+    return not isinstance(client, AsyncAnthropicBedrock)
+
+
+def _intercept_claude_stream(stream_call: Any, on_text: Callable[[str], bool]) -> Any:
+    """`beta.messages.stream(...)` whose events report text deltas as they pass."""
+
+    class Stream:
+        def __init__(self, manager: Any) -> None:
+            self._manager = manager
+            self._stream: Any = None
+            self._text: list[str] = []
+
+        async def __aenter__(self) -> "Stream":
+            self._stream = await self._manager.__aenter__()
+            return self
+
+        async def __aexit__(self, *exc_info: Any) -> Any:
+            # Leaving the manager closes the connection, also when aborting
+            return await self._manager.__aexit__(*exc_info)
+
+        def __getattr__(self, name: str) -> Any:
+            return getattr(self._stream, name)
+
+        async def __aiter__(self) -> Any:
+            async for event in self._stream:
+                if event.type == "content_block_delta" and event.delta.type == "text_delta":
+                    self._text.append(event.delta.text)
+                    if on_text(event.delta.text):
+                        raise _StopGeneration("".join(self._text))
+                yield event
+
+    return lambda **kwargs: Stream(stream_call(**kwargs))
+
+
+def _openai_stream_state() -> Any:
+    try:
+        from openai.lib.streaming.chat import ChatCompletionStreamState
+    except ImportError:
+        return None
+    return ChatCompletionStreamState
+
+
+def _intercept_chat_create(create: Any, on_text: Callable[[str], bool]) -> Any:
+    """`chat.completions.create(...)` streamed, returning the assembled completion."""
+    stream_state = _openai_stream_state()
+
+    async def streamed_create(**kwargs: Any) -> Any:
+        state = stream_state()
+        text: list[str] = []
+        stream = await _create_stream(create, kwargs)
+        try:
+            async for chunk in stream:
+                state.handle_chunk(chunk)
+                for choice in chunk.choices[:1]:
+                    delta = choice.delta.content
+                    if delta:
+                        text.append(delta)
+                        if on_text(delta):
+                            raise _StopGeneration("".join(text))
+        finally:
+            await stream.close()
+        return state.get_final_completion()
+
+    return streamed_create
+
+
+async def _create_stream(create: Any, kwargs: dict[str, Any]) -> Any:
+    """Start the stream, asking for usage in a last chunk where the server allows it."""
+    if "stream_options" in kwargs:
+        return await create(**{**kwargs, "stream": True})
+    try:
+        return await create(**{**kwargs, "stream": True, "stream_options": {"include_usage": True}})
+    except Exception as e:
+        if getattr(e, "status_code", None) != 400:
+            raise
+        # Servers without stream_options reject it; stream without usage
+        logger.debug(f"Streaming without stream_options after: {e}")
+        return await create(**{**kwargs, "stream": True})
@@ -0,0 +1,90 @@
+"""Per-step phase timing, spans and critical-path extraction."""
+
+import time
+from collections.abc import Awaitable
+from typing import Any, TypeVar
+
+T = TypeVar("T")
+
+
+class StepTimeline:
+    """Phase intervals recorded during one conversation step.
+
+    Phases may overlap when the loop runs them concurrently. The critical
+    path is the chain of phases that actually bounded the step's wall time.
+    Spans are finer-grained intervals inside phases (single tool calls, user
+    LLM iterations) and do not take part in the critical path. `counters`
+    holds per-step numbers such as token usage.
+    """
+
+    def __init__(self, step: int) -> None:
+        self.step = step
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._end: float | None = None
+        self.phases: list[tuple[str, float, float]] = []
+        self.spans: list[tuple[str, float, float, dict[str, Any]]] = []
+        self.counters: dict[str, Any] = {}
+
+    async def timed(self, name: str, awaitable: Awaitable[T]) -> T:
+        """Await `awaitable`, recording it as phase `name`."""
+        start = time.perf_counter() - self._t0
+        try:
+            return await awaitable
+        finally:
+            self.phases.append((name, start, time.perf_counter() - self._t0))
+
+    async def traced(self, name: str, awaitable: Awaitable[T], **attributes: Any) -> T:
+        """Await `awaitable`, recording it as span `name`."""
+        start = time.perf_counter() - self._t0
+        try:
+            return await awaitable
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            self.spans.append((name, start, time.perf_counter() - self._t0, attributes))
+
+    def finish(self) -> None:
+        self._end = time.perf_counter() - self._t0
+
+    @property
+    def wall(self) -> float:
+        return self._end if self._end is not None else time.perf_counter() - self._t0
+
+    def critical_path(self) -> list[str]:
+        """Walk back from the last phase to end, through the latest predecessor."""
+        path: list[str] = []
+        remaining = sorted(self.phases, key=lambda p: p[2])
+        cursor = float("inf")
+        while remaining:
+            candidates = [p for p in remaining if p[2] <= cursor]
+            if not candidates:
+                break
+            name, start, end = candidates[-1]
+            path.append(name)
+            cursor = start
+            remaining = [p for p in candidates[:-1] if p[2] <= start]
+        return path[::-1]
+
+    def to_dict(self) -> dict[str, Any]:
+        durations: dict[str, float] = {}
+        for name, start, end in self.phases:
+            durations[name] = durations.get(name, 0.0) + (end - start)
+        result = {
+            "step": self.step,
+            "started_at": self.started_at,
+            "wall": round(self.wall, 6),
+            "phases": {name: round(d, 6) for name, d in durations.items()},
+            "critical_path": self.critical_path(),
+            "phase_spans": [
+                {"name": name, "start": round(start, 6), "end": round(end, 6)}
+                for name, start, end in self.phases
+            ],
+            "spans": [
+                {"name": name, "start": round(start, 6), "end": round(end, 6), **attributes}
+                for name, start, end, attributes in self.spans
+            ],
+        }
+        result.update(self.counters)
+        return result
@@ -0,0 +1,232 @@
+"""Process-wide registry of discovered, filtered and converted agent tools.
+
+Every episode used to re-list the environment's tools, categorize them,
+convert them to the provider's format in `_on_tools_ready`, apply the
+`allowed_tools` filter and convert them again. None of that changes while
+the environment's tools and the agent's configuration stay the same, so
+`ToolRegistry` does it once per (agent class, config, environment tools,
+filter) and hands the result to every later agent and episode.
+
+The first agent of a configuration is set up by hud's own
+`_initialize_from_ctx` (required tools check, discovery table,
+`_on_tools_ready`) and then filtered. The result is captured as the
+attributes tool setup set or replaced on the agent (`_available_tools`,
+`_tool_map`, `_categorized_tools` and whatever `_on_tools_ready` builds,
+e.g. `claude_tools`), plus `get_tool_schemas()`. Each agent gets its own
+copies of the lists, dicts and dataclasses among them; the tools and specs
+inside are shared and must not be mutated. Agents whose tool setup holds
+the eval context are set up per episode as before.
+
+hud has no public API for any of this, so the agent and context internals
+it relies on are all accessed in the "hud internals" section at the end.
+"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any
+
+from .patching import wrap_method
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ToolSet:
+    """Tool setup of one agent configuration, shared by all agents with it."""
+
+    tools: tuple[Any, ...]
+    attributes: MappingProxyType
+    schemas: tuple[Any, ...] | None
+
+    def apply(self, agent: Any, registry: "ToolRegistry") -> None:
+        for name, value in self.attributes.items():
+            setattr(agent, name, _copy_containers(value))
+        if self.schemas is not None:
+            schemas = list(self.schemas)
+            wrap_method(
+                agent, "get_tool_schemas", registry, lambda _: lambda: _copy_containers(schemas)
+            )
+        _mark_initialized(agent)
+
+
+class ToolRegistry:
+    """Tool sets keyed by agent class, config, environment tools and filter."""
+
+    def __init__(self) -> None:
+        self._sets: dict[tuple[Any, ...], ToolSet] = {}
+        self.builds = 0
+        self.hits = 0
+        self.uncached = 0
+
+    async def initialize(self, agent: Any, ctx: Any) -> None:
+        """Set up `agent`'s tools for `ctx`, reusing an earlier identical setup."""
+        if _is_initialized(agent):
+            return
+        tools = await _discover(ctx)
+        key = _key(agent, ctx, tools)
+        tool_set = self._sets.get(key) if key is not None else None
+        if tool_set is not None:
+            self.hits += 1
+            tool_set.apply(agent, self)
+            logger.debug(f"Reusing {len(tool_set.tools)} tools for {type(agent).__name__}")
+            return
+        tool_set = await _build(agent, ctx)
+        if tool_set is None or key is None:
+            self.uncached += 1
+            return
+        self.builds += 1
+        self._sets[key] = tool_set
+        tool_set.apply(agent, self)
+
+    def clear(self) -> None:
+        """Forget every tool set, e.g. after the environment's tools changed."""
+        self._sets.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "tool_sets": len(self._sets),
+            "builds": self.builds,
+            "hits": self.hits,
+            "uncached": self.uncached,
+        }
+
+
+# Used by multi_turn_run unless it is given another registry
+shared_tool_registry = ToolRegistry()
+
+
+async def _discover(ctx: Any) -> list[Any]:
+    """The agent-visible tools; entering the eval already listed them."""
+    if not _routing_built(ctx):
+        await ctx.list_tools()
+    return ctx.as_tools()
+
+
+def _fingerprint(tools: list[Any]) -> str:
+    digest = hashlib.sha256()
+    for tool in tools:
+        dump = getattr(tool, "model_dump_json", None)
+        digest.update((dump() if dump is not None else repr(tool)).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _key(agent: Any, ctx: Any, tools: list[Any]) -> tuple[Any, ...] | None:
+    """Registry key, or None if the agent's config cannot be fingerprinted."""
+    config = agent.config
+    try:
+        # Clients differ per agent but not in what they convert tools to
+        dumped = config.model_dump(exclude={"system_prompt"})
+        config_key = json.dumps(dumped, sort_keys=True, default=lambda o: type(o).__qualname__)
+    except Exception:
+        return None
+    agent_type = type(agent)
+    return (
+        f"{agent_type.__module__}.{agent_type.__qualname__}",
+        config_key,
+        getattr(ctx, "name", None),
+        _fingerprint(tools),
+        tuple(sorted(getattr(config, "allowed_tools", None) or ())),
+        tuple(getattr(agent, "required_tools", None) or ()),
+    )
+
+
+async def _build(agent: Any, ctx: Any) -> ToolSet | None:
+    """Set up the agent's tools the way hud does, filter them and capture the result.
+
+    Returns None if the setup holds on to `ctx` and cannot be shared.
+    """
+    before = dict(vars(agent))
+    await _setup_tools(agent, ctx)
+    allowed = getattr(agent.config, "allowed_tools", None)
+    if allowed:
+        _filter_tools(agent, allowed)
+
+    # Whatever tool setup added or replaced is what later agents need
+    changed = {
+        name: value
+        for name, value in vars(agent).items()
+        if name not in ("_initialized", "_method_wrappers")
+        and (name not in before or before[name] is not value)
+    }
+    if any(_holds_ctx(value, ctx) for value in changed.values()):
+        logger.info(f"{type(agent).__name__} tool setup is bound to the eval, not sharing it")
+        return None
+    try:
+        schemas = tuple(agent.get_tool_schemas())
+    except Exception:
+        schemas = None
+    return ToolSet(
+        tools=tuple(_available_tools(agent)),
+        attributes=MappingProxyType(changed),
+        schemas=schemas,
+    )
+
+
+def _holds_ctx(value: Any, ctx: Any) -> bool:
+    return value is ctx or getattr(value, "ctx", None) is ctx
+
+
+def _copy_containers(value: Any) -> Any:
+    """Copy lists, dicts, sets, tuples and dataclasses, down to what they hold."""
+    if isinstance(value, list):
+        return [_copy_containers(item) for item in value]
+    if isinstance(value, tuple) and type(value) is tuple:
+        return tuple(_copy_containers(item) for item in value)
+    if isinstance(value, dict):
+        return type(value)({k: _copy_containers(v) for k, v in value.items()})
+    if isinstance(value, set):
+        return set(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.replace(
+            value,
+            **{
+                field.name: _copy_containers(getattr(value, field.name))
+                for field in dataclasses.fields(value)
+                if field.init
+            },
+        )
+    return value
+
+
+# ---------------------------------------------------------------- hud internals
+# Tool setup of hud's MCPAgent (`_initialize_from_ctx`, `_on_tools_ready`) and
+# the tool lists it fills are private, and so is whether an EvalContext has
+# listed its tools yet. This module touches them only through these helpers.
+
+
+def _is_initialized(agent: Any) -> bool:
+    return bool(agent._initialized)
+
+
+def _mark_initialized(agent: Any) -> None:
+    agent._initialized = True
+
+
+def _routing_built(ctx: Any) -> bool:
+    return bool(getattr(ctx, "_tool_routing_built", False))
+
+
+async def _setup_tools(agent: Any, ctx: Any) -> None:
+    """hud's own tool setup: discovery, required tools check, `_on_tools_ready`."""
+    await agent._initialize_from_ctx(ctx)
+
+
+def _available_tools(agent: Any) -> list[Any]:
+    return agent._available_tools
+
+
+def _filter_tools(agent: Any, allowed: list[str]) -> None:
+    """Apply `allowed_tools`, which `_initialize_from_ctx` does not, and convert again."""
+    agent._available_tools = [t for t in agent._available_tools if t.name in allowed]
+    agent._tool_map = {t.name: t for t in agent._available_tools}
+    agent.console.info(
+        f"Filtered to {len(agent._available_tools)} tools: "
+        f"{', '.join(t.name for t in agent._available_tools)}"
+    )
+    agent._categorized_tools = agent.categorize_tools()
+    agent._on_tools_ready()
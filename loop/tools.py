@@ -0,0 +1,104 @@
+"""Ordering and timeouts for the tool calls of one model response."""
+
+import asyncio
+import fnmatch
+import logging
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, Literal
+
+logger = logging.getLogger(__name__)
+
+ToolMode = Literal["parallel", "sequential"]
+
+
+def _default_modes() -> dict[str, ToolMode]:
+    # Generated appliance switches are named `<owner>_switch_<appliance>_<switch>`
+    return {"check_*": "parallel", "*_switch": "sequential", "*_switch_*": "sequential"}
+
+
+@dataclass
+class ToolPolicy:
+    """How the calls of one response are scheduled.
+
+    `modes` maps tool-name patterns (fnmatch, first match wins) to a mode:
+    "parallel" tools are reads and may run alongside each other, while
+    "sequential" tools mutate state and run alone, in the order the model
+    issued them. A read after a mutation therefore sees its effect. Tools
+    matching no pattern use `default_mode`.
+
+    `timeout` bounds every call, `timeouts` overrides it per pattern; a call
+    that times out yields an error result instead of failing the step.
+    """
+
+    modes: dict[str, ToolMode] = field(default_factory=_default_modes)
+    default_mode: ToolMode = "sequential"
+    timeout: float | None = 30.0
+    timeouts: dict[str, float] = field(default_factory=dict)
+
+    def mode(self, name: str) -> ToolMode:
+        for pattern, mode in self.modes.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return mode
+        return self.default_mode
+
+    def timeout_for(self, name: str) -> float | None:
+        for pattern, timeout in self.timeouts.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                return timeout
+        return self.timeout
+
+    def groups(self, tool_calls: list[Any]) -> list[list[Any]]:
+        """Split calls into groups that run one after another.
+
+        Consecutive parallel calls share a group; each sequential call is a
+        group of its own.
+        """
+        groups: list[list[Any]] = []
+        previous_parallel = False
+        for call in tool_calls:
+            parallel = self.mode(call.name) == "parallel"
+            if parallel and previous_parallel:
+                groups[-1].append(call)
+            else:
+                groups.append([call])
+            previous_parallel = parallel
+        return groups
+
+
+def timeout_result(call: Any, timeout: float) -> Any:
+    """Error result handed back to the model for a timed-out call."""
+    from hud.types import MCPToolResult
+    from mcp.types import TextContent
+
+    return MCPToolResult(
+        content=[TextContent(type="text", text=f"Tool {call.name} timed out after {timeout:g}s")],
+        isError=True,
+    )
+
+
+async def run_tool_calls(
+    tool_calls: list[Any],
+    call_one: Callable[[Any], Awaitable[list[Any]]],
+    policy: ToolPolicy,
+) -> list[Any]:
+    """Run `call_one` for every call under `policy`; results keep the call order."""
+
+    async def bounded(call: Any) -> list[Any]:
+        timeout = policy.timeout_for(call.name)
+        if timeout is None:
+            return await call_one(call)
+        try:
+            return await asyncio.wait_for(call_one(call), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Tool {call.name} timed out after {timeout:g}s")
+            return [timeout_result(call, timeout)]
+
+    results: list[Any] = []
+    for group in policy.groups(tool_calls):
+        if len(group) == 1:
+            results.extend(await bounded(group[0]))
+        else:
+            for batch in await asyncio.gather(*(bounded(call) for call in group)):
+                results.extend(batch)
+    return results
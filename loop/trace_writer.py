@@ -0,0 +1,152 @@
+"""Streaming trace sinks for multi-turn episodes.
+
+Instead of returning every message in `Trace.messages`, the loop can append
+each turn to a sink as it happens. The returned `Trace` then carries a
+reference and a summary, so memory per finished episode stays flat and
+turns written before a crash survive.
+
+Record types (one JSON object per line):
+    start: {"type": "start", "episode", "time" (Unix seconds),
+            "resumed_from" (when resuming)}
+    turn:  {"type": "turn", "episode", "step", "messages", "user_messages", "timing",
+            "snapshot" (with a snapshot hook)}
+    end:   {"type": "end", "episode", "content", "isError", "info"}
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import time
+import zlib
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any, Protocol
+
+from .serialize import to_jsonable
+
+logger = logging.getLogger(__name__)
+
+
+class TraceWriter(Protocol):
+    """Anything that accepts trace records; `path` is put in the trace reference."""
+
+    path: str | None
+
+    async def write(self, record: dict[str, Any]) -> None: ...
+
+    async def flush(self) -> None: ...
+
+    async def aclose(self) -> None: ...
+
+
+class JSONLTraceWriter:
+    """Append records to a JSONL file, gzip-compressed when it ends in `.gz`.
+
+    Records are buffered up to `max_buffer` lines (or `flush_interval`
+    seconds) and written from a worker thread; a writer with a full buffer
+    waits for the flush, so memory stays bounded. Each flush is a gzip sync
+    point, so everything flushed is readable even if the process dies
+    before `aclose`. One writer can be shared by concurrent episodes.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        max_buffer: int = 64,
+        flush_interval: float = 5.0,
+    ) -> None:
+        self.path = str(path)
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self._compress = self.path.endswith(".gz")
+        self._buffer: list[str] = []
+        self._last_flush = time.monotonic()
+        self._io_lock = asyncio.Lock()
+        self._raw: Any = None
+        self._fp: Any = None
+
+    def _open(self) -> None:
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._raw = open(self.path, "ab")
+        self._fp = gzip.GzipFile(fileobj=self._raw, mode="ab") if self._compress else self._raw
+
+    def _write_lines(self, lines: list[str]) -> None:
+        if self._fp is None:
+            self._open()
+        self._fp.write("".join(lines).encode())
+        if self._compress:
+            self._fp.flush(zlib.Z_SYNC_FLUSH)
+        self._raw.flush()
+
+    async def write(self, record: dict[str, Any]) -> None:
+        self._buffer.append(json.dumps(to_jsonable(record)) + "\n")
+        if (
+            len(self._buffer) >= self.max_buffer
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        async with self._io_lock:
+            await asyncio.to_thread(self._write_lines, lines)
+
+    async def aclose(self) -> None:
+        await self.flush()
+        async with self._io_lock:
+            if self._fp is not None:
+                self._fp.close()
+                if self._fp is not self._raw:
+                    self._raw.close()
+                self._fp = self._raw = None
+
+
+def read_trace_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Yield records from a trace file, tolerating a truncated tail.
+
+    Files from crashed runs may end mid-record or without a gzip trailer;
+    everything up to the last complete line is returned.
+    """
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt") as fp:
+        while True:
+            try:
+                line = fp.readline()
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                logger.warning(f"Truncated trace file: {path}")
+                return
+            if not line:
+                return
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Partial last line from an interrupted write
+                return
+
+
+def load_episode(
+    path: str | Path, episode: str, *, until_step: int | None = None
+) -> dict[str, Any]:
+    """Rebuild one episode's messages and end record from a trace file.
+
+    With `until_step`, only turns up to and including that step are read.
+    """
+    messages: list[Any] = []
+    user_messages: list[Any] = []
+    end: dict[str, Any] | None = None
+    for record in read_trace_records(path):
+        if record.get("episode") != episode:
+            continue
+        if record["type"] == "turn":
+            if until_step is not None and record["step"] > until_step:
+                continue
+            messages.extend(record.get("messages", []))
+            user_messages.extend(record.get("user_messages", []))
+        elif record["type"] == "end":
+            end = record
+    return {"messages": messages, "user_messages": user_messages, "end": end}
@@ -0,0 +1,128 @@
+"""Persistent conversation transcript for the simulated user."""
+
+import copy
+import logging
+from typing import Any
+
+from .usage import TokenUsage, usage_from_response
+
+logger = logging.getLogger(__name__)
+
+USER_PROMPT_TEMPLATE = "The assistant said: {message}\n\nRespond as a user."
+
+
+class UserTranscript:
+    """Simulated user's message history, kept across agent turns.
+
+    Mirrors the agent-side `messages`: system messages are fetched once and
+    every turn only appends the new assistant message, the user model's
+    replies and its tool results. Everything before the current turn is a
+    stable prefix that providers can serve from their prompt cache.
+    """
+
+    def __init__(self, simulated_user: Any) -> None:
+        self.simulated_user = simulated_user
+        self.messages: list[Any] = []
+        self.turn_usage: list[TokenUsage] = []
+        # Usage of the latest response
+        self.last_usage = TokenUsage()
+        self.prefix_len = 0
+        self.system_len = 0
+        self._started = False
+
+    async def start(self) -> None:
+        """Fetch the system messages once."""
+        if self._started:
+            return
+        self.messages = await self.simulated_user.get_system_messages()
+        self.prefix_len = self.system_len = len(self.messages)
+        self._started = True
+
+    async def restore(self, messages: list[Any]) -> None:
+        """Continue from a saved transcript instead of an empty one."""
+        await self.start()
+        if messages:
+            self.messages = messages
+            self.prefix_len = len(messages)
+
+    async def begin_turn(self, agent_message: str) -> int:
+        """Append the agent's message as the user model's next prompt.
+
+        Returns the transcript length before the turn, for `rollback`.
+        """
+        await self.start()
+        checkpoint = len(self.messages)
+        self.prefix_len = checkpoint
+        self._mark_cache_prefix()
+        prompt = USER_PROMPT_TEMPLATE.format(message=agent_message)
+        self.messages.extend(await self.simulated_user.format_message(prompt))
+        self.turn_usage.append(TokenUsage())
+        return checkpoint
+
+    async def get_response(self) -> Any:
+        """Get the user model's response to the transcript and record its usage."""
+        response = await self.simulated_user.get_response(self.messages)
+        self.last_usage = usage_from_response(response, self.messages)
+        if self.turn_usage:
+            self.turn_usage[-1] += self.last_usage
+        return response
+
+    async def add_tool_results(self, tool_calls: list[Any], tool_results: list[Any]) -> None:
+        """Append formatted tool results for the user's tool calls."""
+        self.messages.extend(
+            await self.simulated_user.format_tool_results(tool_calls, tool_results)
+        )
+
+    def rollback(self, checkpoint: int) -> None:
+        """Drop a failed turn so the next one starts from a consistent prefix."""
+        del self.messages[checkpoint:]
+        self.prefix_len = min(self.prefix_len, checkpoint)
+
+    @property
+    def usage(self) -> TokenUsage:
+        """Total usage across all turns."""
+        total = TokenUsage()
+        for turn in self.turn_usage:
+            total += turn
+        return total
+
+    def _mark_cache_prefix(self) -> None:
+        """Move the prompt-cache breakpoint to the end of the stable prefix.
+
+        Only Claude takes explicit breakpoints (it marks the last message
+        itself, this adds one more at the prefix boundary); OpenAI-compatible
+        providers cache stable prefixes automatically.
+        """
+        if not _uses_cache_control(self.simulated_user):
+            return
+        for message in self.messages:
+            for block in _content_blocks(message):
+                block.pop("cache_control", None)
+        # Responses appended by the provider hold SDK objects, so walk back
+        # to the last message with plain dict blocks
+        for message in reversed(self.messages[: self.prefix_len]):
+            blocks = _content_blocks(message)
+            if blocks:
+                blocks[-1]["cache_control"] = copy.copy(_EPHEMERAL)
+                return
+
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def _uses_cache_control(agent: Any) -> bool:
+    try:
+        return str(getattr(agent.agent_type(), "value", "")) == "claude"
+    except Exception:
+        return False
+
+
+def _content_blocks(message: Any) -> list[dict[str, Any]]:
+    """Dict content blocks of a message that can carry cache_control."""
+    if not isinstance(message, dict) or not isinstance(message.get("content"), list):
+        return []
+    return [
+        block
+        for block in message["content"]
+        if isinstance(block, dict) and block.get("type") not in ("thinking", "redacted_thinking")
+    ]
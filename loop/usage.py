@@ -0,0 +1,88 @@
+"""Token usage accounting for agent responses."""
+
+import json
+from dataclasses import asdict, dataclass
+from typing import Any
+
+
+@dataclass
+class TokenUsage:
+    """Token counts for one or more LLM calls."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    calls: int = 0
+    estimated: bool = False
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(
+            input_tokens=self.input_tokens + other.input_tokens,
+            output_tokens=self.output_tokens + other.output_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens,
+            calls=self.calls + other.calls,
+            estimated=self.estimated or other.estimated,
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+def estimate_tokens(obj: Any) -> int:
+    """Rough token count (~4 characters per token) for any message payload."""
+    if isinstance(obj, str):
+        return len(obj) // 4
+    return len(json.dumps(obj, default=str)) // 4
+
+
+def usage_from_response(response: Any, messages: list[Any] | None = None) -> TokenUsage:
+    """Read provider usage from a response, falling back to an estimate.
+
+    OpenAI-style (`prompt_tokens`) and Anthropic-style (`input_tokens`) usage
+    objects are read from `response.raw.usage` or `response.info["usage"]`.
+    Providers that report nothing get a character-based estimate.
+    """
+    raw = getattr(response, "raw", None)
+    usage = getattr(raw, "usage", None)
+    if usage is None:
+        usage = (getattr(response, "info", None) or {}).get("usage")
+    if isinstance(usage, dict):
+        usage = _AttrDict(usage)
+
+    if usage is not None:
+        input_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0)
+        output_tokens = getattr(usage, "completion_tokens", None) or getattr(
+            usage, "output_tokens", 0
+        )
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+        if cached is None:
+            cached = getattr(usage, "cache_read_input_tokens", 0)
+        return TokenUsage(
+            input_tokens=int(input_tokens or 0),
+            output_tokens=int(output_tokens or 0),
+            cached_tokens=int(cached or 0),
+            calls=1,
+        )
+
+    content = getattr(response, "content", None) or ""
+    tool_calls = getattr(response, "tool_calls", None) or []
+    return TokenUsage(
+        input_tokens=estimate_tokens(messages) if messages is not None else 0,
+        output_tokens=estimate_tokens(content)
+        + sum(estimate_tokens(getattr(tc, "arguments", None) or {}) for tc in tool_calls),
+        calls=1,
+        estimated=True,
+    )
+
+
+class _AttrDict(dict):
+    """Attribute access for usage dicts."""
+
+    def __getattr__(self, name: str) -> Any:
+        value = self.get(name)
+        return _AttrDict(value) if isinstance(value, dict) else value
@@ -1,3 +1,9 @@
+from .appliances import appliance_agent_instruction, appliance_user_instruction
 from .prompts import AGENT_INSTRUCTION, USER_INSTRUCTION
 
-__all__ = ["AGENT_INSTRUCTION", "USER_INSTRUCTION"]
\ No newline at end of file
+__all__ = [
+    "AGENT_INSTRUCTION",
+    "USER_INSTRUCTION",
+    "appliance_agent_instruction",
+    "appliance_user_instruction",
+]
\ No newline at end of file
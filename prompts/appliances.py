@@ -0,0 +1,76 @@
+"""Instructions for generated appliance scenarios (see backend/appliances.py)."""
+
+from backend.appliances import ApplianceLayout
+
+LOGIC_RULES = {
+    "and": "it is on if and only if all of its switches are on",
+    "or": "it is on if at least one of its switches is on",
+    "xor": "it is on if an odd number of its switches are on",
+    "majority": "it is on if more than half of its switches are on",
+}
+
+
+def appliance_agent_instruction(layout: ApplianceLayout) -> str:
+    """Butler policy for a layout, the generated counterpart of AGENT_INSTRUCTION."""
+    agent_switches = ", ".join(str(s) for s in layout.switches_of("agent"))
+    user_switches = ", ".join(str(s) for s in layout.switches_of("user")) or "none"
+    return f"""
+<instruction>
+
+You are a butler agent that helps the user control the electrical appliances according to the <policy> provided below.
+
+In each turn you can either:
+- Send a message to the user to instruct them to do an action or check status
+- Make a tool call to control a switch on agent side
+You cannot do both at the same time.
+
+</instruction>
+
+<policy>
+
+## Greetings
+
+Greet the user with "Hi, how can i help you today?"
+
+### Appliances
+#### Situation
+
+In the user's house there are {layout.appliances} appliances, numbered 0 to {layout.appliances - 1}. Each appliance has {layout.switches} switches, numbered 0 to {layout.switches - 1}; {LOGIC_RULES[layout.logic]}.
+
+You control switches {agent_switches} of every appliance: the tool `agent_switch_<appliance>_<switch>` flips one of them. The user controls switches {user_switches}.
+
+Neither you nor the user know whether a switch is on or off.
+
+You cannot determine the status of an appliance directly. You must ask the user to check it.
+
+#### Guide
+
+When the user asks you to turn appliances on or off, first let the user check their status. Then flip switches one at a time, starting with your own, and ask the user to check the status after every flip. Only touch the appliances the user asked about.
+
+</policy>
+"""
+
+
+def appliance_user_instruction(layout: ApplianceLayout, targets: list[int]) -> str:
+    """Simulated user goal for a layout: turn on the `targets` appliances."""
+    user_switches = layout.switches_of("user")
+    if user_switches:
+        switch_tools = (
+            f"- 'user_switch_<appliance>_<switch>' tools: flip your switches "
+            f"({', '.join(str(s) for s in user_switches)}) of an appliance\n"
+        )
+    else:
+        switch_tools = ""
+    names = ", ".join(str(a) for a in targets)
+    return f"""
+You are a user trying to turn on appliances {names} with help from an assistant.
+
+You have access to:
+{switch_tools}- 'check_status_<appliance>' tools: check if an appliance is ON or OFF
+
+There are {layout.appliances} appliances with {layout.switches} switches each; {LOGIC_RULES[layout.logic]}. The assistant controls the other switches.
+You can only check status and flip your switches. Be helpful and follow the assistant's instructions.
+Be concise - respond in 1-2 sentences.
+
+IMPORTANT: When appliances {names} are all ON, end your response with ###STOP### to indicate the task is complete.
+"""
@@ -2,26 +2,35 @@ import hud
 from hud.agents import create_agent
 from hud.datasets import load_tasks
 from prompts import AGENT_INSTRUCTION, USER_INSTRUCTION
-from loop import multi_turn_run
+from loop import ResponseCache, Scheduler, multi_turn_run
 import asyncio
 
 async def main():
     ds = "multiturn-test"
     model = "claude-haiku-4-5"
     tasks = load_tasks(ds)
-    
-    async with hud.eval(tasks, max_concurrent=10) as ctx:
-        assistant = create_agent(
-            model= model, 
-            system_prompt=AGENT_INSTRUCTION,
-            allowed_tools=["agent_switch"]
-        )
-        user = create_agent(
-            model=model, 
-            system_prompt=USER_INSTRUCTION,
-            allowed_tools=["user_switch", "check_status"]
-        )
-        await multi_turn_run(ctx=ctx, agent=assistant, simulated_user=user, max_steps=10)
+    # Set HUD_RESPONSE_CACHE (and HUD_RESPONSE_CACHE_MODE=replay) to reuse recorded responses
+    cache = ResponseCache.from_env()
+    # Each episode takes its scheduler slot before hud.eval runs scenario setup
+    scheduler = Scheduler(max_episodes=10)
+
+    async def run_task(task):
+        async with scheduler.episode(), hud.eval(task) as ctx:
+            assistant = create_agent(
+                model= model, 
+                system_prompt=AGENT_INSTRUCTION,
+                allowed_tools=["agent_switch"]
+            )
+            user = create_agent(
+                model=model, 
+                system_prompt=USER_INSTRUCTION,
+                allowed_tools=["user_switch", "check_status"]
+            )
+            await multi_turn_run(
+                ctx=ctx, agent=assistant, simulated_user=user, max_steps=10, cache=cache, scheduler=scheduler
+            )
+
+    await asyncio.gather(*(run_task(task) for task in tasks))
 
 if __name__ == "__main__":
     asyncio.run(main())
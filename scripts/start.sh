@@ -0,0 +1,6 @@
+# Container entrypoint: start the backends unless env.py hosts them in-process
+case "${BACKEND_TRANSPORT:-http}" in
+  asgi|direct) exec python env.py ;;
+  # env.py's init() polls the backends' /health, so both start at once
+  *) python -m backend.serve >&2 & exec python env.py ;;
+esac
@@ -0,0 +1,3 @@
+export AGENT_BACKEND_PORT=8001
+export USER_BACKEND_PORT=8002
+python -m backend.serve
\ No newline at end of file
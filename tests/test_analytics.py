@@ -0,0 +1,47 @@
+import math
+
+import pytest
+
+from loop.analytics import percentiles, wilson_ci
+
+
+def test_percentiles_interpolate_between_ranks() -> None:
+    assert percentiles([4, 1, 3, 2], (0, 50, 100)) == {"p0": 1.0, "p50": 2.5, "p100": 4.0}
+    assert percentiles([7], (50, 99)) == {"p50": 7.0, "p99": 7.0}
+
+
+def test_percentiles_of_nothing() -> None:
+    assert math.isnan(percentiles([], (50,))["p50"])
+    assert percentiles([], (50, 99), empty=0.0) == {"p50": 0.0, "p99": 0.0}
+
+
+def test_percentiles_match_numpy() -> None:
+    np = pytest.importorskip("numpy")
+    values = np.random.default_rng(0).exponential(size=501)
+    expected = np.percentile(values, [50, 90, 99])
+    assert list(percentiles(values).values()) == pytest.approx(expected.tolist())
+
+
+def test_wilson_interval_stays_inside_zero_and_one() -> None:
+    ci = wilson_ci(0, 20)
+    assert ci["rate"] == 0 and ci["ci_low"] == pytest.approx(0, abs=1e-12)
+    assert 0 < ci["ci_high"] < 0.2
+    assert math.isnan(wilson_ci(0, 0)["rate"])
+
+
+def test_summary_of_batch_results() -> None:
+    pytest.importorskip("numpy")
+    from loop.analytics import EpisodeTable, summarize
+
+    results = [
+        {"index": 0, "reward": 1.0, "is_error": False, "steps": 2, "duration": 1.0},
+        {"index": 1, "reward": 0.0, "is_error": False, "steps": 4, "duration": 3.0},
+        {"index": 2, "reward": None, "is_error": True, "steps": 1, "duration": 2.0},
+    ]
+    summary = summarize(EpisodeTable.from_results(results))
+
+    assert summary["episodes"] == 3 and summary["errors"] == 1
+    assert summary["reward"]["n"] == 2 and summary["reward"]["mean"] == 0.5
+    assert summary["success"]["rate"] == pytest.approx(1 / 3)
+    assert summary["steps"]["p50"] == 2.0
+    assert summary["duration_s"]["p50"] == 2.0
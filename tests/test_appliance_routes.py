@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+from backend.agent import app
+from backend.store import EPISODE_HEADER
+
+HEADERS = {EPISODE_HEADER: "appliance-routes"}
+
+
+def test_appliance_state_is_a_read() -> None:
+    client = TestClient(app)
+    client.post("/appliances/reset", headers=HEADERS, json={"layout": "2x2:and", "masks": [0, 0]})
+    client.post("/appliances/switch", headers=HEADERS, json={"appliance": 1, "switch": 0})
+
+    response = client.get("/appliances/state", headers=HEADERS)
+    assert response.status_code == 200
+    assert response.json() == {"layout": "2x2:and", "masks": [0, 1], "on": []}
+    assert client.post("/appliances/state", headers=HEADERS).status_code == 405
+
+
+def test_appliance_errors_map_to_http_status() -> None:
+    client = TestClient(app)
+    assert client.get("/appliances/state", headers={EPISODE_HEADER: "missing"}).status_code == 404
+    client.post("/appliances/reset", headers=HEADERS, json={"layout": "2x2:and"})
+
+    def switch(number: int) -> int:
+        json = {"appliance": 0, "switch": number}
+        return client.post("/appliances/switch", headers=HEADERS, json=json).status_code
+
+    assert switch(9) == 400
+    # Odd switches are the user's
+    assert switch(1) == 403
@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any
+
+from backend.client import BatchCoalescer
+from backend.store import EPISODE_HEADER
+
+
+class Response:
+    def __init__(self, ops: list[str]) -> None:
+        self.ops = ops
+
+    def json(self) -> dict[str, Any]:
+        return {"results": [f"{op}-result" for op in self.ops]}
+
+
+class Backend:
+    def __init__(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.batches: list[dict[str, Any]] = []
+
+    async def post(self, path: str, *, headers: dict, json: dict, **kwargs: Any) -> Response:
+        self.batches.append({"episode": headers[EPISODE_HEADER], "ops": json["ops"], **kwargs})
+        if self.error is not None:
+            raise self.error
+        return Response(json["ops"])
+
+
+def submit_all(coalescer: BatchCoalescer, calls: list[tuple[str, str]]) -> list[Any]:
+    async def run() -> list[Any]:
+        return await asyncio.gather(
+            *(coalescer.submit(episode, op) for episode, op in calls), return_exceptions=True
+        )
+
+    return asyncio.run(run())
+
+
+def test_concurrent_operations_share_one_round_trip_per_episode() -> None:
+    backend = Backend()
+    coalescer = BatchCoalescer(backend, reads={"state"})
+    results = submit_all(coalescer, [("a", "flip"), ("a", "state"), ("a", "state"), ("b", "state")])
+
+    assert results == ["flip-result", "state-result", "state-result", "state-result"]
+    # Consecutive identical reads go out once
+    assert [(b["episode"], b["ops"]) for b in backend.batches] == [
+        ("a", ["flip", "state"]),
+        ("b", ["state"]),
+    ]
+    assert [b["idempotent"] for b in backend.batches] == [False, True]
+    assert coalescer.batches == 2 and coalescer.ops == 4
+
+
+def test_a_failed_batch_fails_each_of_its_operations() -> None:
+    coalescer = BatchCoalescer(Backend(RuntimeError("down")), reads={"state"})
+    results = submit_all(coalescer, [("a", "flip"), ("a", "state")])
+    assert [str(result) for result in results] == ["down", "down"]
+
+
+def test_cancelled_operations_are_not_sent() -> None:
+    backend = Backend()
+    coalescer = BatchCoalescer(backend, reads={"state"})
+
+    async def run() -> Any:
+        flip = asyncio.create_task(coalescer.submit("a", "flip"))
+        state = asyncio.create_task(coalescer.submit("a", "state"))
+        await asyncio.sleep(0)
+        # E.g. the tool call's deadline passed before the batch went out
+        flip.cancel()
+        return await state
+
+    assert asyncio.run(run()) == "state-result"
+    assert [b["ops"] for b in backend.batches] == [["state"]]
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+
+from loop.budget import BudgetExceeded, BudgetTracker, EpisodeBudget
+from loop.usage import TokenUsage
+
+
+def test_turn_deadline_cancels_the_turn() -> None:
+    tracker = BudgetTracker(EpisodeBudget(turn_seconds=0.05))
+    cancelled = False
+
+    async def run() -> None:
+        nonlocal cancelled
+        async with tracker.turn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled = True
+                raise
+
+    with pytest.raises(BudgetExceeded) as info:
+        asyncio.run(run())
+    assert info.value.limit == "turn_seconds" and cancelled
+    assert tracker.report()["exceeded"] == "turn_seconds"
+
+
+def test_spent_episode_time_fails_the_next_turn_at_once() -> None:
+    tracker = BudgetTracker(EpisodeBudget(episode_seconds=0.01, turn_seconds=5))
+    tracker.started -= 1
+
+    async def run() -> None:
+        async with tracker.turn():
+            pytest.fail("the turn must not start")
+
+    with pytest.raises(BudgetExceeded, match="episode_seconds"):
+        asyncio.run(run())
+
+
+def test_timeouts_inside_the_turn_are_not_budget_failures() -> None:
+    tracker = BudgetTracker(EpisodeBudget(turn_seconds=5))
+
+    async def run() -> None:
+        async with tracker.turn():
+            await asyncio.wait_for(asyncio.sleep(1), timeout=0.01)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
+    assert tracker.exceeded is None
+
+
+def test_token_budgets_count_both_turn_and_episode() -> None:
+    tracker = BudgetTracker(EpisodeBudget(episode_tokens=350, turn_tokens=150))
+
+    async def turn(*responses: int) -> None:
+        async with tracker.turn():
+            for tokens in responses:
+                tracker.charge(TokenUsage(input_tokens=tokens))
+
+    asyncio.run(turn(100))
+    with pytest.raises(BudgetExceeded, match="turn_tokens"):
+        asyncio.run(turn(100, 100))
+    with pytest.raises(BudgetExceeded, match="episode_tokens"):
+        asyncio.run(turn(100))
+    assert tracker.report()["tokens"] == 400
+
+
+def test_unlimited_budget_never_interrupts() -> None:
+    tracker = BudgetTracker(EpisodeBudget())
+
+    async def run() -> str:
+        async with tracker.turn():
+            await asyncio.sleep(0)
+            tracker.charge(TokenUsage(input_tokens=10**9))
+        return "done"
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,95 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from loop.cache import CacheMiss, ResponseCache
+
+
+class Response:
+    def __init__(self, content: str) -> None:
+        self.content = content
+
+    def model_dump(self, **kwargs: Any) -> dict[str, Any]:
+        return {"content": self.content}
+
+
+class Agent:
+    model = "m"
+    system_prompt = "be brief"
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def get_tool_schemas(self) -> list[dict[str, Any]]:
+        return [{"name": "agent_switch"}]
+
+    async def get_response(self, messages: list[Any]) -> Response:
+        self.calls += 1
+        messages.append({"role": "assistant", "content": "on"})
+        return Response("on")
+
+
+def test_key_ignores_cache_hints_and_key_order() -> None:
+    agent = Agent()
+    plain = [{"role": "user", "content": [{"type": "text", "text": "hi"}]}]
+    hinted = [
+        {
+            "content": [{"text": "hi", "type": "text", "cache_control": {"type": "ephemeral"}}],
+            "role": "user",
+        }
+    ]
+    assert ResponseCache.make_key(agent, plain) == ResponseCache.make_key(agent, hinted)
+
+    other = Agent()
+    other.model = "n"
+    assert ResponseCache.make_key(agent, plain) != ResponseCache.make_key(other, plain)
+    assert ResponseCache.make_key(agent, plain) != ResponseCache.make_key(agent, plain * 2)
+
+
+def test_miss_calls_the_model_and_stores_the_response(tmp_path: Path) -> None:
+    cache, agent = ResponseCache(tmp_path), Agent()
+    cache.wrap(agent)
+    messages: list[Any] = [{"role": "user", "content": "hi"}]
+    key = ResponseCache.make_key(agent, messages)
+
+    assert asyncio.run(agent.get_response(messages)).content == "on"
+    assert agent.calls == 1 and cache.stats()["misses"] == 1
+    assert cache.get(key) == {
+        "response": {"content": "on"},
+        "appended": [{"role": "assistant", "content": "on"}],
+    }
+
+
+def test_replay_miss_raises(tmp_path: Path) -> None:
+    cache, agent = ResponseCache(tmp_path, mode="replay"), Agent()
+    cache.wrap(agent)
+    with pytest.raises(CacheMiss):
+        asyncio.run(agent.get_response([{"role": "user", "content": "hi"}]))
+    assert agent.calls == 0
+
+
+def test_hit_replays_the_appended_messages(tmp_path: Path) -> None:
+    pytest.importorskip("hud")
+    cache, agent = ResponseCache(tmp_path), Agent()
+    messages: list[Any] = [{"role": "user", "content": "hi"}]
+    cache.put(
+        ResponseCache.make_key(agent, messages),
+        {"response": {"content": "on"}, "appended": [{"role": "assistant", "content": "on"}]},
+    )
+    cache.wrap(agent)
+
+    response = asyncio.run(agent.get_response(messages))
+    assert response.content == "on" and agent.calls == 0 and cache.hits == 1
+    assert messages[-1] == {"role": "assistant", "content": "on"}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path: Path) -> None:
+    cache = ResponseCache(tmp_path, max_bytes=60)
+    cache.put("aa1", {"v": "x" * 20})
+    cache.put("bb2", {"v": "x" * 20})
+    cache.get("aa1")
+    cache.put("cc3", {"v": "x" * 20})
+    assert cache.get("aa1") is not None and cache.get("cc3") is not None
+    assert cache.get("bb2") is None
@@ -0,0 +1,93 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from loop.batch import _takes_state
+from loop.checkpoint import CheckpointStore, _call_hidden_tool
+from loop.resume import ResumePoint
+
+
+def test_checkpoints_move_from_running_to_done(tmp_path: Path) -> None:
+    checkpoint = CheckpointStore(tmp_path, fsync=False).episode("000001-task")
+    point = ResumePoint(messages=["m"], user_messages=["u"], step=2, state={"agent_switch": True})
+
+    async def run() -> None:
+        await checkpoint.save_turn(point)
+        record = checkpoint.load()
+        assert checkpoint.resume_point(record) == point
+        await checkpoint.end(point, "done talking", False)
+        assert checkpoint.resume_point() is None
+        await checkpoint.finish({"reward": 1.0})
+
+    asyncio.run(run())
+    record = checkpoint.load()
+    assert record["status"] == "done"
+    assert record["result"] == {"reward": 1.0}
+    # What a rerun of the episode returns instead of running it again
+    assert record["content"] == "done talking" and record["step"] == 2
+    assert checkpoint.store.results() == [{"reward": 1.0}]
+
+
+def test_cleared_checkpoint_starts_over(tmp_path: Path) -> None:
+    checkpoint = CheckpointStore(tmp_path, fsync=False).episode("e")
+    asyncio.run(checkpoint.save_turn(ResumePoint(messages=[], step=1)))
+    asyncio.run(checkpoint.clear())
+    assert checkpoint.load() is None
+    asyncio.run(checkpoint.clear())
+
+
+async def bulb(snapshot: str | None = None, state: dict | None = None):
+    yield "prompt"
+
+
+async def appliances(layout: str, seed: int = 0):
+    yield "prompt"
+
+
+def task(scenario: str, scenarios: dict | None = None) -> SimpleNamespace:
+    env = SimpleNamespace(_scenarios=scenarios) if scenarios is not None else None
+    return SimpleNamespace(scenario=scenario, env=env)
+
+
+def test_state_only_goes_to_scenarios_taking_it() -> None:
+    local = {"bulb": bulb, "appliances": appliances}
+    assert _takes_state(task("bulb", local), ())
+    assert _takes_state(task("multi-turn:bulb", local), ())
+    assert not _takes_state(task("appliances", local), ("appliances",))
+    # Remote scenarios cannot be inspected before the eval starts them
+    assert _takes_state(task("multi-turn:bulb"), ("bulb",))
+    assert not _takes_state(task("multi-turn:appliances"), ("bulb",))
+
+
+class Connection:
+    def __init__(self, result: object) -> None:
+        self.result = result
+        self.calls: list[tuple[str, dict]] = []
+
+    async def call_tool(self, name: str, arguments: dict) -> object:
+        self.calls.append((name, arguments))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class Ctx:
+    def __init__(self, *connections: Connection) -> None:
+        self.connections = {f"c{i}": c for i, c in enumerate(connections)}
+
+    async def call_tool(self, name: str) -> object:
+        raise ValueError(f"Tool not found: {name}")
+
+
+def test_hidden_tools_are_asked_of_each_connection() -> None:
+    failing, answering = Connection(RuntimeError("unknown tool")), Connection("state")
+    ctx = Ctx(failing, answering)
+    assert asyncio.run(_call_hidden_tool(ctx, "_checkpoint_state")) == "state"
+    assert answering.calls == [("_checkpoint_state", {})]
+
+    with pytest.raises(ValueError):
+        asyncio.run(_call_hidden_tool(ctx, "checkpoint_state"))
+    with pytest.raises(RuntimeError, match="No connection answered"):
+        asyncio.run(_call_hidden_tool(Ctx(failing), "_checkpoint_state"))
@@ -0,0 +1,118 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+from loop.coalesce import BatchItem, RequestCoalescer, concurrent_batch_call
+
+
+class Response:
+    def __init__(self, content: str) -> None:
+        self.content = content
+        self.tool_calls: list[Any] = []
+
+    def model_dump(self, **kwargs: Any) -> dict[str, Any]:
+        return {"content": self.content, "tool_calls": []}
+
+
+class Config:
+    def model_dump(self) -> dict[str, Any]:
+        return {"temperature": 0.0}
+
+
+class Agent:
+    model = "m"
+    system_prompt = "help"
+    config = Config()
+
+    def __init__(self, delay: float = 0.01) -> None:
+        self.delay = delay
+        self.calls = 0
+
+    def get_tool_schemas(self) -> list[Any]:
+        return []
+
+    async def get_response(self, messages: list[Any]) -> Response:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        reply = f"re: {messages[-1]['content']}"
+        messages.append({"role": "assistant", "content": reply})
+        return Response(reply)
+
+
+def ask(coalescer: RequestCoalescer, agents: list[Agent], questions: list[str]) -> list[Any]:
+    histories = [[{"role": "user", "content": question}] for question in questions]
+
+    async def run() -> list[Any]:
+        return await asyncio.gather(
+            *(
+                coalescer.call(agent, agent.get_response, history)
+                for agent, history in zip(agents, histories)
+            )
+        )
+
+    asyncio.run(run())
+    return histories
+
+
+def test_without_dedupe_every_request_is_sent() -> None:
+    coalescer, agents = RequestCoalescer(), [Agent(), Agent()]
+    histories = ask(coalescer, agents, ["hi", "hi"])
+    assert [agent.calls for agent in agents] == [1, 1]
+    assert histories[1][-1] == {"role": "assistant", "content": "re: hi"}
+    assert coalescer.stats() == {"requests": 2, "sent": 2, "deduped": 0, "batches": 0}
+
+
+def test_batch_call_gets_the_requests_of_one_window() -> None:
+    batches: list[list[BatchItem]] = []
+    send = concurrent_batch_call()
+
+    async def batch_call(items: list[BatchItem]) -> list[Any]:
+        batches.append(items)
+        return await send(items)
+
+    coalescer = RequestCoalescer(batch_call=batch_call, window=0.05)
+    histories = ask(coalescer, [Agent(), Agent(), Agent()], ["a", "b", "c"])
+
+    assert [len(batch) for batch in batches] == [3]
+    assert [history[-1]["content"] for history in histories] == ["re: a", "re: b", "re: c"]
+
+
+def test_failed_batch_call_fails_its_requests() -> None:
+    async def batch_call(items: list[BatchItem]) -> list[Any]:
+        raise ConnectionError("no backend")
+
+    coalescer = RequestCoalescer(batch_call=batch_call)
+    with pytest.raises(ConnectionError):
+        ask(coalescer, [Agent()], ["a"])
+
+
+def test_identical_requests_are_sent_once_with_dedupe() -> None:
+    pytest.importorskip("hud")
+    coalescer, agents = RequestCoalescer(dedupe=True), [Agent(), Agent(), Agent()]
+    histories = ask(coalescer, agents, ["hi", "hi", "other"])
+
+    assert sum(agent.calls for agent in agents) == 2
+    assert coalescer.stats()["deduped"] == 1
+    assert histories[0][-1] == histories[1][-1] == {"role": "assistant", "content": "re: hi"}
+    # Each history gets its own copy of the shared reply
+    assert histories[0][-1] is not histories[1][-1]
+
+
+def test_a_cancelled_waiter_does_not_cancel_the_shared_request() -> None:
+    pytest.importorskip("hud")
+    coalescer, owner, follower = RequestCoalescer(dedupe=True), Agent(0.05), Agent(0.05)
+
+    async def run() -> Any:
+        first = asyncio.create_task(
+            coalescer.call(owner, owner.get_response, [{"role": "user", "content": "hi"}])
+        )
+        second = asyncio.create_task(
+            coalescer.call(follower, follower.get_response, [{"role": "user", "content": "hi"}])
+        )
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()).content == "re: hi"
+    assert owner.calls + follower.calls == 1
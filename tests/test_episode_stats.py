@@ -0,0 +1,53 @@
+import asyncio
+
+from loop.coalesce import RequestCoalescer
+from loop.episode_stats import count, episode_counts, episode_stats
+
+
+async def _count(layer: object) -> None:
+    count(layer, "requests")
+
+
+def test_counts_belong_to_the_episode_that_made_them() -> None:
+    layer = object()
+
+    async def episode(requests: int) -> int:
+        with episode_stats():
+            for _ in range(requests):
+                await asyncio.sleep(0)
+                # Tasks the episode starts count into it too
+                await asyncio.create_task(_count(layer))
+            return episode_counts(layer)["requests"]
+
+    async def run() -> list[int]:
+        return await asyncio.gather(episode(1), episode(3))
+
+    assert asyncio.run(run()) == [1, 3]
+    count(layer, "requests")
+    assert episode_counts(layer)["requests"] == 0
+
+
+class Response:
+    def model_dump(self, **kwargs: object) -> dict:
+        return {}
+
+
+def test_coalescer_reports_episode_and_process_counts() -> None:
+    coalescer = RequestCoalescer()
+
+    async def get_response(messages: list) -> Response:
+        return Response()
+
+    async def episode(requests: int) -> dict:
+        with episode_stats():
+            for _ in range(requests):
+                await coalescer.call(None, get_response, [])
+            return coalescer.stats(episode=True)
+
+    async def run() -> list[dict]:
+        return await asyncio.gather(episode(2), episode(1))
+
+    first, second = asyncio.run(run())
+    assert first == {"requests": 2, "sent": 2, "deduped": 0}
+    assert second == {"requests": 1, "sent": 1, "deduped": 0}
+    assert coalescer.stats()["requests"] == 3
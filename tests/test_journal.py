@@ -0,0 +1,95 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from backend.journal import OLD_WAL_FILE, SNAPSHOT_FILE, WAL_FILE, Journal, read_states
+from backend.store import StateStore
+
+
+def durable_store(directory: Path, **kwargs) -> StateStore:
+    return StateStore(journal=Journal(directory, fsync="never", **kwargs))
+
+
+def test_restart_replays_the_log(tmp_path: Path) -> None:
+    store = durable_store(tmp_path)
+    store.flip("a", "agent_switch")
+    store.flip("b", "user_switch")
+    store.flip("b", "agent_switch")
+    store.release("a")
+    store.journal.close()
+
+    restarted = durable_store(tmp_path)
+    assert "a" not in restarted._states
+    assert restarted.get("b").agent_switch and restarted.get("b").user_switch
+    restarted.journal.close()
+
+
+def test_torn_last_record_is_dropped(tmp_path: Path) -> None:
+    store = durable_store(tmp_path)
+    store.flip("a", "agent_switch")
+    store.journal.close()
+    with open(tmp_path / WAL_FILE, "a") as fp:
+        fp.write('{"n":2,"e":"a","s":{"agent_sw')
+
+    restarted = durable_store(tmp_path)
+    assert restarted.get("a").agent_switch
+    restarted.flip("a", "user_switch")
+    restarted.journal.close()
+    assert read_states(tmp_path)["a"] == {"agent_switch": True, "user_switch": True}
+
+
+def test_compaction_snapshots_every_episode_and_starts_a_new_log(tmp_path: Path) -> None:
+    store = durable_store(tmp_path, compact_every=3)
+    for episode in ("a", "b", "c", "d"):
+        store.flip(episode, "agent_switch")
+
+    assert store.journal.compactions == 1
+    assert not (tmp_path / OLD_WAL_FILE).exists()
+    snapshot = json.loads((tmp_path / SNAPSHOT_FILE).read_text())
+    assert sorted(snapshot["episodes"]) == ["a", "b", "c"]
+    assert len((tmp_path / WAL_FILE).read_text().splitlines()) == 1
+    store.journal.close()
+    assert sorted(read_states(tmp_path)) == ["a", "b", "c", "d"]
+
+
+def test_interrupted_compaction_is_finished_on_startup(tmp_path: Path) -> None:
+    store = durable_store(tmp_path, compact_every=1000)
+    store.flip("a", "agent_switch")
+    # Crash after the log was set aside, before the snapshot was written
+    journal = store.journal
+    journal.start_compaction({"a": store.get("a").snapshot()})
+    journal._compacting = None
+    journal._old_wal.close()
+    store.flip("b", "user_switch")
+    journal.close()
+    assert (tmp_path / OLD_WAL_FILE).exists()
+
+    restarted = durable_store(tmp_path)
+    assert restarted.get("a").agent_switch and restarted.get("b").user_switch
+    assert not (tmp_path / OLD_WAL_FILE).exists()
+    restarted.journal.close()
+
+
+def test_one_writer_per_directory(tmp_path: Path) -> None:
+    journal = Journal(tmp_path, fsync="never")
+    with pytest.raises(RuntimeError, match="already written"):
+        Journal(tmp_path, fsync="never")
+    journal.close()
+    Journal(tmp_path, fsync="never").close()
+
+
+def test_importing_the_store_does_not_open_the_journal(tmp_path: Path) -> None:
+    journal = Journal(tmp_path, fsync="never")
+    try:
+        # E.g. env.py next to backend.serve, which holds the directory
+        subprocess.run(
+            [sys.executable, "-c", "import backend.store, backend.client"],
+            check=True,
+            cwd=Path(__file__).parent.parent,
+            env={"BACKEND_DB_DIR": str(tmp_path), "PATH": ""},
+        )
+    finally:
+        journal.close()
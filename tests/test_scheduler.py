@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+
+from loop.scheduler import AIMDLimiter, RetryPolicy, Scheduler
+
+
+class Throttled(Exception):
+    status_code = 429
+
+
+def test_episode_slots_cap_concurrency() -> None:
+    scheduler = Scheduler(max_episodes=2)
+    running = peak = 0
+
+    async def episode() -> None:
+        nonlocal running, peak
+        async with scheduler.episode():
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def run() -> None:
+        await asyncio.gather(*(episode() for _ in range(6)))
+
+    asyncio.run(run())
+    assert peak == 2
+
+
+def test_nested_episode_reuses_the_held_slot() -> None:
+    scheduler = Scheduler(max_episodes=1)
+
+    async def multi_turn_run() -> None:
+        async with scheduler.episode():
+            assert scheduler.episodes.in_flight == 1
+
+    async def run() -> None:
+        # A driver holds the slot around hud.eval; multi_turn_run asks again
+        async with scheduler.episode():
+            await asyncio.wait_for(multi_turn_run(), timeout=1)
+        assert scheduler.episodes.in_flight == 0
+
+    asyncio.run(run())
+
+
+def test_other_schedulers_still_take_their_own_slot() -> None:
+    outer, inner = Scheduler(max_episodes=1), Scheduler(max_episodes=1)
+
+    async def run() -> None:
+        async with outer.episode(), inner.episode():
+            assert outer.episodes.in_flight == inner.episodes.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_throttled_calls_are_retried_and_shrink_the_limit() -> None:
+    scheduler = Scheduler(retry=RetryPolicy(base_delay=0.0, max_delay=0.0))
+    calls = 0
+
+    async def get_response(messages: list) -> str:
+        nonlocal calls
+        calls += 1
+        if calls < 3:
+            raise Throttled()
+        return "ok"
+
+    limit_before = scheduler._model("m").requests.limit
+    assert asyncio.run(scheduler.call("m", get_response, ["hi"])) == "ok"
+    assert calls == 3 and scheduler.retries == 2
+    assert scheduler._model("m").requests.limit < limit_before
+
+
+def test_aimd_limit_grows_on_success_and_halves_on_throttle() -> None:
+    limiter = AIMDLimiter(initial=4, minimum=1)
+    limiter.on_success()
+    assert limiter.limit == pytest.approx(4.25)
+    limiter.on_throttle()
+    assert limiter.limit == pytest.approx(2.125)
+    for _ in range(5):
+        limiter.on_throttle()
+    assert limiter.limit == 1
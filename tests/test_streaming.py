@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any
+
+import pytest
+
+pytest.importorskip("hud")
+
+from loop.streaming import StopScanner, _create_stream  # noqa: E402
+
+SIGNAL = "###STOP###"
+
+
+def feed_all(deltas: list[str]) -> tuple[StopScanner, list[bool]]:
+    scanner = StopScanner(SIGNAL)
+    return scanner, [scanner.feed(delta) for delta in deltas]
+
+
+def test_signal_within_one_delta() -> None:
+    scanner, seen = feed_all(["All good. ", "Thanks ###STOP### bye", "more"])
+    assert seen == [False, True, True]
+    assert scanner.text == "All good. Thanks ###STOP###"
+
+
+def test_signal_split_across_deltas() -> None:
+    scanner, seen = feed_all(["It is on #", "##ST", "O", "P### trailing"])
+    assert seen == [False, False, False, True]
+    assert scanner.text == "It is on ###STOP###"
+
+
+def test_signal_split_into_single_characters() -> None:
+    scanner, seen = feed_all(list("ok" + SIGNAL + "!"))
+    assert seen.index(True) == len("ok" + SIGNAL) - 1
+    assert scanner.text == "ok" + SIGNAL
+
+
+def test_near_misses_do_not_stop() -> None:
+    scanner, seen = feed_all(["###STO", "P## ", "##", "#STOP"])
+    assert not any(seen) and not scanner.stopped
+    assert scanner.text == "###STOP## ###STOP"
+
+
+class BadRequest(Exception):
+    status_code = 400
+
+
+def test_stream_options_are_dropped_for_servers_rejecting_them() -> None:
+    calls: list[dict[str, Any]] = []
+
+    async def create(**kwargs: Any) -> str:
+        calls.append(kwargs)
+        if "stream_options" in kwargs:
+            raise BadRequest("unknown field stream_options")
+        return "stream"
+
+    assert asyncio.run(_create_stream(create, {"model": "m"})) == "stream"
+    assert calls == [
+        {"model": "m", "stream": True, "stream_options": {"include_usage": True}},
+        {"model": "m", "stream": True},
+    ]
+
+
+def test_other_errors_and_caller_stream_options_are_not_retried() -> None:
+    calls: list[dict[str, Any]] = []
+
+    async def create(**kwargs: Any) -> str:
+        calls.append(kwargs)
+        raise BadRequest("bad")
+
+    with pytest.raises(BadRequest):
+        asyncio.run(_create_stream(create, {"stream_options": {"include_usage": False}}))
+    assert len(calls) == 1
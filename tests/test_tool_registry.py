@@ -0,0 +1,107 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Any
+
+from loop.tool_registry import ToolRegistry
+
+
+class Tool:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def model_dump_json(self) -> str:
+        return self.name
+
+
+@dataclass
+class Categorized:
+    generic: list[Any] = field(default_factory=list)
+
+
+class Config:
+    def __init__(self, allowed: list[str] | None) -> None:
+        self.allowed_tools = allowed
+
+    def model_dump(self, exclude: Any = None) -> dict[str, Any]:
+        return {"allowed_tools": self.allowed_tools}
+
+
+class Console:
+    def info(self, message: str) -> None:
+        pass
+
+
+class Ctx:
+    name = "env"
+    _tool_routing_built = True
+
+    def as_tools(self) -> list[Tool]:
+        return [Tool("agent_switch"), Tool("user_switch"), Tool("check_status")]
+
+
+SET_UP: list[Any] = []
+
+
+class Agent:
+    """Mimics the tool setup of hud's MCPAgent."""
+
+    def __init__(self, allowed: list[str] | None = None) -> None:
+        self.config = Config(allowed)
+        self.console = Console()
+        self._initialized = False
+
+    async def _initialize_from_ctx(self, ctx: Ctx) -> None:
+        SET_UP.append(self)
+        self._available_tools = ctx.as_tools()
+        self._tool_map = {t.name: t for t in self._available_tools}
+        self._categorized_tools = self.categorize_tools()
+        self._on_tools_ready()
+        self._initialized = True
+
+    def categorize_tools(self) -> Categorized:
+        return Categorized(generic=list(self._available_tools))
+
+    def _on_tools_ready(self) -> None:
+        self.converted = [{"name": t.name} for t in self._available_tools]
+
+    def get_tool_schemas(self) -> list[dict[str, Any]]:
+        return self.converted
+
+
+def setup(registry: ToolRegistry, *agents: Agent) -> None:
+    async def run() -> None:
+        for agent in agents:
+            await registry.initialize(agent, Ctx())
+
+    asyncio.run(run())
+
+
+def test_later_agents_reuse_the_filtered_setup() -> None:
+    registry, first, second = ToolRegistry(), Agent(["agent_switch"]), Agent(["agent_switch"])
+    setup(registry, first, second)
+
+    assert first in SET_UP and second not in SET_UP and second._initialized
+    assert list(second._tool_map) == ["agent_switch"]
+    assert second.get_tool_schemas() == [{"name": "agent_switch"}]
+    assert registry.stats() == {"tool_sets": 1, "builds": 1, "hits": 1, "uncached": 0}
+
+    setup(registry, Agent(["user_switch"]))
+    assert registry.stats()["builds"] == 2
+
+
+def test_each_agent_gets_its_own_containers() -> None:
+    registry, first, second, third = ToolRegistry(), Agent(), Agent(), Agent()
+    setup(registry, first, second, third)
+
+    second._available_tools.pop()
+    second._tool_map.clear()
+    second._categorized_tools.generic.clear()
+    second.converted[0]["name"] = "renamed"
+    second.get_tool_schemas()[0]["name"] = "renamed"
+
+    assert len(third._available_tools) == 3 and len(third._tool_map) == 3
+    assert len(third._categorized_tools.generic) == 3
+    assert third.converted[0]["name"] == "agent_switch"
+    assert third.get_tool_schemas()[0]["name"] == "agent_switch"
+    # The tools themselves are still shared
+    assert third._available_tools[0] is second._available_tools[0]
@@ -0,0 +1,26 @@
+from types import SimpleNamespace
+
+from backend.appliances import ApplianceLayout
+from loop.tools import ToolPolicy
+
+
+def call(name: str) -> SimpleNamespace:
+    return SimpleNamespace(name=name)
+
+
+def test_appliance_switches_run_in_order_when_pipelined() -> None:
+    layout = ApplianceLayout.parse("2x2")
+    flips = [layout.switch_tool(0, 0), layout.switch_tool(1, 1), layout.switch_tool(1, 0)]
+    status = layout.status_tool(1)
+    # multi_turn_run(pipelined=True) runs unnamed tools in parallel
+    policy = ToolPolicy(default_mode="parallel")
+
+    assert all(policy.mode(name) == "sequential" for name in flips)
+    assert policy.mode(status) == "parallel"
+    groups = policy.groups([call(name) for name in [*flips, status, status]])
+    assert [[c.name for c in group] for group in groups] == [
+        [flips[0]],
+        [flips[1]],
+        [flips[2]],
+        [status, status],
+    ]
@@ -0,0 +1,57 @@
+import asyncio
+from pathlib import Path
+
+from loop.trace_writer import JSONLTraceWriter, load_episode, read_trace_records
+
+
+def write(path: Path, records: list[dict], close: bool = True) -> None:
+    async def run() -> None:
+        writer = JSONLTraceWriter(path, max_buffer=2)
+        for record in records:
+            await writer.write(record)
+        if close:
+            await writer.aclose()
+        else:
+            await writer.flush()
+
+    asyncio.run(run())
+
+
+RECORDS = [
+    {"type": "start", "episode": "a", "time": 1.5},
+    {"type": "turn", "episode": "a", "step": 0, "messages": ["m0"], "user_messages": ["u0"]},
+    {"type": "turn", "episode": "b", "step": 0, "messages": ["other"], "user_messages": []},
+    {"type": "turn", "episode": "a", "step": 1, "messages": ["m1"], "user_messages": ["u1"]},
+    {"type": "end", "episode": "a", "content": "done", "isError": False, "info": {}},
+]
+
+
+def test_gzip_jsonl_round_trip(tmp_path: Path) -> None:
+    path = tmp_path / "traces" / "worker-0.jsonl.gz"
+    write(path, RECORDS[:2])
+    # Reopening appends a second gzip member
+    write(path, RECORDS[2:])
+
+    assert list(read_trace_records(path)) == RECORDS
+    episode = load_episode(path, "a")
+    assert episode["messages"] == ["m0", "m1"] and episode["user_messages"] == ["u0", "u1"]
+    assert episode["end"]["content"] == "done"
+    assert load_episode(path, "a", until_step=0)["messages"] == ["m0"]
+
+
+def test_flushed_records_survive_a_missing_trailer(tmp_path: Path) -> None:
+    path = tmp_path / "worker-0.jsonl.gz"
+    write(path, RECORDS, close=False)
+    # Like a crashed worker: the gzip trailer is cut off
+    data = path.read_bytes()
+    path.write_bytes(data[:-3])
+
+    assert list(read_trace_records(path)) == RECORDS
+
+
+def test_plain_jsonl_drops_a_partial_last_line(tmp_path: Path) -> None:
+    path = tmp_path / "worker-0.jsonl"
+    write(path, RECORDS[:2])
+    with open(path, "a") as fp:
+        fp.write('{"type": "turn", "epis')
+    assert list(read_trace_records(path)) == RECORDS[:2]